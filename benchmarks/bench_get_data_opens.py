@@ -0,0 +1,113 @@
+"""Benchmark of the metadata files read by Request.get_data
+
+Create a synthetic experiment with a raw dataset and two chained processed
+datasets, and count the metadata files opened by each query. Each
+metadata file must be opened at most once per query.
+
+Usage (from the repository root):
+    python benchmarks/bench_get_data_opens.py [number_of_data]
+
+"""
+import os
+import sys
+import time
+import builtins
+import tempfile
+from collections import Counter
+from unittest import mock
+
+from bioimageit_core.api import Request
+from bioimageit_core.containers import Run, ProcessedData
+from bioimageit_core.containers.data_containers import RawData, Container
+from bioimageit_core.core.index import index_path
+from bioimageit_core.plugins.data_local import LocalMetadataService
+
+
+def create_experiment(request, destination, count):
+    experiment = request.create_experiment('bench', 'bench', '2021-01-01',
+                                           keys=['Population', 'ID'],
+                                           destination=destination)
+    raw_dataset = request.get_dataset(experiment, 'data')
+    data_dir = os.path.dirname(raw_dataset.md_uri)
+    raw_data_list = []
+    for i in range(count):
+        raw_data = RawData()
+        raw_data.uuid = str(i)
+        raw_data.name = f'population{i % 2 + 1}_{i:05d}.tif'
+        raw_data.author = 'bench'
+        raw_data.date = '2021-01-01'
+        raw_data.format = 'imagetiff'
+        raw_data.md_uri = os.path.join(data_dir, f'population{i % 2 + 1}_{i:05d}.md.json')
+        raw_data.uri = os.path.join(data_dir, raw_data.name)
+        raw_data.key_value_pairs = {'Population': f'population{i % 2 + 1}', 'ID': str(i)}
+        request.update_raw_data(raw_data)
+        raw_dataset.uris.append(Container(raw_data.md_uri, raw_data.uuid))
+        raw_data_list.append(raw_data)
+    request.update_dataset(raw_dataset)
+
+    parents = raw_data_list
+    for dataset_name in ['process1', 'process2']:
+        dataset = request.create_dataset(experiment, dataset_name)
+        run = Run()
+        run.set_process(name=dataset_name, uri=dataset_name)
+        request.create_run(dataset, run)
+        processed_list = []
+        for parent in parents:
+            processed_data = ProcessedData()
+            processed_data.set_info(name=parent.name.replace('.tif', '') + '_o',
+                                    author='bench', date='2021-01-01',
+                                    format_='imagetiff', url='')
+            processed_data.add_input(id_='i', data=parent)
+            processed_data.set_output(id_='o', label=dataset_name)
+            processed_list.append(request.create_data(dataset, run, processed_data))
+        parents = processed_list
+    return request.get_experiment(experiment.md_uri)
+
+
+def count_opens(function):
+    """Run function and count the metadata files opened"""
+    opens = Counter()
+    original_open = builtins.open
+
+    def counting_open(file, *args, **kwargs):
+        if isinstance(file, str) and file.endswith('.md.json'):
+            opens[os.path.abspath(file)] += 1
+        return original_open(file, *args, **kwargs)
+
+    with mock.patch('builtins.open', counting_open):
+        start = time.perf_counter()
+        result = function()
+        duration = time.perf_counter() - start
+    return result, opens, duration
+
+
+def run(count):
+    request = Request(os.path.join('tests', 'config.json'), debug=False, log=False)
+    request.connect(init_process=False, init_runner=False)
+    request.data_service = LocalMetadataService()
+    with tempfile.TemporaryDirectory() as destination:
+        experiment = create_experiment(request, destination, count)
+        queries = [('data', 'Population=population1', ''),
+                   ('data', 'ID<10', ''),
+                   ('process1', 'Population=population1', 'o'),
+                   ('process2', 'Population=population1', 'o')]
+        for with_index in [True, False]:
+            if not with_index:
+                os.remove(index_path(os.path.join(destination, 'bench', 'data')))
+                request.data_service = LocalMetadataService()
+            print('with index' if with_index else 'without index')
+            for dataset_name, query, output_name in queries:
+                dataset = request.get_dataset(experiment, dataset_name)
+                selected, opens, duration = count_opens(
+                    lambda: request.get_data(dataset, query, output_name))
+                max_opens = max(opens.values()) if opens else 0
+                print(f'  {dataset_name:>8} {query:<24}: {len(selected):>5} selected, '
+                      f'{sum(opens.values()):>6} opens, max {max_opens} per file, '
+                      f'{duration:.3f}s')
+
+
+if __name__ == '__main__':
+    count_ = 1000
+    if len(sys.argv) > 1:
+        count_ = int(sys.argv[1])
+    run(count_)
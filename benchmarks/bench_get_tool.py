@@ -0,0 +1,73 @@
+"""Benchmark of the LOCAL tools service get_tool
+
+Create synthetic tools XML wrappers and measure the latency of get_tool
+the first time a tool is read (cold: the XML and .shed.yml files are
+parsed) and the next times (warm: the tool is copied from the memory cache).
+
+Usage:
+    python benchmarks/bench_get_tool.py [number_of_tools]
+
+"""
+import os
+import sys
+import time
+import tempfile
+
+from bioimageit_core.plugins.tools_local import LocalToolsService
+
+TOOL_XML = """<tool id="{name}" name="{name}" version="1.0" type="sequential">
+    <description>Benchmark tool</description>
+    <requirements>
+        <container type="docker">bioimageit/{name}:1.0</container>
+    </requirements>
+    <command>{name} -i ${{i}} -o ${{o}}{params_command}</command>
+    <inputs>
+        <param name="i" type="data" format="imagetiff" label="Input image"/>
+{params}
+    </inputs>
+    <outputs>
+        <data name="o" format="imagetiff" label="Output image"/>
+    </outputs>
+    <help>Help of {name}</help>
+</tool>
+"""
+
+
+def create_tools(destination, count):
+    params = '\n'.join(f'        <param name="p{i}" type="float" value="{i}" label="Param {i}"/>'
+                       for i in range(20))
+    params_command = ''.join(f' -p{i} ${{p{i}}}' for i in range(20))
+    for i in range(count):
+        name = f'tool{i:04d}'
+        tool_dir = os.path.join(destination, name)
+        os.makedirs(tool_dir)
+        with open(os.path.join(tool_dir, f'{name}.xml'), 'w') as file:
+            file.write(TOOL_XML.format(name=name, params=params,
+                                       params_command=params_command))
+        with open(os.path.join(tool_dir, '.shed.yml'), 'w') as file:
+            file.write(f'name: {name}\nowner: bioimageit\ncategories:\n  - Denoising\n')
+
+
+def run(count):
+    with tempfile.TemporaryDirectory() as destination:
+        create_tools(destination, count)
+        service = LocalToolsService(tools_cache_size=count)
+        service.xml_dirs = [destination]
+        service._load_database()
+        names = sorted(service.database)
+
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            for name in names:
+                service.get_tool(name)
+            timings.append((time.perf_counter() - start) / len(names))
+        print(f'get_tool over {count} tools: cold {timings[0] * 1e6:.0f}us, '
+              f'warm {min(timings[1:]) * 1e6:.0f}us per call')
+
+
+if __name__ == '__main__':
+    count_ = 200
+    if len(sys.argv) > 1:
+        count_ = int(sys.argv[1])
+    run(count_)
@@ -0,0 +1,54 @@
+"""Benchmark of the LOCAL metadata service import_dir
+
+Create a directory of small files and compare the time needed to import
+them with import_dir to the time needed to only copy them.
+
+Usage:
+    python benchmarks/bench_import_dir.py [number_of_files]
+
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from bioimageit_core.plugins.data_local import LocalMetadataService
+
+
+def create_files(directory, count):
+    for i in range(count):
+        with open(os.path.join(directory, f'population{i % 2 + 1}_{i:05d}.txt'), 'w') as file:
+            file.write(str(i))
+
+
+def run(count):
+    with tempfile.TemporaryDirectory() as destination:
+        source = os.path.join(destination, 'source')
+        os.mkdir(source)
+        create_files(source, count)
+
+        copy_dir = os.path.join(destination, 'copy')
+        os.mkdir(copy_dir)
+        start = time.perf_counter()
+        for file in os.listdir(source):
+            shutil.copyfile(os.path.join(source, file), os.path.join(copy_dir, file))
+        copy_time = time.perf_counter() - start
+
+        service = LocalMetadataService()
+        experiment = service.create_experiment('bench', 'bench', '2021-01-01',
+                                               destination=destination)
+        start = time.perf_counter()
+        service.import_dir(experiment, source, r'\.txt$', 'bench', 'numbercsv', '2021-01-01')
+        import_time = time.perf_counter() - start
+
+        dataset = service.get_dataset(experiment.raw_dataset.url)
+        print(f'copy only: {copy_time:.3f}s, import_dir: {import_time:.3f}s '
+              f'({len(dataset.uris)} data imported)')
+
+
+if __name__ == '__main__':
+    count_ = 10000
+    if len(sys.argv) > 1:
+        count_ = int(sys.argv[1])
+    run(count_)
@@ -0,0 +1,78 @@
+"""Benchmark of the LOCAL metadata service cache
+
+Create a synthetic experiment with 10k raw data and run the same query
+(reading all the data, then reading again the selected data) with and
+without the metadata cache.
+
+Usage:
+    python benchmarks/bench_metadata_cache.py [number_of_data]
+
+"""
+import os
+import sys
+import time
+import tempfile
+
+from bioimageit_core.containers.data_containers import RawData, Container
+from bioimageit_core.core.query import SearchContainer, query_list_single
+from bioimageit_core.plugins.data_local import LocalMetadataService
+
+
+def create_experiment(service, destination, count):
+    experiment = service.create_experiment('bench', 'bench', '2021-01-01',
+                                           keys=['Population', 'ID'],
+                                           destination=destination)
+    raw_dataset = service.get_dataset(experiment.raw_dataset.url)
+    data_dir = os.path.dirname(raw_dataset.md_uri)
+    for i in range(count):
+        raw_data = RawData()
+        raw_data.uuid = str(i)
+        raw_data.name = f'population{i % 2 + 1}_{i:05d}.tif'
+        raw_data.author = 'bench'
+        raw_data.date = '2021-01-01'
+        raw_data.format = 'imagetiff'
+        raw_data.md_uri = os.path.join(data_dir, f'population{i % 2 + 1}_{i:05d}.md.json')
+        raw_data.uri = os.path.join(data_dir, raw_data.name)
+        raw_data.key_value_pairs = {'Population': f'population{i % 2 + 1}'}
+        service.update_raw_data(raw_data)
+        raw_dataset.uris.append(Container(raw_data.md_uri, raw_data.uuid))
+    service.update_dataset(raw_dataset)
+    return experiment
+
+
+def query(service, experiment, query_str):
+    """Query a raw dataset with two read passes"""
+    dataset = service.get_dataset(experiment.raw_dataset.url)
+    search_list = []
+    for data_info in dataset.uris:
+        raw_data = service.get_raw_data(data_info.md_uri)
+        info = SearchContainer()
+        info.data['name'] = raw_data.name
+        info.data['uri'] = raw_data.md_uri
+        info.data['key_value_pairs'] = raw_data.key_value_pairs
+        search_list.append(info)
+    selected = query_list_single(search_list, query_str)
+    return [service.get_raw_data(info.uri()) for info in selected]
+
+
+def run(count):
+    with tempfile.TemporaryDirectory() as destination:
+        experiment = create_experiment(LocalMetadataService(), destination, count)
+
+        for label, service in [('no cache', LocalMetadataService()),
+                               ('cache', LocalMetadataService(cache_size=4 * count))]:
+            timings = []
+            for _ in range(3):
+                start = time.perf_counter()
+                selected = query(service, experiment, 'Population=population1')
+                timings.append(time.perf_counter() - start)
+            print(f'{label:>10}: first query {timings[0]:.3f}s, '
+                  f'next queries {min(timings[1:]):.3f}s '
+                  f'({len(selected)} selected over {count})')
+
+
+if __name__ == '__main__':
+    count_ = 10000
+    if len(sys.argv) > 1:
+        count_ = int(sys.argv[1])
+    run(count_)
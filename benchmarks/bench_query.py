@@ -0,0 +1,60 @@
+"""Benchmark of the data queries
+
+Run the same queries on a list of 100k SearchContainer with the compiled
+query engine. The first timing includes the numeric conversion of the
+columns, the next ones reuse the columnar view (QueryTable).
+
+Usage:
+    python benchmarks/bench_query.py [number_of_data]
+
+"""
+import sys
+import time
+
+from bioimageit_core.core.query import SearchContainer, QueryTable, compile_query
+
+QUERIES = [
+    'Population=population1',
+    'number<=500',
+    'Population=population1 AND number>=100 AND number<2000',
+    '(Population=population1 OR Population=population3) AND NOT number<10',
+    'Population in (population1, population2) AND name=*_0001*',
+    'Population~^pop.*[12]$',
+]
+
+
+def create_search_list(count):
+    search_list = []
+    for i in range(count):
+        info = SearchContainer()
+        info.set_name(f'population{i % 4 + 1}_{i:06d}.tif')
+        info.set_uri(f'population{i % 4 + 1}_{i:06d}.md.json')
+        info.data['key_value_pairs'] = {'Population': f'population{i % 4 + 1}',
+                                        'number': str(i % 5000)}
+        search_list.append(info)
+    return search_list
+
+
+def run(count):
+    search_list = create_search_list(count)
+    for query_str in QUERIES:
+        start = time.perf_counter()
+        query = compile_query(query_str)
+        compile_time = time.perf_counter() - start
+
+        table = QueryTable(search_list)
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            selected = query.select(table)
+            timings.append(time.perf_counter() - start)
+        print(f'{query_str:>75}: compile {1000 * compile_time:.2f}ms, '
+              f'first {1000 * timings[0]:.1f}ms, next {1000 * min(timings[1:]):.1f}ms '
+              f'({len(selected)} selected over {count})')
+
+
+if __name__ == '__main__':
+    count_ = 100000
+    if len(sys.argv) > 1:
+        count_ = int(sys.argv[1])
+    run(count_)
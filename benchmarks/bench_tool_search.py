@@ -0,0 +1,58 @@
+"""Benchmark of the tools search index
+
+Index synthetic tools and measure the latency of the search queries typed
+in a GUI (prefix, complete word, typo, several words).
+
+Usage:
+    python benchmarks/bench_tool_search.py [number_of_tools]
+
+"""
+import sys
+import time
+import random
+
+from bioimageit_core.containers.tools_containers import ToolIndexContainer
+from bioimageit_core.core.tool_search import ToolSearchIndex
+
+WORDS = ['deconvolution', 'denoising', 'segmentation', 'threshold', 'tracking', 'spot',
+         'detection', 'filter', 'gaussian', 'median', 'wiener', 'registration', 'stack',
+         'projection', 'nuclei', 'cell', 'membrane', 'colocalization', 'measure', 'skeleton']
+CATEGORIES = ['Deconvolution', 'Denoising', 'Segmentation', 'Tracking', 'Detection']
+SYLLABLES = ['ba', 'co', 'di', 'fu', 'ga', 'li', 'mo', 'ne', 'pa', 'ri', 'so', 'tu', 'vi', 'xe']
+
+
+def create_tools(count):
+    random_ = random.Random(0)
+    # vocabulary of the descriptions: the known words and 500 random words
+    vocabulary = WORDS + [''.join(random_.choices(SYLLABLES, k=4)) for _ in range(500)]
+    tools = dict()
+    for i in range(count):
+        info = ToolIndexContainer()
+        words = random_.sample(WORDS, 3)
+        info.id = f'{words[0]}{words[1]}{i}'
+        info.name = f'{words[0]} {words[1]} {i}'
+        info.version = '1.0'
+        info.categories = [random_.choice(CATEGORIES)]
+        info.description = ' '.join(random_.sample(vocabulary, 12))
+        tools[f'{info.id}_v{info.version}'] = info
+    return tools
+
+
+def run(count):
+    tools = create_tools(count)
+    start = time.perf_counter()
+    index = ToolSearchIndex(tools)
+    print(f'index {count} tools: {(time.perf_counter() - start) * 1e3:.1f}ms')
+    for query in ['de', 'deconv', 'segmentation', 'segmentaton', 'nuclei thresh']:
+        start = time.perf_counter()
+        for _ in range(20):
+            results = index.search(query, limit=20)
+        duration = (time.perf_counter() - start) / 20
+        print(f'{query:>15}: {duration * 1e3:.3f}ms ({len(results)} results)')
+
+
+if __name__ == '__main__':
+    count_ = 5000
+    if len(sys.argv) > 1:
+        count_ = int(sys.argv[1])
+    run(count_)
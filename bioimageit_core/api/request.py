@@ -9,30 +9,38 @@ Request
 """
 
 import os
-import re
 import json
-import shlex
-from bioimageit_core.containers.pipeline_containers import Pipeline
+import queue
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from bioimageit_core.containers.pipeline_containers import (Pipeline, PipelinePlan,
+                                                            PipelineStepPlan)
 from prettytable import PrettyTable
 
-from bioimageit_formats import FormatsAccess, FormatKeyNotFoundError, FormatDatabaseError
+from bioimageit_formats import FormatsAccess, FormatDatabaseError
 
 from bioimageit_core.core.observer import Observable, Observer
 from bioimageit_core.core.config import ConfigAccess
 from bioimageit_core.core.utils import format_date
 from bioimageit_core.containers.data_containers import (METADATA_TYPE_RAW, ProcessedData,
                                                         Dataset, Run, ProcessedDataInputContainer)
-from bioimageit_core.containers.tools_containers import Tool
-from bioimageit_core.core.query import SearchContainer, query_list_single
+from bioimageit_core.containers.tools_containers import Tool, IO_PARAM
+from bioimageit_core.core.query import SearchContainer, compile_query
+from bioimageit_core.core.lineage import lineage_root, backfill_lineage
 from bioimageit_core.core.log_observer import LogObserver
+from bioimageit_core.core.result_cache import ResultCache
+from bioimageit_core.core.command import CommandTemplate
+from bioimageit_core.core.pipeline_graph import PipelineGraph
 
 from bioimageit_core.plugins.data_factory import metadataServices
 from bioimageit_core.containers.data_containers import Experiment
 from bioimageit_core.plugins.tools_factory import toolsServices
 from bioimageit_core.plugins.runners_factory import runnerServices
 from bioimageit_core.core.exceptions import (ConfigError, DataServiceError, DataQueryError,
-                                             ToolsServiceError, ToolNotFoundError, RunnerExecError)
-from bioimageit_core.containers.runners_containers import Job                                             
+                                             ToolsServiceError, ToolNotFoundError, RunnerExecError,
+                                             PipelineError)
+from bioimageit_core.containers.runners_containers import Job, JobSummary                                             
 
 
 class APIAccess:
@@ -77,6 +85,9 @@ class Request(Observable):
         self.data_service = None
         self.tools_service = None
         self.runner_service = None
+        self.result_cache = None
+        # the experiment metadata are modified by one thread at a time
+        self._experiment_lock = threading.RLock()
 
         # load configuration
         self.config_file = config_file
@@ -140,6 +151,10 @@ class Request(Observable):
                 except ToolsServiceError as err:   
                     self.notify_error(str(err)) 
                     return
+                for fullname, uris in getattr(self.tools_service, 'conflicts', {}).items():
+                    self.notify_warning(f'The tool {fullname} is declared in several files, '
+                                        f'{uris[0]} is used and {", ".join(uris[1:])} '
+                                        f'ignored')
             else:
                 self.notify_error('The process service is not set in the configuration file')
                 return
@@ -161,6 +176,19 @@ class Request(Observable):
                 self.notify_error('The runner service is not set in the configuration file')
                 return
 
+        # result cache
+        if 'cache' in config and config['cache'].get('enabled', True):
+            conf = config['cache']
+            if 'dir' not in conf:
+                self.notify_error('The cache directory (dir) is not set in the configuration file')
+                return
+            try:
+                self.result_cache = ResultCache(conf['dir'], conf.get('max_size', 0),
+                                                conf.get('mode', 'copy'))
+            except ConfigError as err:
+                self.notify_error(str(err))
+                return
+
     def create_experiment(self, name, author='', date='now', keys=None, destination=''):
         """Create a new experiment
 
@@ -307,8 +335,10 @@ class Request(Observable):
 
         """
         try:
-            return self.data_service.import_data(experiment, data_path, name, author,
+            data = self.data_service.import_data(experiment, data_path, name, author,
                                                  format_, format_date(date), key_value_pairs)
+            self._compact_dataset(experiment.raw_dataset.url)
+            return data
         except DataServiceError as err:
             self.notify_error(str(err))
         except ValueError as err:
@@ -345,8 +375,10 @@ class Request(Observable):
         try:
             if author == '':
                 author = ConfigAccess.instance().config['user']['name']
-            return self.data_service.import_dir(experiment, dir_uri, filter_, author,
-                                                format_, format_date(date), directory_tag_key)
+            self.data_service.import_dir(experiment, dir_uri, filter_, author,
+                                         format_, format_date(date), directory_tag_key,
+                                         observers=self._observers)
+            self._compact_dataset(experiment.raw_dataset.url)
         except DataServiceError as err:
             self.notify_error(str(err))
         except ValueError as err:
@@ -368,13 +400,14 @@ class Request(Observable):
         experiment.set_key(key)
         self.update_experiment(experiment)
         _raw_dataset = self.get_raw_dataset(experiment)
-        for uri in _raw_dataset.uris:
-            _raw_data = self.get_raw_data(uri.md_uri)
-            for value in values:
-                if value in _raw_data.name:
-                    _raw_data.set_key_value_pair(key, value)
-                    self.update_raw_data(_raw_data)
-                    break
+        with self._metadata_batch():
+            for uri in _raw_dataset.uris:
+                _raw_data = self.get_raw_data(uri.md_uri)
+                for value in values:
+                    if value in _raw_data.name:
+                        _raw_data.set_key_value_pair(key, value)
+                        self.update_raw_data(_raw_data)
+                        break
 
     def annotate_using_separator(self, experiment, key, separator, value_position):
         """Annotate an experiment raw data files using file name and separator
@@ -394,15 +427,49 @@ class Request(Observable):
         experiment.set_key(key)
         self.update_experiment(experiment)
         _raw_dataset = self.get_raw_dataset(experiment)
-        for uri in _raw_dataset.uris:
-            _raw_data = self.get_raw_data(uri.md_uri)
-            basename = os.path.splitext(_raw_data.name)[0] #os.path.splitext(os.path.basename(_raw_data.uri))[0]
-            split_name = basename.split(separator)
-            value = ''
-            if len(split_name) > value_position:
-                value = split_name[value_position]
-            _raw_data.set_key_value_pair(key, value)
-            self.update_raw_data(_raw_data)
+        with self._metadata_batch():
+            for uri in _raw_dataset.uris:
+                _raw_data = self.get_raw_data(uri.md_uri)
+                basename = os.path.splitext(_raw_data.name)[0] #os.path.splitext(os.path.basename(_raw_data.uri))[0]
+                split_name = basename.split(separator)
+                value = ''
+                if len(split_name) > value_position:
+                    value = split_name[value_position]
+                _raw_data.set_key_value_pair(key, value)
+                self.update_raw_data(_raw_data)
+
+    def _metadata_batch(self):
+        """Context manager to group many metadata updates
+
+        The metadata services that maintain datasets indexes write them once
+        at the end of the block
+
+        """
+        if hasattr(self.data_service, 'batch'):
+            return self.data_service.batch()
+        return contextlib.nullcontext()
+
+    def rebuild_index(self, experiment):
+        """Create the key-value index of the raw dataset of an experiment
+
+        The index is maintained for new experiments. Use this method for
+        experiments created before the index, or if the metadata files were
+        modified outside of BioImageIT
+
+        Parameters
+        ----------
+        experiment: Experiment
+            Container of the experiment metadata
+
+        """
+        if not hasattr(self.data_service, 'rebuild_index'):
+            self.notify_warning('The metadata service does not support indexes')
+            return
+        try:
+            raw_dataset = self.get_raw_dataset(experiment)
+            self.data_service.rebuild_index(raw_dataset)
+        except DataServiceError as err:
+            self.notify_error(str(err))
 
     def get_raw_data(self, uri):
         """Read a raw data from the database
@@ -541,7 +608,7 @@ class Request(Observable):
                 return self.get_processed_data(processed_data.inputs[0].uri)
         return None
 
-    def get_origin(self, processed_data):
+    def get_origin(self, processed_data, parents=None):
         """Get the first metadata of the parent data.
 
         The origin data is a RawData. It is the first data that have
@@ -551,18 +618,31 @@ class Request(Observable):
         ----------
         processed_data: ProcessedData
             Container of the processed data URI
+        parents: dict
+            Parents already read {md_uri: data}. The parents read by this
+            method are added to it, so that data sharing parents read them
+            once
 
         Returns
         -------
         the origin data in a RawData object
 
         """
+        if processed_data is not None and processed_data.root is not None:
+            return self.get_raw_data(processed_data.root.uri)
         if processed_data is not None and len(processed_data.inputs) > 0:
-            if processed_data.inputs[0].type == METADATA_TYPE_RAW:
-                return self.get_raw_data(processed_data.inputs[0].uri)
+            parent_uri = processed_data.inputs[0].uri
+            if parents is not None and parent_uri in parents:
+                parent = parents[parent_uri]
+            elif processed_data.inputs[0].type == METADATA_TYPE_RAW:
+                parent = self.get_raw_data(parent_uri)
             else:
-                return self.get_origin(
-                           self.get_processed_data(processed_data.inputs[0].uri))
+                parent = self.get_processed_data(parent_uri)
+            if parents is not None:
+                parents[parent_uri] = parent
+            if processed_data.inputs[0].type == METADATA_TYPE_RAW:
+                return parent
+            return self.get_origin(parent, parents)
 
     def is_dataset(self, experiment, name):
         """Check if a dataset exists
@@ -658,51 +738,67 @@ class Request(Observable):
         if len(dataset.uris) < 1:
             return list()
 
-        # search the dataset
-        queries = re.split(' AND ', query)
+        # parse the query before reading the data
+        try:
+            compiled_query = compile_query(query)
+        except DataQueryError as err:
+            self.notify_error(str(err))
+            return []
+
+        # use the dataset index to open only the selected data
+        if dataset.name == 'data' and query != '' and \
+                hasattr(self.data_service, 'query_dataset'):
+            selected_uris = self.data_service.query_dataset(dataset, compiled_query)
+            if selected_uris is not None:
+                return [self.get_raw_data(uri) for uri in selected_uris]
 
-        # initially all the raw data are selected
-        #  first_data = self.get_raw_data(dataset.uris[0].md_uri)
+        # read each data once and keep the containers with the search view
+        containers = dict()
         selected_list = []
         # raw dataset
         if dataset.name == 'data':
             for data_info in dataset.uris:
-                data_container = self.get_raw_data(data_info.md_uri)
-                selected_list.append(self._raw_data_to_search_container(
-                    data_container))
+                data_container = containers.get(data_info.md_uri)
+                if data_container is None:
+                    data_container = self.get_raw_data(data_info.md_uri)
+                    containers[data_info.md_uri] = data_container
+                search_container = self._raw_data_to_search_container(data_container)
+                containers[search_container.uri()] = data_container
+                selected_list.append(search_container)
         # processed dataset
         else:
-            pre_list = []
+            parents = dict()
             for data_info in dataset.uris:
-                p_con = self.get_processed_data(data_info.md_uri)
-                pre_list.append(self._processed_data_to_search_container(p_con))
-
-            # remove the data where output origin is not the asked one
-            if origin_output_name != '':
-                for p_data in pre_list:
-                    data = self.get_processed_data(p_data.uri())
-                    if data.output["name"] == origin_output_name:
-                        selected_list.append(p_data)
-            else:
-                selected_list = pre_list
-
-        # run all the AND queries on the preselected dataset
+                p_con = containers.get(data_info.md_uri)
+                if p_con is None:
+                    p_con = self.get_processed_data(data_info.md_uri)
+                    containers[data_info.md_uri] = p_con
+                # remove the data where output origin is not the asked one
+                if origin_output_name != '' and p_con.output["name"] != origin_output_name:
+                    continue
+                search_container = self._processed_data_to_search_container(p_con, parents)
+                containers[search_container.uri()] = p_con
+                selected_list.append(search_container)
+
+        # run the query on the preselected dataset
         if query != '':
-            for q in queries:
-                try:
-                    selected_list = query_list_single(selected_list, q)
-                except DataQueryError as err:
-                    self.notify_error(str(err))
-                    return []
+            selected_list = compiled_query.select(selected_list)
+        return [containers[d.uri()] for d in selected_list]
 
-        # convert SearchContainer list to uri list
-        out = []
-        for d in selected_list:
-            if dataset.name == 'data':
-                out.append(self.get_raw_data(d.uri()))
-            else:
-                out.append(self.get_processed_data(d.uri()))
-        return out
+    def _compact_dataset(self, md_uri):
+        """Merge the journal of a dataset into the dataset metadata
+
+        Only the metadata services that journal the dataset updates
+        implement compact_dataset
+
+        Parameters
+        ----------
+        md_uri: str
+            URI of the dataset
+
+        """
+        if hasattr(self.data_service, 'compact_dataset'):
+            self.data_service.compact_dataset(md_uri)
 
     def create_dataset(self, experiment, dataset_name):
         """Create a processed dataset in an experiment
@@ -720,7 +816,8 @@ class Request(Observable):
 
         """
         try:
-            return self.data_service.create_dataset(experiment, dataset_name)
+            with self._experiment_lock:
+                return self.data_service.create_dataset(experiment, dataset_name)
         except DataServiceError as err:
             self.notify_error(str(err))
 
@@ -797,20 +894,30 @@ class Request(Observable):
         info.data['key_value_pairs'] = raw_data.key_value_pairs
         return info
 
-    def _processed_data_to_search_container(self, processed_data):
+    def _processed_data_to_search_container(self, processed_data, parents=None):
         """convert a ProcessedData to SearchContainer
 
         Parameters
         ----------
         processed_data: ProcessedData
             Object containing the processed_data
+        parents: dict
+            Parents already read {md_uri: data} (see get_origin)
 
         Returns
         -------
         SearchContainer object
 
         """
-        origin = self.get_origin(processed_data)
+        if processed_data.root is not None:
+            # snapshot of the origin: no need to read the processing chain
+            container = SearchContainer()
+            container.data['key_value_pairs'] = dict(processed_data.root.key_value_pairs)
+            container.data['name'] = processed_data.name
+            container.data['uri'] = processed_data.md_uri
+            container.data['uuid'] = processed_data.uuid
+            return container
+        origin = self.get_origin(processed_data, parents)
         if origin is not None:
             container = self._raw_data_to_search_container(origin)
         else:
@@ -877,8 +984,32 @@ class Request(Observable):
         ProcessedData object with the metadata and the new created md_uri
 
         """
+        if processed_data.root is None:
+            processed_data.root = lineage_root(self.data_service, processed_data)
         return self.data_service.create_data(dataset, run, processed_data)
 
+    def backfill_lineage(self, experiment):
+        """Record the origin raw data in the processed data of an experiment
+
+        The processed data created by this version store a snapshot of their
+        origin raw data. Use this method to add it to the processed data of
+        an experiment created with an older version
+
+        Parameters
+        ----------
+        experiment: Experiment
+            Container of the experiment metadata
+
+        Returns
+        -------
+        The number of processed data updated
+
+        """
+        try:
+            return backfill_lineage(self.data_service, experiment)
+        except DataServiceError as err:
+            self.notify_error(str(err))
+
     def search_tool(self, keyword: str = '', print_=False):
         """Search a tool using a keyword in the database
 
@@ -974,6 +1105,39 @@ class Request(Observable):
         except ToolNotFoundError as err:
             self.notify_error(str(err))
 
+    def provision_runner(self, max_workers: int = 4) -> dict:
+        """Install the environments of all the tools of the database ahead of time
+
+        Only the runners that install the tools environments (ex: CONDA)
+        implement the provisioning
+
+        Parameters
+        ----------
+        max_workers: int
+            Number of environments installed at the same time
+
+        Returns
+        -------
+        dict {environment name: error message, empty if the environment is
+        ready}
+
+        """
+        if not hasattr(self.runner_service, 'provision'):
+            self.notify_warning(f'The runner {self.runner_service.service_name} '
+                                f'does not install the tools environments')
+            return dict()
+        tools = []
+        for fullname in self.tools_service.get_processes_database():
+            try:
+                tools.append(self.tools_service.get_tool(fullname))
+            except (ToolsServiceError, ToolNotFoundError) as err:
+                self.notify_warning(str(err))
+        results = self.runner_service.provision(tools, max_workers)
+        for env_name, message in results.items():
+            if message != '':
+                self.notify_warning(f'{env_name}: {message}')
+        return results
+
     def get_categories(self, parent: str) -> list:
         """Get a list of categories for a given parent category
 
@@ -1057,23 +1221,15 @@ class Request(Observable):
             for output_arg in tool.outputs:
                 if output_arg.name == key:
                     output_arg.value = parameters[key]
-        # 2.2.1. build the command line
-        cmd = tool.command
+        # 2.2. build the command line
+        values = dict()
         for input_arg in tool.inputs:
-            cmd = cmd.replace("${" + input_arg.name + "}",
-                              "'" + str(input_arg.value) + "'")
-            input_arg_name_simple = input_arg.name.replace("-", "")
-            cmd = cmd.replace("${" + input_arg_name_simple + "}",
-                              "'" + str(input_arg.value) + "'")
+            values[input_arg.name] = input_arg.value
+            values[input_arg.name.replace("-", "")] = input_arg.value
         for output_arg in tool.outputs:
-            cmd = cmd.replace("${" + output_arg.name + "}",
-                              "'" + str(output_arg.value) + "'")
-        # 2.2.2. replace the command variables
-        cmd = self._replace_env_variables(tool, cmd)
-        cmd = cmd.replace('/', os.sep)
-        # 2.3. exec
-        args = shlex.split(cmd)
-        return args
+            values[output_arg.name] = output_arg.value
+        command = self._compile_command(tool, values)
+        return command.render(values)
 
     def exec(self, tool, **kwargs):
         """Process one data from it uri
@@ -1091,7 +1247,11 @@ class Request(Observable):
             Ex: {"i": "image.tif", "o": result.tif, "threshold": 128}
 
         """
-        args = self._prepare_command(tool, kwargs)
+        try:
+            args = self._prepare_command(tool, kwargs)
+        except RunnerExecError as err:
+            self.notify_error(str(err))
+            return
         job_id = self.new_job()
         self.notify(f'Start job{job_id}')
         try:
@@ -1103,18 +1263,61 @@ class Request(Observable):
         self.notify(f'Finished job{job_id}')
 
     @staticmethod
-    def _replace_env_variables(tool, cmd) -> str:
-        xml_root_path = os.path.dirname(os.path.abspath(tool.uri))
-        cmd_out = cmd.replace("$__tool_directory__", xml_root_path)
-        if 'fiji' in ConfigAccess.instance().config:
-            cmd_out = cmd_out.replace("$__fiji__", ConfigAccess.instance().config['fiji'])
+    def _command_constants(tool, names) -> dict:
+        """Get the values of the variables of a tool command from the configuration
+
+        Parameters
+        ----------
+        tool: Tool
+            Information of the tool
+        names:
+            Names of the placeholders filled by the job. The env variables
+            with the same names are not used
+
+        Returns
+        -------
+        dict {text to replace in the command: value}
+
+        """
         config = ConfigAccess.instance()
+        constants = {'$__tool_directory__': os.path.dirname(os.path.abspath(tool.uri))}
+        if 'fiji' in config.config:
+            constants['$__fiji__'] = config.config['fiji']
         if config.is_key('env'):
             for element in config.get('env'):
-                cmd_out = cmd_out.replace(
-                    "${" + element["name"] + "}", element["value"]
-                )
-        return cmd_out
+                if element['name'] not in names:
+                    constants['${' + element['name'] + '}'] = element['value']
+        return constants
+
+    def _compile_command(self, tool, values: dict, job_id: int = 0) -> CommandTemplate:
+        """Compile the command of a tool for a job
+
+        The configuration variables are substituted and the values known for
+        all the data of the job are bound. A warning is sent if the command
+        uses a placeholder that is neither a variable nor a job value
+
+        Parameters
+        ----------
+        tool: Tool
+            Information of the tool
+        values: dict
+            Values of the placeholders known for the whole job {name: value}.
+            The names with a None value are placeholders filled for each data
+        job_id: int
+            ID of the job
+
+        Returns
+        -------
+        The CommandTemplate to render for each data
+
+        """
+        command = CommandTemplate(tool.command, self._command_constants(tool, values))
+        unknown = sorted(command.slots - set(values))
+        if unknown:
+            self.notify_warning(f'The command of the tool {tool.fullname()} uses the unknown '
+                                f'variables: {", ".join(unknown)}', job_id)
+        return command.bind({name: value for name, value in values.items()
+                             if value is not None})
 
     def download_data(self, md_uri):
         """Download the data in a tmp file if remote database
@@ -1152,7 +1355,8 @@ class Request(Observable):
         Parameters
         ----------
         job: Job
-            Container of the job information
+            Container of the job information. The summary of the execution
+            (data processed and errors) is set to job.summary
 
         """
         if job.tool.type == "merge":
@@ -1185,48 +1389,413 @@ class Request(Observable):
                     )
         return [input_data, data_count]
 
-    def _run_job_sequence(self, job):
+    def _run_job_sequence(self, job, input_stream=None, on_output=None):
         """Run the process in a sequence
 
         This is the main function that run the process on the experiment data. The sequence means
         that all the queried data are processed independently with the same tool and the same
         parameters.
 
+        The data are processed by a pool of job.max_workers threads (see
+        _job_max_workers). A data that fails, whatever the error, is reported
+        in the job summary and does not stop the processing of the other data.
+
         Parameters
         ----------
         job: Job
             Container of the job information
+        input_stream: iterable
+            Data of the first input, processed as soon as they are produced.
+            The job inputs are queried if None (the job must have only one
+            input when a stream is used)
+        on_output: callable
+            Function called with each ProcessedData created by the job
+
+        Returns
+        -------
+        The JobSummary of the execution
+
         """
         # 1- Query all the input data and verify that the size are equal, if not return an error
-        input_data, data_count = self._query_inputs(job)
+        if input_stream is None:
+            input_data, data_count = self._query_inputs(job)
+        else:
+            input_data, data_count = {0: []}, 0
+
+        # 2- Create the ProcessedDataSet and 3- the run metadata, or get
+        # them from a previous execution when the job is resumed
+        processed_dataset, run, completed_items = self._job_dataset_and_run(job)
+        if completed_items and input_stream is None:
+            # remove the outputs of the data no longer in the inputs
+            current_items = set(self._item_uuids(input_data, i) for i in range(data_count))
+            stale_items = [key for key in completed_items if key not in current_items]
+            if stale_items:
+                self._remove_dataset_data(processed_dataset,
+                                          [uri for key in stale_items
+                                           for uri in completed_items.pop(key)])
+                self.notify(f'{len(stale_items)} data removed from the dataset '
+                            f'{processed_dataset.name}')
+
+        # 4- loop over the input data to run processing
+        job_id = self.new_job()
+        self.notify(f'Start job{job_id}')
+        command = self._job_command(job, job_id)
+        self.runner_service.set_up(job.tool, job_id)
+        summary = JobSummary(job_id, data_count)
+        job.summary = summary
+        # metadata are read and written by one thread at a time
+        metadata_lock = threading.RLock()
+
+        def process_item(i):
+            name = input_data[0][i].name
+            if self._item_uuids(input_data, i) in completed_items:
+                with metadata_lock:
+                    summary.add_skipped(name)
+                return
+            try:
+                outputs = self._run_job_item(job, input_data, i, processed_dataset, run,
+                                             job_id, metadata_lock, command)
+            except Exception as err:
+                # an unexpected error of a runner or a tool must not stop the job
+                with metadata_lock:
+                    summary.add_failure(name, str(err))
+                self.notify_error(f'{name}: {err}', job_id)
+                return
+            with metadata_lock:
+                summary.add_success(name)
+            if on_output is not None:
+                for processed_data in outputs:
+                    on_output(processed_data)
+
+        def process_batch(indexes):
+            names = {i: input_data[0][i].name for i in indexes}
+            to_run = []
+            for i in indexes:
+                if self._item_uuids(input_data, i) in completed_items:
+                    with metadata_lock:
+                        summary.add_skipped(names[i])
+                else:
+                    to_run.append(i)
+            if not to_run:
+                return
+            try:
+                results = self._run_job_items_batch(job, input_data, to_run, processed_dataset,
+                                                    run, job_id, metadata_lock, command)
+            except Exception as err:
+                results = {i: err for i in to_run}
+            for i in to_run:
+                if isinstance(results[i], Exception):
+                    with metadata_lock:
+                        summary.add_failure(names[i], str(results[i]))
+                    self.notify_error(f'{names[i]}: {results[i]}', job_id)
+                    continue
+                with metadata_lock:
+                    summary.add_success(names[i])
+                if on_output is not None:
+                    for processed_data in results[i]:
+                        on_output(processed_data)
+
+        def items():
+            if input_stream is None:
+                yield from range(data_count)
+                return
+            for data in input_stream:
+                with metadata_lock:
+                    input_data[0].append(data)
+                    summary.data_count += 1
+                    index = len(input_data[0]) - 1
+                yield index
+
+        def batches(batch_size):
+            batch = []
+            for i in items():
+                batch.append(i)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        max_workers = self._job_max_workers(job)
+        batch_size = self._job_batch_size(job)
+        process, tasks = process_item, items()
+        if batch_size > 1:
+            process, tasks = process_batch, batches(batch_size)
+        try:
+            if max_workers == 1 or (input_stream is None and data_count < 2):
+                for task in tasks:
+                    process(task)
+            else:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    list(executor.map(process, tasks))
+        finally:
+            # the journal of the data already processed is merged even if the
+            # job is interrupted
+            self._compact_dataset(processed_dataset.md_uri)
+            self.runner_service.tear_down(job.tool, job_id)
+
+        # 5- notify observers
+        if self.result_cache is not None:
+            self.notify(f'Result cache: {summary.cache_hits} hits, '
+                        f'{summary.cache_misses} misses', job_id)
+        if not summary.is_success():
+            self.notify_warning(str(summary), job_id)
+        self.notify_progress(100, 'done', job_id)
+        self.notify(f'Finished job{job_id}')
+        return summary
+
+    def _job_dataset_and_run(self, job):
+        """Get the output dataset and the run metadata of a sequence job
+
+        A new dataset and a new run are created, unless the job is resumed
+        and its output dataset exists. In that case the last run of the
+        dataset with the same tool, inputs and parameters is continued.
+
+        Parameters
+        ----------
+        job: Job
+            Container of the job information
+
+        Returns
+        -------
+        list [processed dataset, run, dict of the items already processed
+        {tuple of the inputs uuids: list of the outputs URIs}]
+
+        """
+        run = self._job_run_info(job)
+        if job.resume and self.is_dataset(job.experiment, job.output_dataset_name):
+            processed_dataset = self.get_dataset(job.experiment, job.output_dataset_name)
+            if hasattr(self.data_service, 'get_run_items'):
+                previous_run = self._find_run(processed_dataset, run)
+                if previous_run is not None:
+                    return [processed_dataset, previous_run,
+                            self.data_service.get_run_items(previous_run)]
+                # the data of the dataset were created by another tool or parameters
+                self._remove_dataset_data(processed_dataset,
+                                          [info.md_uri for info in processed_dataset.uris])
+            else:
+                self.notify_warning(f'The metadata service {self.data_service.service_name} '
+                                    f'cannot resume a job')
+            return [processed_dataset, self.create_run(processed_dataset, run), dict()]
 
-        # 2- Create the ProcessedDataSet
         processed_dataset = self.create_dataset(job.experiment, job.output_dataset_name)
+        return [processed_dataset, self.create_run(processed_dataset, run), dict()]
 
-        # 3- Create run metadata
+    @staticmethod
+    def _job_run_info(job):
+        """Create the run metadata of a job (without URI)"""
         run = Run()
         run.process_name = job.tool.fullname()
         run.process_uri = job.tool.uri
-        for t, input_ in enumerate(job.inputs.inputs):
+        for input_ in job.inputs.inputs:
             run.add_input(input_.name, input_.dataset,
                           input_.query, input_.origin_output_name)
         for key, value in job.parameters.items():
             run.add_parameter(key, value)
-        run = self.create_run(processed_dataset, run)  # save to database
+        return run
 
-        # 4- loop over the input data to run processing
-        job_id = self.new_job()
-        self.notify(f'Start job{job_id}')
-        self.runner_service.set_up(job.tool, job_id)
-        for i in range(data_count):
-            cmd = job.tool.command
+    def _find_run(self, dataset, run):
+        """Get the last run of a dataset with the same tool, inputs and parameters as run
+
+        Returns
+        -------
+        The Run or None if not found
+
+        """
+        try:
+            previous_runs = self.data_service.get_dataset_runs(dataset)
+        except (DataServiceError, KeyError):
+            previous_runs = []
+        for previous_run in reversed(previous_runs):
+            if self._is_same_run(previous_run, run):
+                return previous_run
+        return None
+
+    @staticmethod
+    def _item_uuids(input_data, i):
+        """Get the tuple of the UUIDs of the input data of the i-th item of a job"""
+        return tuple(input_data[n][i].uuid for n in range(len(input_data)))
+
+    def _remove_dataset_data(self, dataset, md_uris):
+        """Remove data from a dataset
+
+        The metadata and data files are kept, only the dataset content is
+        modified
+
+        Parameters
+        ----------
+        dataset: Dataset
+            Container of the dataset. Its list of data is updated
+        md_uris: list
+            URIs of the metadata of the data to remove
+
+        """
+        removed = set(os.path.normpath(uri) for uri in md_uris)
+        if not removed:
+            return
+        current = self.data_service.get_dataset(dataset.md_uri)
+        dataset.uris = [info for info in current.uris
+                        if os.path.normpath(info.md_uri) not in removed]
+        self.data_service.update_dataset(dataset)
+
+    @staticmethod
+    def _is_same_run(run1, run2):
+        """Check if two runs have the same tool, inputs and parameters"""
+        def inputs(run):
+            return [(input_.name, input_.dataset, input_.query, input_.origin_output_name)
+                    for input_ in run.inputs]
+
+        def parameters(run):
+            return {parameter.name: str(parameter.value) for parameter in run.parameters}
+
+        return os.path.normpath(run1.process_uri) == os.path.normpath(run2.process_uri) \
+            and inputs(run1) == inputs(run2) and parameters(run1) == parameters(run2)
+
+    @staticmethod
+    def _resolved_parameters(job):
+        """Get the values of all the parameters of a job tool
+
+        Returns
+        -------
+        dict {parameter name: value} with the job parameters and the default
+        value of the other tool parameters
+
+        """
+        parameters = {param.name: param.default_value for param in job.tool.inputs
+                      if param.io == IO_PARAM}
+        for key, value in job.parameters.items():
+            parameters[key] = str(value)
+        return parameters
+
+    def _job_command(self, job, job_id: int = 0) -> CommandTemplate:
+        """Compile the command of a job tool, with the job parameters bound
+
+        The inputs and outputs placeholders are filled for each data
+
+        """
+        values = {input_.name: None for input_ in job.inputs.inputs}
+        values.update({output.name: None for output in job.tool.outputs})
+        values.update(self._resolved_parameters(job))
+        return self._compile_command(job.tool, values, job_id)
+
+    @staticmethod
+    def _job_max_workers(job):
+        """Number of data of a job processed in parallel"""
+        if job.max_workers > 0:
+            return job.max_workers
+        runner_config = ConfigAccess.instance().config.get('runner', {})
+        if 'max_workers' in runner_config:
+            return max(1, int(runner_config['max_workers']))
+        return 1
+
+    def _job_batch_size(self, job):
+        """Number of data of a job sent together to the runner
+
+        The batch_size of the runner configuration is used only if the
+        runner implements exec_batch
+
+        """
+        if not hasattr(self.runner_service, 'exec_batch'):
+            return 1
+        runner_config = ConfigAccess.instance().config.get('runner', {})
+        return max(1, int(runner_config.get('batch_size', 1)))
+
+    def _run_job_item(self, job, input_data, i, processed_dataset, run, job_id,
+                      metadata_lock, command):
+        """Process one data of a sequence job
+
+        The metadata are read and written while holding metadata_lock, the
+        tool is executed without it so that many data are processed at the
+        same time
+
+        Returns
+        -------
+        The list of the ProcessedData created
+
+        """
+        item = self._prepare_job_item(job, input_data, i, processed_dataset, run, job_id,
+                                      metadata_lock, command)
+        try:
+            # 4.2- exec, or copy the outputs from the result cache
+            if not self._job_item_from_cache(job, item, job_id, metadata_lock):
+                self.runner_service.exec(job.tool, item['args'], job_id)
+                self._job_item_to_cache(job, item, metadata_lock)
+            # 4.3- create the output data
+            return self._finish_job_item(job, input_data, i, processed_dataset, run, item,
+                                         metadata_lock)
+        finally:
+            self._clean_job_item(item)
+
+    def _run_job_items_batch(self, job, input_data, indexes, processed_dataset, run, job_id,
+                             metadata_lock, command):
+        """Process several data of a sequence job with one call to the runner
+
+        The runner must implement exec_batch
+
+        Returns
+        -------
+        dict {data index: list of the ProcessedData created, or the
+        exception raised for this data}
+
+        """
+        results = dict()
+        items = dict()
+        try:
+            for i in indexes:
+                try:
+                    item = self._prepare_job_item(job, input_data, i, processed_dataset, run,
+                                                  job_id, metadata_lock, command)
+                except Exception as err:
+                    results[i] = err
+                    continue
+                items[i] = item
+                if self._job_item_from_cache(job, item, job_id, metadata_lock):
+                    results[i] = None
+            to_run = [i for i in items if i not in results]
+            if to_run:
+                errors = self.runner_service.exec_batch(
+                    job.tool, [items[i]['args'] for i in to_run], job_id)
+                for i, error in zip(to_run, errors):
+                    results[i] = error
+                    if error is None:
+                        self._job_item_to_cache(job, items[i], metadata_lock)
+            for i, item in items.items():
+                if results[i] is not None:
+                    continue
+                try:
+                    results[i] = self._finish_job_item(job, input_data, i, processed_dataset,
+                                                       run, item, metadata_lock)
+                except Exception as err:
+                    results[i] = err
+        finally:
+            for item in items.values():
+                self._clean_job_item(item)
+        return results
+
+    def _prepare_job_item(self, job, input_data, i, processed_dataset, run, job_id,
+                          metadata_lock, command):
+        """Create the command and the output metadata of one data of a job
+
+        The command arguments are rendered from the job CommandTemplate
+
+        Returns
+        -------
+        dict with the command arguments (args), the ProcessedData to create
+        (processed_data_list), the output files (outputs), the result cache
+        key (cache_key) and the files to remove after the processing
+        (local_files)
+
+        """
+        values = dict()
+        with metadata_lock:
             data_info_zero = self.get_raw_data(input_data[0][i].md_uri)
             # 4.0- notify observers
-            self.notify_progress(int(100 * i / data_count),
+            self.notify_progress(int(100 * job.summary.finished_count() / job.summary.data_count),
                                  f"Process {data_info_zero.name}", job_id)
             # 4.1- Parse IO
             # get the input arguments
             inputs_metadata = {}
+            inputs_files = []
             local_files = []
             for n, input_ in enumerate(job.inputs.inputs):
                 # input data can be a processedData but we only read the common metadata
@@ -1235,11 +1804,9 @@ class Request(Observable):
                 # data_info.uri
                 self.data_service.download_data(data_info.md_uri, data_uri)
                 local_files.append(data_uri)
-                cmd = cmd.replace("${" + input_.name + "}", data_uri)
+                inputs_files.append(data_uri)
+                values[input_.name] = data_uri
                 inputs_metadata[input_.name] = data_info
-            # get the params arguments
-            for key, value in job.parameters.items():
-                cmd = cmd.replace("${" + key + "}", str(value))
             # setup outputs
             processed_data_list = []
             for output in job.tool.outputs:
@@ -1254,34 +1821,84 @@ class Request(Observable):
                 processed_data = self.data_service.create_data_uri(processed_dataset, run, processed_data)
                 # args
                 local_files.append(processed_data.uri)
-                cmd = cmd.replace("${" + output.name + "}", processed_data.uri)
+                values[output.name] = processed_data.uri
                 processed_data_list.append(processed_data)
-            # 4.2- exec
-            try:
-                cmd = self._replace_env_variables(job.tool, cmd)
-                cmd = cmd.replace('/', os.sep)
-                self.runner_service.exec(job.tool, shlex.split(cmd), job_id)
-            except RunnerExecError as err:
-                self.runner_service.tear_down(job.tool, job_id)
-                self.notify_error(str(err), job_id)
-            # 4.3- create the output data
-            for processed_data in processed_data_list:
-                # save the metadata and create its md_uri and uri
-                try:
-                    processed_data = self.create_data(processed_dataset, run, processed_data)
-                except FormatKeyNotFoundError as err:
-                    self.notify_error(str(err), job_id)
-                    return
+        item = {'name': data_info_zero.name,
+                'processed_data_list': processed_data_list,
+                'outputs': {processed_data.output['name']: processed_data.uri
+                            for processed_data in processed_data_list},
+                'local_files': local_files,
+                'cache_key': None}
+        try:
+            if self.result_cache is not None:
+                inputs_hashes = [data_info.hash or self.result_cache.file_hash(data_uri)
+                                 for data_info, data_uri in zip(inputs_metadata.values(),
+                                                                inputs_files)]
+                item['cache_key'] = self.result_cache.key(job.tool.fullname(),
+                                                          self._resolved_parameters(job),
+                                                          inputs_hashes)
+        except OSError:
+            self._clean_job_item(item)
+            raise
+        try:
+            item['args'] = command.render(values)
+        except RunnerExecError:
+            self._clean_job_item(item)
+            raise
+        return item
 
-            if self.data_service.needs_cleanning():
-                for file in local_files:
-                    if os.path.exists(file):
-                        os.remove(file)            
+    def _job_item_from_cache(self, job, item, job_id, metadata_lock):
+        """Copy the outputs of a job data from the result cache
 
-        # 4.0- notify observers
-        self.runner_service.tear_down(job.tool, job_id)
-        self.notify_progress(100, 'done', job_id)
-        self.notify(f'Finished job{job_id}')
+        Returns
+        -------
+        True if the outputs are found in the cache
+
+        """
+        if item['cache_key'] is None or not self.result_cache.get(item['cache_key'],
+                                                                  item['outputs']):
+            return False
+        self.notify(f'{item["name"]}: outputs found in the result cache', job_id)
+        with metadata_lock:
+            job.summary.cache_hits += 1
+        return True
+
+    def _job_item_to_cache(self, job, item, metadata_lock):
+        """Add the outputs of a processed job data to the result cache"""
+        if item['cache_key'] is not None:
+            self.result_cache.put(item['cache_key'], item['outputs'])
+            with metadata_lock:
+                job.summary.cache_misses += 1
+
+    def _finish_job_item(self, job, input_data, i, processed_dataset, run, item,
+                         metadata_lock):
+        """Save the metadata of the outputs of a processed job data
+
+        Returns
+        -------
+        The list of the ProcessedData created
+
+        """
+        with metadata_lock:
+            created_list = []
+            for processed_data in item['processed_data_list']:
+                # save the metadata and create its md_uri and uri
+                created_list.append(self.create_data(processed_dataset, run,
+                                                     processed_data))
+            outputs_md_uris = [processed_data.md_uri for processed_data in created_list]
+            # checkpoint to resume the job
+            if hasattr(self.data_service, 'add_run_item'):
+                self.data_service.add_run_item(
+                    run, [input_data[n][i].uuid for n in range(len(job.inputs.inputs))],
+                    outputs_md_uris)
+        return created_list
+
+    def _clean_job_item(self, item):
+        """Remove the local copies of the files of a job data"""
+        if self.data_service.needs_cleanning():
+            for file in item['local_files']:
+                if os.path.exists(file):
+                    os.remove(file)
 
     def _run_job_merged(self, job):
         """Run the process that merge txt number inputs
@@ -1350,26 +1967,26 @@ class Request(Observable):
             inputs_metadata.append(inp_metadata)
 
         # 7- run process on generated files
-        cmd = job.tool.command
+        job_id = self.new_job()
+        command = self._job_command(job, job_id)
+        values = dict()
 
         # 7.1- inputs
         for n, input_ in enumerate(job.inputs.inputs):
-            cmd = cmd.replace("${" + input_.name + "}", tmp_inputs_files[n])
-
-        # 7.2- params
-        for key, value in job.parameters.items():
-            cmd = cmd.replace("${" + key + "}", value)
+            values[input_.name] = tmp_inputs_files[n]
 
-        # 4.3- outputs
+        # 7.2- outputs
         for output in job.tool.outputs:
             extension = '.' + FormatsAccess.instance().get(output.type).extension
-
-            # cmd
             output_file_name = output.name
-            value = os.path.join(processed_data_dir, output_file_name + extension)
-            cmd = cmd.replace("${" + output.name + "}", value)
+            values[output.name] = os.path.join(processed_data_dir, output_file_name + extension)
+
+        # 7.3- cmd, rendered before the outputs metadata are created, so that
+        # a command error does not leave data without files
+        args = command.render(values)
 
-            # output metadata
+        # 7.4- outputs metadata
+        for output in job.tool.outputs:
             processed_data = ProcessedData()
             processed_data.name = output.name
             processed_data.author = ConfigAccess.instance().get('user')['name']
@@ -1385,49 +2002,297 @@ class Request(Observable):
             }
             # save the metadata and create its md_uri and uri
             self.create_data(processed_dataset, run, processed_data)
+        self._compact_dataset(processed_dataset.md_uri)
 
         # 8- exec
-        cmd = self._replace_env_variables(job.tool, cmd)
-        cmd = cmd.replace('/', os.sep)
-        job_id = self.new_job()
         self.notify(f'Start job{job_id}')
         self.runner_service.set_up(job.tool, job_id)
-        self.runner_service.exec(job.tool, shlex.split(cmd), job_id)
+        self.runner_service.exec(job.tool, args, job_id)
         self.runner_service.tear_down(job.tool, job_id)
         self.notify_progress(100, 'done', job_id)
         self.notify(f'Finished job{job_id}')
 
-    def run_pipeline(self, experiment: Experiment, pipeline: Pipeline):
-        print('Start Pipeline')
-        all_step_ran = False
-        while not all_step_ran:
-            loop_check = 0
-            for step in pipeline.steps:
-                if not step.already_ran:
-                    job = Job()
-                    job.set_experiment(experiment)
-                    job.set_tool(self.get_tool(step.tool))
-                    missing_inputs = False 
-                    for input in step.inputs:
-                        # Check that the input exists
-                        if not self.is_dataset(experiment, input.dataset):
-                            missing_inputs = True    
-                        # continue if the inputs does not exists
-                        job.set_input(name=input.name, dataset=input.dataset, 
-                                      query=input.query, 
-                                      origin_output_name=input.origin_output_name)
-                    if not missing_inputs:                  
-                        # set each parameters
-                        for parameter in step.parameters:
-                            print('job set param:', parameter.name, "=", parameter.value)
-                            job.set_param(parameter.name, parameter.value)
-                        # choose a name for the output dataset
-                        job.set_output_dataset_name(step.output_dataset_name)
-                        self.run(job) 
-                        step.already_ran = True   
+    def run_pipeline(self, experiment: Experiment, pipeline: Pipeline, max_workers: int = 0,
+                     streaming: bool = False, incremental: bool = False):
+        """Run the steps of a pipeline
+
+        The steps form a graph where a step depends on the steps creating its
+        input datasets. The graph is checked before running any step, then
+        each step runs as soon as the steps it depends on are finished. The
+        independent steps run at the same time, and the data of each step
+        are processed with the step max_workers (see Job.set_max_workers)
+
+        In the streaming mode, a step with a single input created by another
+        step starts with that step and processes each data as soon as it is
+        created. The metadata are the same as in the batch mode, but the data
+        of the datasets can be in a different order
+
+        In the incremental mode, the stored runs are compared with the
+        pipeline (see plan_pipeline). Only the new data and the steps that
+        changed are processed, and the outputs of the removed data are
+        removed from the datasets
+
+        Parameters
+        ----------
+        experiment: Experiment
+            Container of the experiment metadata
+        pipeline: Pipeline
+            Container of the pipeline
+        max_workers: int
+            Maximum number of steps running at the same time. All the steps
+            that can run are started if 0. Ignored in the streaming mode
+        streaming: bool
+            True to send the data from a step to the next as soon as they are
+            created
+        incremental: bool
+            True to run only what changed since the last execution
+
+        Returns
+        -------
+        The PipelineSummary of the execution (schedule and timings of the
+        steps) also set to pipeline.summary. None if the pipeline is not valid
+
+        """
+        try:
+            graph, tools = self._pipeline_graph(experiment, pipeline)
+            plan = None
+            if incremental:
+                plan = self._plan_pipeline(experiment, graph, tools)
+                for step in pipeline.steps:
+                    step.already_ran = not plan.step(step.name).will_run()
+        except (PipelineError, RunnerExecError, DataServiceError, DataQueryError) as err:
+            self.notify_error(str(err))
+            return None
+        # queues of the data sent to the streamed steps {step index: Queue}
+        streams = dict()
+        if streaming:
+            for i, step in enumerate(pipeline.steps):
+                if self._is_streamed_step(step, graph, tools, plan):
+                    streams[i] = queue.Queue()
+        job_id = self.new_job()
+        self.notify(f'Start pipeline {pipeline.name}: '
+                    f'{" -> ".join(str(level) for level in graph.schedule())}', job_id)
+        if plan is not None:
+            self.notify(str(plan), job_id)
+
+        def run_step(step):
+            index = graph.producers[step.output_dataset_name]
+            consumers = [streams[i] for i in sorted(graph.dependents[index]) if i in streams]
+            job = self._step_job(experiment, step, tools[step.name])
+            if incremental:
+                job.set_resume()
+            self.notify(f'Start step {step.name}', job_id)
+            try:
+                if index in streams or consumers:
+                    input_stream = None
+                    if index in streams:
+                        input_stream = self._stream_data(job.inputs.inputs[0], streams[index])
+                    on_output = None
+                    if consumers:
+                        def on_output(processed_data):
+                            for consumer in consumers:
+                                consumer.put(processed_data)
+                    self._run_job_sequence(job, input_stream, on_output)
                 else:
-                    loop_check += 1
-            if loop_check == len(pipeline.steps):
-                all_step_ran = True 
-        print('Start Pipeline')  
+                    self.run(job)
+            finally:
+                # end of the data sent to the streamed steps
+                for consumer in consumers:
+                    consumer.put(None)
+            self.notify(f'Finished step {step.name}', job_id)
+            return job.summary
+
+        summary = graph.execute(run_step, max_workers,
+                                errors=(RunnerExecError, DataServiceError, DataQueryError),
+                                streamed=set(streams))
+        summary.plan = plan
+        pipeline.summary = summary
+        for name, message in summary.failed.items():
+            self.notify_error(f'Step {name}: {message}', job_id)
+        self.notify(str(summary), job_id)
+        self.notify(f'Finished pipeline {pipeline.name}', job_id)
+        return summary
+
+    def plan_pipeline(self, experiment: Experiment, pipeline: Pipeline) -> PipelinePlan:
+        """Get what an incremental execution of a pipeline would run (dry run)
+
+        For each step, the run stored in the output dataset is compared with
+        the step tool, parameters and inputs, and the data already processed
+        with the data of the input datasets. Nothing is modified
+
+        Parameters
+        ----------
+        experiment: Experiment
+            Container of the experiment metadata
+        pipeline: Pipeline
+            Container of the pipeline
+
+        Returns
+        -------
+        The PipelinePlan with the status of each step. None if the pipeline
+        is not valid
+
+        """
+        try:
+            graph, tools = self._pipeline_graph(experiment, pipeline)
+            return self._plan_pipeline(experiment, graph, tools)
+        except (PipelineError, RunnerExecError, DataServiceError, DataQueryError) as err:
+            self.notify_error(str(err))
+            return None
+
+    def _pipeline_graph(self, experiment, pipeline):
+        """Create the graph of a pipeline and get the tools of its steps
+
+        Returns
+        -------
+        list [PipelineGraph, dict of the tools {step name: Tool}]
+
+        Raises
+        ------
+        PipelineError if the pipeline is not valid or a tool is not found
+
+        """
+        graph = PipelineGraph(pipeline.steps,
+                              [info.name for info in experiment.processed_datasets])
+        tools = dict()
+        for step in pipeline.steps:
+            tools[step.name] = self.get_tool(step.tool)
+            if tools[step.name] is None:
+                raise PipelineError(f'Tool {step.tool} of the step {step.name} not found')
+        return [graph, tools]
+
+    @staticmethod
+    def _step_job(experiment, step, tool):
+        """Create the job of a pipeline step"""
+        job = Job()
+        job.set_experiment(experiment)
+        job.set_tool(tool)
+        for input_ in step.inputs:
+            job.set_input(name=input_.name, dataset=input_.dataset,
+                          query=input_.query,
+                          origin_output_name=input_.origin_output_name)
+        for parameter in step.parameters:
+            job.set_param(parameter.name, parameter.value)
+        job.set_output_dataset_name(step.output_dataset_name)
+        if step.max_workers > 0:
+            job.set_max_workers(step.max_workers)
+        return job
+
+    def _plan_pipeline(self, experiment, graph, tools):
+        """Compute the PipelinePlan of the steps of a graph (see plan_pipeline)"""
+        plan = PipelinePlan()
+        step_plans = dict()
+        for level in graph.levels():
+            for i in level:
+                step = graph.steps[i]
+                job = self._step_job(experiment, step, tools[step.name])
+                inputs_change = any(step_plans[n].will_run() for n in graph.dependencies[i])
+                step_plans[i] = self._plan_step(job, inputs_change)
+                step_plans[i].name = step.name
+                plan.steps.append(step_plans[i])
+        return plan
+
+    def _plan_step(self, job, inputs_change):
+        """Compare the stored run of a job with the job
+
+        Parameters
+        ----------
+        job: Job
+            Job of the step
+        inputs_change: bool
+            True if a step creating an input dataset of the job will run
+
+        Returns
+        -------
+        The PipelineStepPlan of the job
+
+        """
+        step_plan = PipelineStepPlan(status=PipelineStepPlan.NEW, data_count=-1)
+        previous_run = None
+        if self.is_dataset(job.experiment, job.output_dataset_name):
+            dataset = self.get_dataset(job.experiment, job.output_dataset_name)
+            if hasattr(self.data_service, 'get_run_items'):
+                previous_run = self._find_run(dataset, self._job_run_info(job))
+            if previous_run is None:
+                step_plan.status = PipelineStepPlan.CHANGED
+                step_plan.stale_count = len(dataset.uris)
+        if previous_run is not None and inputs_change:
+            step_plan.status = PipelineStepPlan.OUTDATED
+        if inputs_change:
+            return step_plan
+        input_data, data_count = self._query_inputs(job)
+        step_plan.data_count = data_count
+        if previous_run is not None:
+            completed_items = self.data_service.get_run_items(previous_run)
+            current_items = set(self._item_uuids(input_data, i) for i in range(data_count))
+            step_plan.data_count = len(current_items - set(completed_items))
+            step_plan.stale_count = len(set(completed_items) - current_items)
+            if step_plan.data_count > 0 or step_plan.stale_count > 0:
+                step_plan.status = PipelineStepPlan.OUTDATED
+            else:
+                step_plan.status = PipelineStepPlan.UP_TO_DATE
+        return step_plan
+
+    @staticmethod
+    def _is_streamed_step(step, graph, tools, plan=None):
+        """Check if a step can process the data of its input step while they are created
+
+        The step must have a single input created by a step of the pipeline
+        that is not already ran, and none of the two tools merges its data.
+        In the incremental mode, the two steps must process all their data
+        (new or changed steps)
+
+        """
+        if len(step.inputs) != 1 or step.already_ran or tools[step.name].type == 'merge':
+            return False
+        producer = graph.producers.get(step.inputs[0].dataset)
+        if producer is None:
+            return False
+        producer_step = graph.steps[producer]
+        if plan is not None:
+            for name in [step.name, producer_step.name]:
+                if plan.step(name).status not in [PipelineStepPlan.NEW,
+                                                  PipelineStepPlan.CHANGED]:
+                    return False
+        return not producer_step.already_ran and tools[producer_step.name].type != 'merge'
+
+    def _stream_data(self, step_input, data_queue):
+        """Select the data of a step input while they are created
+
+        The data are selected with the input query and origin output name as
+        in get_data
+
+        Parameters
+        ----------
+        step_input: JobInput
+            Input of the step
+        data_queue: Queue
+            Queue of the ProcessedData created by the input step. None marks
+            the end of the data
+
+        Returns
+        -------
+        Iterator of the selected ProcessedData
+
+        """
+        # parsed here to report a query error before the step starts
+        compiled_query = compile_query(step_input.query)
+        parents = dict()
+
+        def select():
+            while True:
+                processed_data = data_queue.get()
+                if processed_data is None:
+                    return
+                if step_input.origin_output_name != '' and \
+                        processed_data.output['name'] != step_input.origin_output_name:
+                    continue
+                if step_input.query != '':
+                    search_container = self._processed_data_to_search_container(
+                        processed_data, parents)
+                    if len(compiled_query.select([search_container])) == 0:
+                        continue
+                yield processed_data
+
+        return select()
      
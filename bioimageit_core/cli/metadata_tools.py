@@ -0,0 +1,44 @@
+import argparse
+import os
+from bioimageit_core.core.lineage import backfill_lineage
+from bioimageit_core.plugins.data_local import LocalMetadataService
+
+
+def rebuild_index(experiment_dir):
+    service = LocalMetadataService()
+    experiment = service.get_experiment(os.path.join(experiment_dir, 'experiment.md.json'))
+    raw_dataset = service.get_dataset(experiment.raw_dataset.url)
+    index = service.rebuild_index(raw_dataset)
+    print(f'{experiment.name}: {len(index)} data indexed')
+
+
+def backfill(experiment_dir):
+    service = LocalMetadataService()
+    experiment = service.get_experiment(os.path.join(experiment_dir, 'experiment.md.json'))
+    count = backfill_lineage(service, experiment)
+    print(f'{experiment.name}: {count} processed data updated')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BioImageIT experiments metadata tools')
+    subparsers = parser.add_subparsers(dest='command')
+    parser_index = subparsers.add_parser('rebuild-index',
+                                         help='create the key-value index of the raw data')
+    parser_index.add_argument('experiments', nargs='+', help='experiments directories')
+    parser_lineage = subparsers.add_parser('backfill-lineage',
+                                           help='record the origin of the processed data')
+    parser_lineage.add_argument('experiments', nargs='+', help='experiments directories')
+    args = parser.parse_args()
+
+    if args.command == 'rebuild-index':
+        for experiment_dir in args.experiments:
+            rebuild_index(experiment_dir)
+    elif args.command == 'backfill-lineage':
+        for experiment_dir in args.experiments:
+            backfill(experiment_dir)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import argparse
+from bioimageit_core.api import Request
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Install the environments of the BioImageIT '
+                                                 'tools ahead of time')
+    parser.add_argument('-c', '--config', default='config.json',
+                        help='BioImageIT configuration file')
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help='number of environments installed at the same time')
+    args = parser.parse_args()
+
+    request = Request(args.config)
+    request.connect()
+    results = request.provision_runner(args.workers)
+    for env_name in sorted(results):
+        print(f'{env_name}: {results[env_name] if results[env_name] else "ready"}')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from .data_containers import (METADATA_TYPE_RAW, METADATA_TYPE_PROCESSED, Container, Data, RawData,
-                              ProcessedData, ProcessedDataInputContainer, Dataset,
+                              ProcessedData, ProcessedDataInputContainer,
+                              ProcessedDataRootContainer, Dataset,
                               RunParameterContainer, RunInputContainer, Run, DatasetInfo,
                               Experiment)
 from .tools_containers import (PARAM_NUMBER,
@@ -17,7 +18,7 @@ from .tools_containers import (PARAM_NUMBER,
                                ToolParameterContainer,
                                Tool,
                                )
-from .runners_containers import JobInput, Job
+from .runners_containers import JobInput, Job, JobSummary, ExecStats
 
 __all__ = ['METADATA_TYPE_RAW',
            'METADATA_TYPE_PROCESSED',
@@ -26,6 +27,7 @@ __all__ = ['METADATA_TYPE_RAW',
            'RawData',
            'ProcessedData',
            'ProcessedDataInputContainer',
+           'ProcessedDataRootContainer',
            'Dataset',
            'RunParameterContainer',
            'RunInputContainer',
@@ -47,5 +49,7 @@ __all__ = ['METADATA_TYPE_RAW',
            'ToolParameterContainer',
            'Tool',
            'JobInput',
-           'Job'
+           'Job',
+           'JobSummary',
+           'ExecStats'
            ]
@@ -8,6 +8,8 @@ Classes
 Container
 Data
 RawData
+ProcessedDataInputContainer
+ProcessedDataRootContainer
 ProcessedData
 Dataset
 Experiment
@@ -78,6 +80,9 @@ class RawData(Data):
         Dictionary containing the key-value pairs (key=value)
     metadata: dict
         Dictionary of extra metadata (ex: image acquisition settings)
+    hash: str
+        Content hash of the data file ('algorithm:hexdigest'). Empty if the
+        hash was not computed at import
 
     """
     def __init__(self):
@@ -85,6 +90,7 @@ class RawData(Data):
         self.key_value_pairs = dict()
         self.type = 'raw'
         self.metadata = dict()
+        self.hash = ''
 
     def set_key_value_pair(self, key, value):
         self.key_value_pairs[key] = value
@@ -109,6 +115,32 @@ class ProcessedDataInputContainer:
         self.type = type_
 
 
+class ProcessedDataRootContainer:
+    """Container for the root raw data of a processed data
+
+    It is a snapshot of the raw data at the beginning of the processing
+    chain, taken when the processed data is created
+
+    Attributes
+    ----------
+    uri
+        The uri of the raw data metadata
+    uuid
+        The uuid of the raw data
+    name
+        The name of the raw data
+    key_value_pairs
+        The key-value pairs of the raw data
+
+    """
+    def __init__(self, uri: str = '', uuid: str = '', name: str = '',
+                 key_value_pairs: dict = None):
+        self.uri = uri
+        self.uuid = uuid
+        self.name = name
+        self.key_value_pairs = dict(key_value_pairs or {})
+
+
 class ProcessedData(Data):
     """Container for processed data
 
@@ -123,6 +155,10 @@ class ProcessedData(Data):
         Information about how the output is referenced
         in the process that generates this processed data
         ex: {"name": "o", "label": "Processed image"}
+    root
+        Snapshot of the raw data at the origin of the processing chain
+        (ProcessedDataRootContainer). None for the data created before the
+        lineage was recorded
 
     """
     def __init__(self):
@@ -131,6 +167,7 @@ class ProcessedData(Data):
         self.inputs = list()
         self.output = dict()
         self.type = 'processed'
+        self.root = None
 
     def set_info(self, name='', author='', date='', format_='', url=''):
         self.name = name
@@ -151,6 +188,10 @@ class ProcessedData(Data):
     def set_output(self, id_: str, label: str):
         self.output = {'name': id_, 'label': label}
 
+    def set_root(self, raw_data: RawData):
+        self.root = ProcessedDataRootContainer(raw_data.md_uri, raw_data.uuid,
+                                               raw_data.name, raw_data.key_value_pairs)
+
 
 class Dataset(Container):
     """Container for a dataset metadata
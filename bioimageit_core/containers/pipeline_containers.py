@@ -28,6 +28,7 @@ class PipelineStep:
         self.parameters = [] # PipelineParameter
         self.outputs = [] # PipelineOuputs
         self.output_dataset_name = ''
+        self.max_workers = 0 # data processed in parallel, 0 for the runner setting
         self.already_ran = False
 
     def add_input(self, input: PipelineInput):
@@ -50,6 +51,136 @@ class Pipeline:
         self.uuid = ''
         self.bioimageit_version = ''
         self.steps = []
+        self.summary = None # PipelineSummary of the last execution
 
     def add_step(self ):
         pass    
+
+
+class PipelineSummary:
+    """Container for the summary of a pipeline execution
+
+    Attributes
+    ----------
+    schedule: list
+        Names of the steps grouped by level. The steps of a level only
+        depend on the steps of the previous levels
+    order: list
+        Names of the steps in the order they started
+    timings: dict
+        Start time (in seconds from the start of the pipeline) and duration
+        of each step {name: (start, duration)}
+    jobs: dict
+        JobSummary of each step {name: JobSummary}
+    failed: dict
+        Error message of each step that failed {name: message}
+    skipped: list
+        Names of the steps not run because a step they depend on failed
+    duration: float
+        Duration of the pipeline in seconds
+    plan: PipelinePlan
+        What the incremental execution planned to run. None if the
+        execution is not incremental
+
+    """
+    def __init__(self, schedule: list = None):
+        self.schedule = schedule if schedule is not None else []
+        self.order = []
+        self.timings = {}
+        self.jobs = {}
+        self.failed = {}
+        self.skipped = []
+        self.duration = 0.0
+        self.plan = None
+
+    def is_success(self):
+        """True if all the steps ran without error"""
+        return len(self.failed) == 0 and len(self.skipped) == 0
+
+    def __str__(self):
+        text = f'{len(self.timings)} steps ran in {self.duration:.2f}s'
+        for level, names in enumerate(self.schedule):
+            for name in names:
+                text += f'\n\t[{level}] {name}: '
+                if name in self.failed:
+                    text += f'failed ({self.failed[name]})'
+                elif name in self.skipped:
+                    text += 'skipped'
+                elif name in self.timings:
+                    start, duration = self.timings[name]
+                    text += f'started at {start:.2f}s, {duration:.2f}s'
+                else:
+                    text += 'already ran'
+        return text
+
+
+class PipelineStepPlan:
+    """Container for what a pipeline step will execute
+
+    Attributes
+    ----------
+    name: str
+        Name of the step
+    status: str
+        new: the output dataset does not exist
+        changed: the tool, parameters or inputs differ from the stored run
+        outdated: data were added or removed in the input datasets, or an
+        input step will run
+        up to date: nothing to run
+    data_count: int
+        Number of data to process. -1 if it is known only when the input
+        steps have run
+    stale_count: int
+        Number of processed data removed because their input data were
+        removed
+
+    """
+    NEW = 'new'
+    CHANGED = 'changed'
+    OUTDATED = 'outdated'
+    UP_TO_DATE = 'up to date'
+
+    def __init__(self, name: str = '', status: str = '', data_count: int = 0,
+                 stale_count: int = 0):
+        self.name = name
+        self.status = status
+        self.data_count = data_count
+        self.stale_count = stale_count
+
+    def will_run(self):
+        """True if the step has something to execute"""
+        return self.status != PipelineStepPlan.UP_TO_DATE
+
+    def __str__(self):
+        text = f'{self.name}: {self.status}'
+        if self.will_run():
+            if self.data_count < 0:
+                text += ', data to process known after the input steps'
+            else:
+                text += f', {self.data_count} data to process'
+            if self.stale_count > 0:
+                text += f', {self.stale_count} data removed'
+        return text
+
+
+class PipelinePlan:
+    """Container for what a pipeline execution will run
+
+    Attributes
+    ----------
+    steps: list
+        PipelineStepPlan of each step, in the order they can run
+
+    """
+    def __init__(self):
+        self.steps = []
+
+    def step(self, name: str):
+        """Get the plan of a step from its name"""
+        for step_plan in self.steps:
+            if step_plan.name == name:
+                return step_plan
+        return None
+
+    def __str__(self):
+        return '\n'.join(str(step_plan) for step_plan in self.steps)
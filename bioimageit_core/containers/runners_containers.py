@@ -88,6 +88,14 @@ class Job:
         Description of the job inputs in the database
     output_dataset_name: str
         Unique name of the output dataset
+    max_workers: int
+        Number of data processed in parallel. If 0, the max_workers value of
+        the runner configuration is used (1 by default)
+    resume: bool
+        If True and the output dataset exists, the data already processed by
+        the same run in the output dataset are skipped
+    summary: JobSummary
+        Summary of the last execution of the job
 
     """
     def __init__(self):
@@ -96,6 +104,9 @@ class Job:
         self.parameters = {}
         self.inputs = JobInputs()
         self.output_dataset_name = ''
+        self.max_workers = 0
+        self.resume = False
+        self.summary = None
 
     def set_experiment(self, experiment):
         self.experiment = experiment
@@ -106,8 +117,107 @@ class Job:
     def set_output_dataset_name(self, name):
         self.output_dataset_name = name
 
+    def set_max_workers(self, max_workers):
+        self.max_workers = max_workers
+
+    def set_resume(self, resume=True):
+        self.resume = resume
+
     def set_param(self, key, value):
         self.parameters[key] = value
 
     def set_input(self, name, dataset, query, origin_output_name=''):
         self.inputs.add_input(name, dataset, query, origin_output_name)
+
+
+class JobSummary:
+    """Container for the summary of a job execution
+
+    Attributes
+    ----------
+    job_id: int
+        ID of the job
+    data_count: int
+        Number of data to process
+    succeeded: list
+        Names of the data processed successfully
+    failed: dict
+        Error message of each data that failed {name: message}
+    skipped: list
+        Names of the data already processed by a previous execution of a
+        resumed job
+    cache_hits: int
+        Number of data where the outputs are copied from the result cache
+    cache_misses: int
+        Number of data processed and added to the result cache
+
+    """
+    def __init__(self, job_id: int = 0, data_count: int = 0):
+        self.job_id = job_id
+        self.data_count = data_count
+        self.succeeded = []
+        self.failed = {}
+        self.skipped = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def add_success(self, name: str):
+        self.succeeded.append(name)
+
+    def add_failure(self, name: str, message: str):
+        self.failed[name] = message
+
+    def add_skipped(self, name: str):
+        self.skipped.append(name)
+
+    def finished_count(self):
+        """get the number of data processed, with or without errors"""
+        return len(self.succeeded) + len(self.failed) + len(self.skipped)
+
+    def is_success(self):
+        """True if all the data were processed without error"""
+        return len(self.failed) == 0
+
+    def __str__(self):
+        text = f'{len(self.succeeded)}/{self.data_count} data processed'
+        if self.skipped:
+            text += f', {len(self.skipped)} already processed'
+        if self.failed:
+            text += f', {len(self.failed)} failed:'
+            for name, message in self.failed.items():
+                text += f'\n\t{name}: {message}'
+        return text
+
+
+class ExecStats:
+    """Container for the resources used by the execution of a command
+
+    Attributes
+    ----------
+    name: str
+        Name of the command (the executable)
+    returncode: int
+        Exit status of the command, negative if it is stopped by a signal
+    wall_time: float
+        Duration of the command in seconds
+    cpu_time: float
+        User and system CPU time of the command in seconds, None if unknown
+    max_rss: int
+        Peak resident memory of the command in bytes, None if unknown
+
+    """
+    def __init__(self, name: str = '', returncode: int = 0, wall_time: float = 0,
+                 cpu_time: float = None, max_rss: int = None):
+        self.name = name
+        self.returncode = returncode
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.max_rss = max_rss
+
+    def __str__(self):
+        text = f'{self.name}: wall time {self.wall_time:.2f}s'
+        if self.cpu_time is not None:
+            text += f', cpu time {self.cpu_time:.2f}s'
+        if self.max_rss is not None:
+            text += f', peak memory {self.max_rss / 1024 ** 2:.1f}MB'
+        return text
@@ -79,6 +79,10 @@ class ToolIndexContainer:
         Tool type ('sequential', 'merge')
     categories
         List of the tool categories
+    description: str
+        Short description of the tool
+    help: str
+        Help of the tool
 
     """
     def __init__(self):
@@ -88,6 +92,7 @@ class ToolIndexContainer:
         self.version = ''
         self.type = ''
         self.categories = []
+        self.description = ''
         self.help = ''
 
     def to_dict(self):
@@ -98,6 +103,7 @@ class ToolIndexContainer:
         out['version'] = self.version
         out['type'] = self.type
         out['categories'] = self.categories
+        out['description'] = self.description
         out['help'] = self.help
         return out
 
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT file cache module.
+
+This module implements an in-process cache for objects parsed from files
+(metadata JSON files, tools XML files...). Each entry is keyed by the
+file path and validated with the file modification time and size, so an
+entry is never returned if the file changed on disk since it was parsed.
+
+Example
+-------
+    >>> cache = FileCache(max_size=1024)
+    >>> metadata = cache.get('experiment.md.json', read_json)
+    >>> # after a write, drop the entry explicitly
+    >>> cache.invalidate('experiment.md.json')
+
+Classes
+-------
+FileCache
+
+"""
+import os
+import threading
+from collections import OrderedDict
+
+
+class FileCache:
+    """Bounded LRU cache of objects parsed from files
+
+    Objects returned by the cache are shared between all the callers.
+    They must be treated as read-only: copy them before any modification.
+
+    Parameters
+    ----------
+    max_size: int
+        Maximum number of entries kept in the cache. The least recently
+        used entry is dropped when the cache is full
+    signature: callable
+        Function computing the signature of a file (see
+        FileCache.signature), when an entry also depends on other files
+
+    Attributes
+    ----------
+    hits: int
+        Number of reads served from the cache
+    misses: int
+        Number of reads that needed to parse the file
+
+    """
+    def __init__(self, max_size: int = 4096, signature=None):
+        self.max_size = max_size
+        if signature is not None:
+            self.signature = signature
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def signature(path: str):
+        """Get the signature used to validate an entry
+
+        Parameters
+        ----------
+        path: str
+            Path of the file
+
+        Returns
+        -------
+        tuple (mtime in ns, size) of the file or None if the file does not exists
+
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, path: str, loader):
+        """Get the object parsed from a file
+
+        Parameters
+        ----------
+        path: str
+            Path of the file
+        loader: callable
+            Function that parses the file. It is called with the path as
+            unique argument when the entry is missing or outdated
+
+        Returns
+        -------
+        The object returned by the loader
+
+        """
+        signature = self.signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and signature is not None \
+                    and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = loader(path)
+        if signature is not None:
+            self.put(path, value, signature)
+        return value
+
+    def put(self, path: str, value, signature=None):
+        """Add or replace an entry
+
+        Parameters
+        ----------
+        path: str
+            Path of the file
+        value:
+            Object parsed from the file
+        signature: tuple
+            Signature of the file when it was parsed. It is read from the
+            file system if not given
+
+        """
+        if signature is None:
+            signature = self.signature(path)
+            if signature is None:
+                return
+        with self._lock:
+            self._entries[path] = (signature, value)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path: str = None):
+        """Remove an entry from the cache
+
+        Parameters
+        ----------
+        path: str
+            Path of the file to remove. The whole cache is cleared if None
+
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        return path in self._entries
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT command template module.
+
+This module implements the command line templates of the tools. The
+command of a tool is compiled once per job: the constants (tool directory,
+config and env variables) are substituted, the command is split into
+arguments, and the remaining ${name} placeholders become slots. The command
+of each data is then rendered in a single pass. A value always stays in the
+argument of its placeholder, even if it contains spaces or quotes.
+
+Example
+-------
+    >>> template = CommandTemplate('denoise -i ${i} -o ${o} -s ${sigma}',
+    ...                            {'$__tool_directory__': '/tools/denoise/'})
+    >>> template.slots
+    {'i', 'o', 'sigma'}
+    >>> template = template.bind({'sigma': 4})
+    >>> template.render({'i': 'my image.tif', 'o': 'out.tif'})
+    ['denoise', '-i', 'my image.tif', '-o', 'out.tif', '-s', '4']
+
+Classes
+-------
+CommandTemplate
+
+"""
+import os
+import re
+import copy
+import shlex
+
+from bioimageit_core.core.exceptions import RunnerExecError
+
+_PLACEHOLDER = re.compile(r'\$\{([^}]+)\}')
+
+
+class CommandTemplate:
+    """Command line compiled into arguments with slots
+
+    Parameters
+    ----------
+    command: str
+        Command line of the tool, with ${name} placeholders
+    constants: dict
+        Text substituted in the command before it is split into arguments
+        {text to replace: value} (ex: {'$__fiji__': '/opt/Fiji/ImageJ'}).
+        A constant value can contain several arguments
+    sep: str
+        Path separator. The '/' of the command and of the values are
+        replaced by it
+
+    Attributes
+    ----------
+    slots: set
+        Names of the placeholders to fill when the command is rendered
+
+    Raises
+    ------
+    RunnerExecError if the command cannot be split into arguments
+    (ex: unbalanced quotes)
+
+    """
+    def __init__(self, command: str, constants: dict = None, sep: str = os.sep):
+        self.command = command
+        self.sep = sep
+        self.slots = set()
+        # each argument is a str, or a list alternating the literal parts
+        # and the names of the slots [literal, name, literal, ...]
+        self._args = []
+        self._compile(command, constants or dict())
+
+    def _compile(self, command: str, constants: dict):
+        if constants:
+            pattern = re.compile('|'.join(re.escape(key) for key in
+                                          sorted(constants, key=len, reverse=True)))
+            command = pattern.sub(lambda match: str(constants[match.group(0)]), command)
+        try:
+            args = shlex.split(command)
+        except ValueError as err:
+            raise RunnerExecError(f'Cannot read the command {self.command}: {err}')
+        for arg in args:
+            # after the split, so that a '\\' separator is not read as an escape
+            arg = arg.replace('/', self.sep)
+            parts = _PLACEHOLDER.split(arg)
+            if len(parts) == 1:
+                self._args.append(arg)
+            else:
+                self._args.append(parts)
+                self.slots.update(parts[1::2])
+
+    def _value(self, value) -> str:
+        value = str(value)
+        if self.sep != '/':
+            value = value.replace('/', self.sep)
+        return value
+
+    def bind(self, values: dict):
+        """Fill some slots once, for all the commands rendered after
+
+        Parameters
+        ----------
+        values: dict
+            Value of the slots to fill {name: value}. The names that are not
+            slots are ignored
+
+        Returns
+        -------
+        A new CommandTemplate where the slots of values are replaced by the
+        values
+
+        """
+        template = copy.copy(self)
+        template.slots = set()
+        template._args = []
+        for arg in self._args:
+            if isinstance(arg, str):
+                template._args.append(arg)
+                continue
+            parts = [arg[0]]
+            for k in range(1, len(arg), 2):
+                if arg[k] in values:
+                    parts[-1] += self._value(values[arg[k]]) + arg[k + 1]
+                else:
+                    parts.extend([arg[k], arg[k + 1]])
+            if len(parts) == 1:
+                template._args.append(parts[0])
+            else:
+                template._args.append(parts)
+                template.slots.update(parts[1::2])
+        return template
+
+    def render(self, values: dict) -> list:
+        """Create the arguments of a command
+
+        Parameters
+        ----------
+        values: dict
+            Value of each slot {name: value}. The values are converted to str
+
+        Returns
+        -------
+        The list of the command arguments
+
+        Raises
+        ------
+        RunnerExecError if a slot has no value
+
+        """
+        args = []
+        for arg in self._args:
+            if isinstance(arg, str):
+                args.append(arg)
+                continue
+            text = arg[0]
+            for k in range(1, len(arg), 2):
+                try:
+                    value = values[arg[k]]
+                except KeyError:
+                    missing = sorted(self.slots - set(values))
+                    raise RunnerExecError(f'No value for {", ".join(missing)} in the '
+                                          f'command {self.command}')
+                text += self._value(value) + arg[k + 1]
+            args.append(text)
+        return args
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT content store module.
+
+This module implements the content hash of the data files and a
+content-addressed store. Files added to the store are saved once under
+their content hash, so identical files imported in several experiments are
+stored only once and linked into each experiment. The stored files are
+read-only, since all the links share their content.
+
+Example
+-------
+    >>> store = ContentStore('/workspace/.bioimageit_store')
+    >>> stored_path, digest = store.add('/data/img1.tif')
+
+Methods
+-------
+file_hash
+copy_with_hash
+make_read_only
+
+Classes
+-------
+ContentStore
+
+"""
+import os
+import stat
+import shutil
+import hashlib
+import tempfile
+
+from bioimageit_core.core.exceptions import DataServiceError
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def new_hash(algorithm: str = 'sha256'):
+    """Create a hash object
+
+    Parameters
+    ----------
+    algorithm: str
+        Name of the algorithm in hashlib (sha256, sha1, md5, blake2b...)
+
+    Returns
+    -------
+    The hashlib object
+
+    """
+    try:
+        return hashlib.new(algorithm)
+    except ValueError:
+        raise DataServiceError(f'Unknown hash algorithm {algorithm}')
+
+
+def file_hash(path: str, algorithm: str = 'sha256') -> str:
+    """Compute the content hash of a file
+
+    The file is read by chunks and is never loaded in memory
+
+    Parameters
+    ----------
+    path: str
+        Path of the file
+    algorithm: str
+        Name of the hash algorithm
+
+    Returns
+    -------
+    The hash formatted as 'algorithm:hexdigest'
+
+    """
+    hash_ = new_hash(algorithm)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            hash_.update(chunk)
+    return f'{algorithm}:{hash_.hexdigest()}'
+
+
+def copy_with_hash(source: str, destination: str, algorithm: str = 'sha256') -> str:
+    """Copy a file and compute its content hash with a single read
+
+    Parameters
+    ----------
+    source: str
+        Path of the file to copy
+    destination: str
+        Path of the copy
+    algorithm: str
+        Name of the hash algorithm
+
+    Returns
+    -------
+    The hash formatted as 'algorithm:hexdigest'
+
+    """
+    hash_ = new_hash(algorithm)
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            hash_.update(chunk)
+            dst.write(chunk)
+    shutil.copymode(source, destination)
+    return f'{algorithm}:{hash_.hexdigest()}'
+
+
+def make_read_only(path: str):
+    """Remove the write permissions of a file
+
+    Used for the files shared by hard links, so that modifying one of the
+    links does not change the others
+
+    Parameters
+    ----------
+    path: str
+        Path of the file
+
+    """
+    mode = stat.S_IMODE(os.stat(path).st_mode)
+    os.chmod(path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+class ContentStore:
+    """Content-addressed store of files
+
+    Each file is stored at <root>/<algorithm>/<2 first digits>/<hexdigest>.
+    Files in the store are shared between experiments, so they are
+    read-only
+
+    Parameters
+    ----------
+    root: str
+        Directory of the store. It is created if it does not exists
+    algorithm: str
+        Name of the hash algorithm
+
+    """
+    def __init__(self, root: str, algorithm: str = 'sha256'):
+        self.root = os.path.abspath(root)
+        self.algorithm = algorithm
+        new_hash(algorithm)
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        """Get the path of a file in the store
+
+        Parameters
+        ----------
+        digest: str
+            Hash of the file content formatted as 'algorithm:hexdigest'
+
+        Returns
+        -------
+        The path of the file in the store
+
+        """
+        algorithm, hexdigest = digest.split(':', 1)
+        return os.path.join(self.root, algorithm, hexdigest[:2], hexdigest)
+
+    def __contains__(self, digest: str):
+        return os.path.isfile(self.path(digest))
+
+    def add(self, source: str, digest: str = None):
+        """Add a file to the store
+
+        The file is hashed first, and copied to the store only if its
+        content is not already stored
+
+        Parameters
+        ----------
+        source: str
+            Path of the file
+        digest: str
+            Hash of the file if already known
+
+        Returns
+        -------
+        tuple (path of the file in the store, hash of the file)
+
+        """
+        if digest is None:
+            digest = file_hash(source, self.algorithm)
+        stored_path = self.path(digest)
+        if digest in self:
+            return stored_path, digest
+        # copy to a temporary file, then move it to its place
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmp_path)
+            make_read_only(tmp_path)
+            os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+            os.replace(tmp_path, stored_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return stored_path, digest
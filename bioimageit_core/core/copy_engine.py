@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT copy engine module.
+
+This module implements the transfer of data files to an experiment
+directory. Files can be copied with a pool of threads, linked (hardlink or
+reflink) when the source and the destination share the same file system, or
+referenced in place without any copy. The engine can also compute the
+content hash of the files and store them in a content-addressed store. The
+hard linked files are made read-only, since they share their content with
+the source or the store.
+
+Example
+-------
+    >>> engine = CopyEngine(max_workers=8, mode=CopyEngine.HARDLINK)
+    >>> engine.transfer(['/data/img1.tif', '/data/img2.tif'], '/workspace/exp/data')
+
+Classes
+-------
+CopyEngine
+
+"""
+import os
+import shutil
+import errno
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bioimageit_core.core.exceptions import DataServiceError
+from bioimageit_core.core.content_store import file_hash, copy_with_hash, make_read_only
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ioctl request to clone a file on Linux (btrfs, xfs...)
+FICLONE = 0x40049409
+
+
+class CopyEngine:
+    """Transfer data files to a destination directory
+
+    Parameters
+    ----------
+    max_workers: int
+        Number of files transferred in parallel
+    mode: str
+        Transfer mode:
+            - copy: copy the files
+            - hardlink: create a read-only hard link, copy if the link is not possible
+            - reflink: clone the file (copy on write), copy if the clone is not possible
+            - reference: keep the files in place and use the original path
+    hash_algorithm: str
+        Name of the algorithm used to compute the content hash of the files.
+        No hash is computed if empty
+    content_store: ContentStore
+        If not None, the files are added to this content store and linked
+        to the destination directory (not used with the reference mode)
+
+    """
+    COPY = 'copy'
+    HARDLINK = 'hardlink'
+    REFLINK = 'reflink'
+    REFERENCE = 'reference'
+    MODES = [COPY, HARDLINK, REFLINK, REFERENCE]
+
+    def __init__(self, max_workers: int = 1, mode: str = 'copy', hash_algorithm: str = '',
+                 content_store=None):
+        if mode not in CopyEngine.MODES:
+            raise DataServiceError(f'Unknown import mode {mode}. The mode must '
+                                   f'be one of {", ".join(CopyEngine.MODES)}')
+        self.max_workers = max(1, max_workers)
+        self.mode = mode
+        self.content_store = content_store
+        if content_store is not None and mode == CopyEngine.REFERENCE:
+            self.content_store = None
+        self.hash_algorithm = hash_algorithm
+        if self.content_store is not None:
+            self.hash_algorithm = content_store.algorithm
+
+    def destination(self, source: str, destination_dir: str) -> str:
+        """Get the path of a file after the transfer
+
+        Parameters
+        ----------
+        source: str
+            Path of the file to transfer
+        destination_dir: str
+            Directory where the file is transferred
+
+        Returns
+        -------
+        The path of the transferred file
+
+        """
+        if self.mode == CopyEngine.REFERENCE:
+            return os.path.abspath(source)
+        return os.path.join(destination_dir, os.path.basename(source))
+
+    def transfer_file(self, source: str, destination_dir: str) -> str:
+        """Transfer one file
+
+        Parameters
+        ----------
+        source: str
+            Path of the file to transfer
+        destination_dir: str
+            Directory where the file is transferred
+
+        Returns
+        -------
+        The path of the transferred file
+
+        """
+        return self._transfer(source, destination_dir)[0]
+
+    def hash_file(self, source: str) -> str:
+        """Compute the content hash of a file with the engine algorithm
+
+        Parameters
+        ----------
+        source: str
+            Path of the file
+
+        Returns
+        -------
+        The hash formatted as 'algorithm:hexdigest'
+
+        """
+        return file_hash(source, self.hash_algorithm or 'sha256')
+
+    def hash_files(self, sources: list) -> list:
+        """Compute the content hash of a list of files in parallel
+
+        Parameters
+        ----------
+        sources: list
+            Paths of the files
+
+        Returns
+        -------
+        The list of hashes in the order of sources
+
+        """
+        if self.max_workers == 1 or len(sources) < 2:
+            return [self.hash_file(source) for source in sources]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self.hash_file, sources))
+
+    def _transfer(self, source: str, destination_dir: str):
+        """Transfer one file and compute its hash
+
+        Returns
+        -------
+        tuple (path of the transferred file, content hash or None)
+
+        """
+        destination = self.destination(source, destination_dir)
+        digest = None
+        if self.content_store is not None:
+            stored_path, digest = self.content_store.add(source)
+            self._hardlink(stored_path, destination)
+            return destination, digest
+        if self.mode == CopyEngine.COPY and self.hash_algorithm:
+            return destination, copy_with_hash(source, destination, self.hash_algorithm)
+
+        if self.mode == CopyEngine.HARDLINK:
+            self._hardlink(source, destination)
+        elif self.mode == CopyEngine.REFLINK:
+            self._reflink(source, destination)
+        elif self.mode == CopyEngine.COPY:
+            shutil.copyfile(source, destination)
+        if self.hash_algorithm:
+            digest = file_hash(source, self.hash_algorithm)
+        return destination, digest
+
+    def transfer(self, sources: list, destination_dir: str, callback=None,
+                 digests: dict = None) -> list:
+        """Transfer a list of files
+
+        Parameters
+        ----------
+        sources: list
+            Paths of the files to transfer
+        destination_dir: str
+            Directory where the files are transferred
+        callback: callable
+            Function called with the index of the source each time a
+            transfer is finished. It is called from the calling thread
+        digests: dict
+            If not None, the content hash of each source is added to this
+            dictionary {source: hash} when the engine computes the hashes
+
+        Returns
+        -------
+        The list of the transferred files paths in the order of sources
+
+        """
+        destinations = [None] * len(sources)
+
+        def done(i, result):
+            destinations[i] = result[0]
+            if digests is not None and result[1] is not None:
+                digests[sources[i]] = result[1]
+            if callback is not None:
+                callback(i)
+
+        if self.max_workers == 1 or len(sources) < 2:
+            for i, source in enumerate(sources):
+                done(i, self._transfer(source, destination_dir))
+            return destinations
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._transfer, source, destination_dir): i
+                       for i, source in enumerate(sources)}
+            for future in as_completed(futures):
+                done(futures[future], future.result())
+        return destinations
+
+    @staticmethod
+    def _remove_existing(destination: str):
+        if os.path.lexists(destination):
+            os.remove(destination)
+
+    def _hardlink(self, source: str, destination: str):
+        self._remove_existing(destination)
+        try:
+            os.link(source, destination)
+        except OSError as err:
+            # different file systems or links not supported
+            if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP,
+                                 errno.EOPNOTSUPP):
+                raise
+            shutil.copyfile(source, destination)
+            return
+        # modifying the file in an experiment would change the source
+        make_read_only(destination)
+
+    def _reflink(self, source: str, destination: str):
+        if fcntl is None:
+            shutil.copyfile(source, destination)
+            return
+        self._remove_existing(destination)
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return
+            except OSError:
+                pass
+        shutil.copyfile(source, destination)
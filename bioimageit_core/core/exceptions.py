@@ -32,3 +32,9 @@ class RunnerExecError(Exception):
     """Raised when an error occur during a runner execution"""
 
     pass
+
+
+class PipelineError(Exception):
+    """Raised when a pipeline is not valid"""
+
+    pass
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT file lock module.
+
+This module implements an exclusive lock shared between processes, based
+on a lock file. It is used when several processes (or threads) can create
+the same resource, ex: a conda environment.
+
+Example
+-------
+    >>> with FileLock('/home/user/miniconda3/.bioimageit_locks/myenv.lock'):
+    ...     create_env('myenv')
+
+Classes
+-------
+FileLock
+
+"""
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive lock on a file
+
+    The lock is released when the file is closed, so it cannot stay locked
+    after the process that holds it ended
+
+    Parameters
+    ----------
+    path: str
+        Path of the lock file. It is created if it does not exists
+    timeout: float
+        Maximum time to wait for the lock in seconds. Wait without limit if
+        negative
+    poll_interval: float
+        Time between two attempts to get the lock in seconds
+
+    """
+    def __init__(self, path: str, timeout: float = -1, poll_interval: float = 0.1):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._file = None
+
+    def _try_lock(self, file) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def acquire(self):
+        """Wait for the lock
+
+        Raises
+        ------
+        TimeoutError if the lock is not obtained before the timeout
+
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        file = open(self.path, 'a')
+        start = time.monotonic()
+        while not self._try_lock(file):
+            if 0 <= self.timeout < time.monotonic() - start:
+                file.close()
+                raise TimeoutError(f'Cannot lock {self.path} after {self.timeout}s')
+            time.sleep(self.poll_interval)
+        self._file = file
+
+    def release(self):
+        """Release the lock"""
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def is_locked(self) -> bool:
+        """True if this object holds the lock"""
+        return self._file is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
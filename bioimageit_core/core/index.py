@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT key-value index module.
+
+This module implements an index of the data of a dataset. The index stores
+the name and the key-value pairs of each data so that a query can be run
+without opening the data metadata files. It provides an inverted index
+(key -> value -> data) for equality queries and sorted numeric values for
+range queries. Both are built in memory from the stored entries.
+
+The index file is written only when the index is compacted. In between, the
+modified entries are appended to a delta file (data.idx.jsonl), with one
+json line per entry, that is applied when the index is read.
+
+Example
+-------
+    >>> index = KeyValueIndex.load(index_path('myexperiment/data'))
+    >>> index.equal('Population', 'population1')
+    {'population1_001.md.json', 'population1_002.md.json'}
+    >>> index.range('number', '<=', 2)
+    {'population1_001.md.json'}
+
+Methods
+-------
+index_path
+
+Classes
+-------
+KeyValueIndex
+
+"""
+import os
+import json
+import bisect
+
+from bioimageit_core.core.query import SearchContainer
+
+INDEX_DIR = '.index'
+INDEX_VERSION = 1
+
+
+def index_path(dataset_dir: str) -> str:
+    """Get the path of the index file of a dataset
+
+    The indexes are stored in the .index directory of the experiment to keep
+    the datasets directories unchanged
+
+    Parameters
+    ----------
+    dataset_dir: str
+        Directory of the dataset
+
+    Returns
+    -------
+    The path of the index (ex: myexperiment/.index/data.idx.json)
+
+    """
+    dataset_dir = os.path.abspath(dataset_dir)
+    return os.path.join(os.path.dirname(dataset_dir), INDEX_DIR,
+                        os.path.basename(dataset_dir) + '.idx.json')
+
+
+class KeyValueIndex:
+    """Index of the key-value pairs of the data of a dataset
+
+    Entries are identified by the URL of the data metadata file relative to
+    the dataset directory
+
+    Attributes
+    ----------
+    entries: dict
+        {url: {'uuid': str, 'name': str, 'key_value_pairs': dict}}
+    delta_count: int
+        Number of entries in the delta file
+    delta_size: int
+        Size in bytes of the delta file when it was last read or written
+
+    """
+    def __init__(self):
+        self.entries = dict()
+        self.delta_count = 0
+        self.delta_size = 0
+        self._inverted = None
+        self._numeric = dict()
+
+    @staticmethod
+    def delta_path(path: str) -> str:
+        """Get the path of the delta file of an index (ex: data.idx.jsonl)"""
+        return path + 'l'
+
+    @staticmethod
+    def load(path: str):
+        """Read an index from a json file
+
+        Parameters
+        ----------
+        path: str
+            Path of the index file
+
+        Returns
+        -------
+        The KeyValueIndex or None if the file is not a valid index
+
+        """
+        delta_path = KeyValueIndex.delta_path(path)
+        try:
+            with open(path) as file:
+                content = json.load(file)
+        except FileNotFoundError:
+            if not os.path.isfile(delta_path):
+                return None
+            content = {'version': INDEX_VERSION, 'data': dict()}
+        except (OSError, ValueError):
+            return None
+        if content.get('version') != INDEX_VERSION:
+            return None
+        index = KeyValueIndex()
+        index.entries = content['data']
+        index._apply_delta(delta_path)
+        return index
+
+    def _apply_delta(self, delta_path: str):
+        """Apply the entries of the delta file
+
+        A truncated line (interrupted append) is ignored
+
+        """
+        try:
+            file = open(delta_path)
+        except FileNotFoundError:
+            return
+        with file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                url = entry.pop('url')
+                if entry.get('removed'):
+                    self.entries.pop(url, None)
+                else:
+                    self.entries[url] = entry
+                self.delta_count += 1
+            self.delta_size = os.fstat(file.fileno()).st_size
+
+    def append(self, path: str, urls: list):
+        """Append the current state of some entries to the delta file
+
+        Parameters
+        ----------
+        path: str
+            Path of the index file
+        urls: list
+            URLs of the entries added, modified or removed since the index
+            was read
+
+        """
+        lines = []
+        for url in urls:
+            entry = self.entries.get(url)
+            if entry is None:
+                lines.append(json.dumps({'url': url, 'removed': True}))
+            else:
+                lines.append(json.dumps(dict(entry, url=url)))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(KeyValueIndex.delta_path(path), 'a+') as file:
+            size = file.tell()
+            if size > 0:
+                # end the truncated line of an interrupted append
+                file.seek(size - 1)
+                if file.read(1) != '\n':
+                    lines.insert(0, '')
+            file.write('\n'.join(lines) + '\n')
+            self.delta_size = file.tell()
+        self.delta_count += len(lines)
+
+    def save(self, path: str):
+        """Write the index to a json file
+
+        Parameters
+        ----------
+        path: str
+            Path of the index file
+
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'version': INDEX_VERSION, 'data': self.entries}, file)
+        os.replace(tmp_path, path)
+        # the index file now contains the entries of the delta
+        delta_path = KeyValueIndex.delta_path(path)
+        if os.path.isfile(delta_path):
+            os.remove(delta_path)
+        self.delta_count = 0
+        self.delta_size = 0
+
+    def set(self, url: str, uuid: str, name: str, key_value_pairs: dict):
+        """Add or replace a data in the index
+
+        Parameters
+        ----------
+        url: str
+            URL of the data metadata file relative to the dataset directory
+        uuid: str
+            UUID of the data
+        name: str
+            Name of the data
+        key_value_pairs: dict
+            Key-value pairs of the data
+
+        """
+        self.entries[url] = {'uuid': uuid, 'name': name,
+                             'key_value_pairs': dict(key_value_pairs)}
+        self._clear()
+
+    def remove(self, url: str):
+        """Remove a data from the index"""
+        if self.entries.pop(url, None) is not None:
+            self._clear()
+
+    def _clear(self):
+        self._inverted = None
+        self._numeric = dict()
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _inverted_index(self):
+        if self._inverted is None:
+            inverted = dict()
+            for url, entry in self.entries.items():
+                for key, value in entry['key_value_pairs'].items():
+                    inverted.setdefault(key, dict()).setdefault(value, set()).add(url)
+            self._inverted = inverted
+        return self._inverted
+
+    def _numeric_index(self, key: str):
+        if key not in self._numeric:
+            pairs = []
+            for value, urls in self._inverted_index().get(key, {}).items():
+                try:
+                    number = float(str(value).replace(' ', ''))
+                except ValueError:
+                    continue
+                pairs.extend((number, url) for url in urls)
+            pairs.sort()
+            self._numeric[key] = ([pair[0] for pair in pairs], [pair[1] for pair in pairs])
+        return self._numeric[key]
+
+    def equal(self, key: str, value: str) -> set:
+        """Get the data where key=value
+
+        Returns
+        -------
+        set of the data urls
+
+        """
+        return set(self._inverted_index().get(key, {}).get(value, set()))
+
+    def range(self, key: str, operator: str, number: float) -> set:
+        """Get the data where the numeric value of key satisfies the comparison
+
+        Parameters
+        ----------
+        key: str
+            Key of the key-value pairs
+        operator: str
+            One of <, <=, >, >=
+        number: float
+            Value to compare with
+
+        Returns
+        -------
+        set of the data urls
+
+        """
+        values, urls = self._numeric_index(key)
+        if operator == '<':
+            return set(urls[:bisect.bisect_left(values, number)])
+        if operator == '<=':
+            return set(urls[:bisect.bisect_right(values, number)])
+        if operator == '>':
+            return set(urls[bisect.bisect_right(values, number):])
+        if operator == '>=':
+            return set(urls[bisect.bisect_left(values, number):])
+        raise ValueError(f'Unknown operator {operator}')
+
+    def search_container(self, url: str, md_uri: str, keys: list = None):
+        """Create the SearchContainer of a data from the index
+
+        Parameters
+        ----------
+        url: str
+            URL of the data in the index
+        md_uri: str
+            URI of the data metadata file
+        keys: list
+            Keys of the experiment. The missing keys are added with an empty
+            value as in the data read from the metadata files
+
+        Returns
+        -------
+        SearchContainer of the data
+
+        """
+        entry = self.entries[url]
+        info = SearchContainer()
+        info.data['name'] = entry['name']
+        info.data['uri'] = md_uri
+        info.data['uuid'] = entry['uuid']
+        key_value_pairs = dict(entry['key_value_pairs'])
+        if keys is not None:
+            for key in keys:
+                if key not in key_value_pairs:
+                    key_value_pairs[key] = ''
+        info.data['key_value_pairs'] = key_value_pairs
+        return info
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT lineage module.
+
+This module implements the lineage of the processed data. Each processed
+data stores a snapshot of the raw data at the origin of its processing
+chain (root), so the origin of a data is found without reading the
+intermediate processed data. The methods work with any metadata service.
+
+Example
+-------
+    >>> processed_data.root = lineage_root(data_service, processed_data)
+    >>> backfill_lineage(data_service, experiment)
+
+Methods
+-------
+lineage_root
+backfill_lineage
+
+"""
+from bioimageit_core.containers.data_containers import (METADATA_TYPE_RAW,
+                                                        ProcessedDataRootContainer)
+
+
+def lineage_root(data_service, processed_data, parents: dict = None):
+    """Get the root raw data of a processed data
+
+    The processing chain is walked back only until a data with a recorded
+    root is found
+
+    Parameters
+    ----------
+    data_service
+        Metadata service
+    processed_data: ProcessedData
+        Container of the processed data
+    parents: dict
+        Parents already read {md_uri: data}. The parents read by this method
+        are added to it
+
+    Returns
+    -------
+    The ProcessedDataRootContainer of the root raw data, or None if the
+    processed data has no input
+
+    """
+    if parents is None:
+        parents = dict()
+    data = processed_data
+    while data is not None:
+        if getattr(data, 'root', None) is not None:
+            return data.root
+        if len(data.inputs) == 0:
+            return None
+        input_ = data.inputs[0]
+        parent = parents.get(input_.uri)
+        if parent is None:
+            if input_.type == METADATA_TYPE_RAW:
+                parent = data_service.get_raw_data(input_.uri)
+            else:
+                parent = data_service.get_processed_data(input_.uri)
+            parents[input_.uri] = parent
+        if input_.type == METADATA_TYPE_RAW:
+            if parent is None:
+                return None
+            return ProcessedDataRootContainer(parent.md_uri, parent.uuid, parent.name,
+                                              parent.key_value_pairs)
+        data = parent
+    return None
+
+
+def backfill_lineage(data_service, experiment) -> int:
+    """Record the root raw data of the processed data of an experiment
+
+    Use it for the experiments created before the lineage was recorded.
+    The processed data that already have a root are not modified
+
+    Parameters
+    ----------
+    data_service
+        Metadata service
+    experiment: Experiment
+        Container of the experiment metadata
+
+    Returns
+    -------
+    The number of processed data updated
+
+    """
+    parents = dict()
+    count = 0
+    for dataset_info in experiment.processed_datasets:
+        dataset = data_service.get_dataset(dataset_info.url)
+        for data_info in dataset.uris:
+            processed_data = parents.get(data_info.md_uri)
+            if processed_data is None:
+                processed_data = data_service.get_processed_data(data_info.md_uri)
+                parents[data_info.md_uri] = processed_data
+            if processed_data is None or processed_data.root is not None:
+                continue
+            root = lineage_root(data_service, processed_data, parents)
+            if root is not None:
+                processed_data.root = root
+                data_service.update_processed_data(processed_data)
+                count += 1
+    return count
@@ -1,4 +1,5 @@
 import sys
+import threading
 
 
 class Observer:
@@ -112,17 +113,21 @@ class Observable:
         self._observers = []
         self._progress_message = ''
         self.job_count = 0
+        self._job_lock = threading.Lock()
 
     def new_job(self):
         """Create a new job
 
-        Generate a new job ID and notify all the observers of this new job
+        Generate a new job ID and notify all the observers of this new job.
+        The jobs can be created by several threads
 
         """
-        self.job_count += 1
+        with self._job_lock:
+            self.job_count += 1
+            job_id = self.job_count
         for observer in self._observers:
-            observer.new_job(self.job_count)
-        return self.job_count
+            observer.new_job(job_id)
+        return job_id
 
     def observers_count(self):
         """Get the number of observers"""
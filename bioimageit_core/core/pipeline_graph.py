@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT pipeline graph module.
+
+This module implements the scheduling of the steps of a pipeline. The steps
+form a directed acyclic graph: a step depends on the steps that create the
+datasets used as its inputs. The graph is checked before running anything
+(missing input datasets and cycles), and the steps run as soon as the steps
+they depend on are finished, several at a time when they are independent.
+
+Example
+-------
+    >>> graph = PipelineGraph(pipeline.steps, datasets=['data'])
+    >>> graph.schedule()
+    [['denoise', 'threshold'], ['measure']]
+    >>> summary = graph.execute(run_step, max_workers=2)
+
+Classes
+-------
+PipelineGraph
+
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from bioimageit_core.core.exceptions import PipelineError
+from bioimageit_core.containers.pipeline_containers import PipelineSummary
+
+
+class PipelineGraph:
+    """Dependency graph of the steps of a pipeline
+
+    Parameters
+    ----------
+    steps: list
+        The PipelineStep of the pipeline
+    datasets: list
+        Names of the datasets that exist before the pipeline runs. The raw
+        dataset 'data' always exists
+
+    Attributes
+    ----------
+    dependencies: list
+        Indexes of the steps each step depends on
+    dependents: list
+        Indexes of the steps depending on each step
+    producers: dict
+        Index of the step creating each output dataset {dataset name: index}
+
+    Raises
+    ------
+    PipelineError if an input dataset is neither an existing dataset nor the
+    output of a step, if two steps have the same output dataset, or if the
+    steps dependencies contain a cycle
+
+    """
+    def __init__(self, steps: list, datasets: list = None):
+        self.steps = list(steps)
+        self.dependencies = [set() for _ in self.steps]
+        self.dependents = [set() for _ in self.steps]
+        self.producers = dict()
+        self._levels = None
+        self._build(set(datasets or []) | {'data'})
+
+    def _build(self, datasets: set):
+        producers = self.producers
+        for i, step in enumerate(self.steps):
+            name = step.output_dataset_name
+            if name == '' or name == 'data':
+                raise PipelineError(f'The step {step.name} has no valid output dataset name')
+            if name in producers:
+                raise PipelineError(f'The steps {self.steps[producers[name]].name} and '
+                                    f'{step.name} have the same output dataset {name}')
+            producers[name] = i
+        for i, step in enumerate(self.steps):
+            for input_ in step.inputs:
+                producer = producers.get(input_.dataset)
+                if producer is not None:
+                    self.dependencies[i].add(producer)
+                    self.dependents[producer].add(i)
+                elif input_.dataset not in datasets:
+                    raise PipelineError(f'The input {input_.name} of the step {step.name} '
+                                        f'uses the dataset {input_.dataset} that does not '
+                                        f'exist and is not created by the pipeline')
+        self.levels()
+
+    def levels(self) -> list:
+        """Group the steps by level
+
+        The steps of level 0 have no dependency, and the steps of level n
+        depend on at least one step of level n-1
+
+        Returns
+        -------
+        list of the lists of steps indexes of each level
+
+        """
+        if self._levels is not None:
+            return self._levels
+        remaining = [len(dependencies) for dependencies in self.dependencies]
+        level = [i for i, count in enumerate(remaining) if count == 0]
+        levels = []
+        visited = 0
+        while level:
+            levels.append(level)
+            visited += len(level)
+            next_level = []
+            for i in level:
+                for dependent in sorted(self.dependents[i]):
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        next_level.append(dependent)
+            level = sorted(next_level)
+        if visited < len(self.steps):
+            names = [self.steps[i].name for i, count in enumerate(remaining) if count > 0]
+            raise PipelineError(f'The steps {", ".join(names)} depend on each other (cycle)')
+        self._levels = levels
+        return levels
+
+    def schedule(self) -> list:
+        """Get the names of the steps grouped by level (see levels)"""
+        return [[self.steps[i].name for i in level] for level in self.levels()]
+
+    def execute(self, run_step, max_workers: int = 0, errors: tuple = (Exception,),
+                streamed: set = None):
+        """Run the steps of the pipeline
+
+        A step starts as soon as all the steps it depends on are finished.
+        The steps marked as already_ran are not run again. When a step
+        fails, the steps depending on it that are not started are skipped
+
+        Parameters
+        ----------
+        run_step: callable
+            Function that runs one step: run_step(step). The returned value
+            is stored in the summary jobs
+        max_workers: int
+            Maximum number of steps running at the same time. All the ready
+            steps run at the same time if 0
+        errors: tuple
+            Exception types raised by run_step when a step fails
+        streamed: set
+            Indexes of the steps that start at the same time as the step
+            they depend on, and receive its outputs while they are created.
+            These steps must have only one dependency. All the steps run at
+            the same time can then be needed, so max_workers is ignored
+
+        Returns
+        -------
+        The PipelineSummary of the execution
+
+        """
+        summary = PipelineSummary(self.schedule())
+        remaining = [len(dependencies) for dependencies in self.dependencies]
+        ready = [i for i in self.levels()[0]]
+        streamed = streamed or set()
+        started = set()
+        blocked = set()
+        start = time.perf_counter()
+
+        # the worker threads only run the steps: the summary and the steps
+        # are modified by this thread, when the futures are done
+        def timed_run(i):
+            step_start = time.perf_counter()
+            try:
+                result = run_step(self.steps[i])
+            except errors as err:
+                return step_start, time.perf_counter(), err, None
+            return step_start, time.perf_counter(), None, result
+
+        def skip_dependents(i):
+            for dependent in self.dependents[i]:
+                if dependent not in blocked and dependent not in started:
+                    blocked.add(dependent)
+                    summary.skipped.append(self.steps[dependent].name)
+                    skip_dependents(dependent)
+
+        if max_workers <= 0 or streamed:
+            max_workers = max(1, len(self.steps))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = dict()
+            while ready or futures:
+                for i in ready:
+                    if self.steps[i].already_ran:
+                        # considered finished: release its dependents now
+                        futures[executor.submit(lambda: None)] = i
+                        continue
+                    summary.order.append(self.steps[i].name)
+                    started.add(i)
+                    futures[executor.submit(timed_run, i)] = i
+                    # the streamed steps are appended to ready and started in this loop
+                    for dependent in sorted(self.dependents[i] & streamed):
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0 and dependent not in blocked:
+                            ready.append(dependent)
+                ready = []
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = futures.pop(future)
+                    step = self.steps[i]
+                    if i in started:
+                        step_start, step_end, error, result = future.result()
+                        summary.timings[step.name] = (step_start - start, step_end - step_start)
+                        if error is not None:
+                            summary.failed[step.name] = str(error)
+                            skip_dependents(i)
+                            continue
+                        summary.jobs[step.name] = result
+                        step.already_ran = True
+                    for dependent in sorted(self.dependents[i]):
+                        if dependent in streamed and i in started:
+                            continue
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0 and dependent not in blocked:
+                            ready.append(dependent)
+        summary.duration = time.perf_counter() - start
+        return summary
@@ -1,3 +1,42 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT data query module.
+
+This module implements the queries on the data key-value pairs. A query
+string is compiled once into a tree of conditions and evaluated on a
+columnar view of the data (QueryTable).
+
+Query syntax
+------------
+    key=value           value equals (string comparison)
+    key!=value          value differs
+    key<value           numeric comparisons (also <=, >, >=)
+    key~regex           the value matches the regular expression
+    key in (v1, v2)     the value is one of the list
+    name=value          the data name contains value, or matches value if
+                        value is a glob pattern (ex: name=*_001.tif)
+    A AND B, A OR B, NOT A, (A OR B) AND C
+
+Example
+-------
+    >>> query = compile_query('Population=population1 AND (number<=2 OR number>10)')
+    >>> selected = query.select(search_list)
+
+Classes
+-------
+SearchContainer
+QueryTable
+Query
+
+Methods
+-------
+compile_query
+query_list_single
+
+"""
+import re
+import fnmatch
+from functools import lru_cache
+
 from bioimageit_core.core.exceptions import DataQueryError
 
 
@@ -71,17 +110,482 @@ class SearchContainer:
         return ''
 
 
+class QueryTable:
+    """Columnar view of a list of SearchContainer
+
+    The values of each key are stored in a column. The numeric conversion of
+    a column is done once, the first time a numeric comparison uses it
+
+    Parameters
+    ----------
+    search_list: list
+        List of SearchContainer
+
+    """
+    def __init__(self, search_list: list):
+        self.search_list = search_list
+        self.names = [info.name() for info in search_list]
+        self._columns = {}
+        self._numeric_columns = {}
+
+    def __len__(self):
+        return len(self.search_list)
+
+    def column(self, key: str) -> list:
+        """Get the values of a key (None when a data does not have the key)"""
+        if key == 'name':
+            return self.names
+        if key not in self._columns:
+            self._columns[key] = [info.data['key_value_pairs'].get(key)
+                                  for info in self.search_list]
+        return self._columns[key]
+
+    def numeric_column(self, key: str) -> list:
+        """Get the values of a key converted to float (None if not a number)"""
+        if key not in self._numeric_columns:
+            self._numeric_columns[key] = [_to_float(value) for value in self.column(key)]
+        return self._numeric_columns[key]
+
+    def select(self, indices) -> list:
+        """Get the SearchContainer at the given indices in the table order"""
+        return [self.search_list[i] for i in sorted(indices)]
+
+
+def _to_float(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(str(value).replace(' ', ''))
+    except ValueError:
+        return None
+
+
+def _unquote(value: str) -> str:
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'"):
+        return value[1:-1]
+    return value
+
+
+_NUMERIC_OPERATORS = {
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+class Condition:
+    """Condition on the value of one key
+
+    Parameters
+    ----------
+    key: str
+        Key of the key-value pair (or 'name' for the data name)
+    operator: str
+        One of =, !=, <, <=, >, >=, ~, in
+    value: str or list
+        Value to compare with (a list for the 'in' operator)
+
+    """
+    def __init__(self, key: str, operator: str, value):
+        self.key = key
+        self.operator = operator
+        self.value = value
+        self._number = None
+        self._regex = None
+        if operator in _NUMERIC_OPERATORS:
+            self._number = _to_float(value)
+            if self._number is None:
+                raise DataQueryError(f'Error: the query {key}{operator}{value} is not '
+                                     f'correct. The value must be a number')
+        elif operator == '~':
+            try:
+                self._regex = re.compile(value)
+            except re.error as err:
+                raise DataQueryError(f'Error: the query {key}~{value} is not correct: {err}')
+        elif operator == 'in':
+            self.value = set(value)
+        elif key == 'name' and operator in ('=', '!=') and \
+                any(char in value for char in '*?['):
+            self._regex = re.compile(fnmatch.translate(value))
+
+    def evaluate(self, table: QueryTable, candidates: set = None) -> set:
+        """Get the indices of the data of the table that match the condition
+
+        Parameters
+        ----------
+        table: QueryTable
+            Columnar view of the data
+        candidates: set
+            If not None, only the data at these indices are tested
+
+        """
+        if self.operator in _NUMERIC_OPERATORS:
+            column = table.numeric_column(self.key)
+        else:
+            column = table.column(self.key)
+        if candidates is None:
+            items = enumerate(column)
+        else:
+            items = ((i, column[i]) for i in candidates)
+
+        if self.operator in _NUMERIC_OPERATORS:
+            compare = _NUMERIC_OPERATORS[self.operator]
+            number = self._number
+            return {i for i, value in items if value is not None and compare(value, number)}
+        if self.key == 'name' and self.operator in ('=', '!='):
+            # the name is searched as a substring or a glob pattern
+            if self._regex is not None:
+                match = self._regex.match
+                matched = [(i, match(name) is not None) for i, name in items]
+            else:
+                matched = [(i, self.value in name) for i, name in items]
+            keep = self.operator == '='
+            return {i for i, is_matched in matched if is_matched == keep}
+        if self.operator == '=':
+            return {i for i, value in items if value == self.value}
+        if self.operator == '!=':
+            return {i for i, value in items if value is not None and value != self.value}
+        if self.operator == 'in':
+            return {i for i, value in items if value in self.value}
+        search = self._regex.search
+        return {i for i, value in items if value is not None and search(str(value))}
+
+    def candidates(self, index):
+        """Get the data that may match the condition from a KeyValueIndex
+
+        Returns
+        -------
+        set of the data urls, or None if the index cannot select the data
+
+        """
+        if self.key == 'name':
+            return None
+        if self.operator in _NUMERIC_OPERATORS:
+            return index.range(self.key, self.operator, self._number)
+        # data without the key have an empty value when they are read
+        if self.operator == '=' and self.value != '':
+            return index.equal(self.key, self.value)
+        if self.operator == 'in' and '' not in self.value:
+            selected = set()
+            for value in self.value:
+                selected |= index.equal(self.key, value)
+            return selected
+        return None
+
+    def keys(self):
+        return {self.key}
+
+    def __repr__(self):
+        return f'Condition({self.key!r}, {self.operator!r}, {self.value!r})'
+
+
+class And:
+    """Intersection of conditions"""
+    def __init__(self, children: list):
+        self.children = children
+
+    def evaluate(self, table: QueryTable, candidates: set = None) -> set:
+        selected = candidates
+        for child in self.children:
+            if selected is not None and not selected:
+                break
+            # each condition only tests the data selected by the previous ones
+            selected = child.evaluate(table, selected)
+        return selected
+
+    def candidates(self, index):
+        selected = None
+        for child in self.children:
+            child_selected = child.candidates(index)
+            if child_selected is not None:
+                selected = child_selected if selected is None else selected & child_selected
+        return selected
+
+    def keys(self):
+        return set().union(*[child.keys() for child in self.children])
+
+
+class Or:
+    """Union of conditions"""
+    def __init__(self, children: list):
+        self.children = children
+
+    def evaluate(self, table: QueryTable, candidates: set = None) -> set:
+        selected = set()
+        for child in self.children:
+            selected |= child.evaluate(table, candidates)
+        return selected
+
+    def candidates(self, index):
+        selected = set()
+        for child in self.children:
+            child_selected = child.candidates(index)
+            if child_selected is None:
+                return None
+            selected |= child_selected
+        return selected
+
+    def keys(self):
+        return set().union(*[child.keys() for child in self.children])
+
+
+class Not:
+    """Complement of a condition"""
+    def __init__(self, child):
+        self.child = child
+
+    def evaluate(self, table: QueryTable, candidates: set = None) -> set:
+        if candidates is None:
+            candidates = set(range(len(table)))
+        return candidates - self.child.evaluate(table, candidates)
+
+    def candidates(self, index):
+        return None
+
+    def keys(self):
+        return self.child.keys()
+
+
+class All:
+    """Empty query: select all the data"""
+    def evaluate(self, table: QueryTable, candidates: set = None) -> set:
+        if candidates is None:
+            return set(range(len(table)))
+        return set(candidates)
+
+    def candidates(self, index):
+        return None
+
+    def keys(self):
+        return set()
+
+
+_KEYWORD = re.compile(r'(AND|OR|NOT)(?=[\s(]|$)')
+_IN_CONDITION = re.compile(r'^([^\s=!<>~]+)\s+in\s+(.+)$', re.DOTALL)
+_CONDITION = re.compile(r'^([^\s=!<>~]+)\s*(<=|>=|!=|=|<|>|~)\s*(.*)$', re.DOTALL)
+
+
+def _tokenize(query: str) -> list:
+    """Split a query into parenthesis, boolean keywords and conditions"""
+    tokens = []
+    pos = 0
+    length = len(query)
+    while pos < length:
+        char = query[pos]
+        if char.isspace():
+            pos += 1
+        elif char in '()':
+            tokens.append(char)
+            pos += 1
+        elif _KEYWORD.match(query, pos):
+            keyword = _KEYWORD.match(query, pos).group(1)
+            tokens.append(keyword)
+            pos += len(keyword)
+        else:
+            # a condition ends at a closing parenthesis or a boolean keyword
+            start = pos
+            depth = 0
+            quote = None
+            while pos < length:
+                char = query[pos]
+                if quote is not None:
+                    if char == quote:
+                        quote = None
+                elif char in ('"', "'"):
+                    quote = char
+                elif char == '(':
+                    depth += 1
+                elif char == ')':
+                    if depth == 0:
+                        break
+                    depth -= 1
+                elif char.isspace() and depth == 0 and \
+                        re.match(r'\s+(AND|OR)(?=[\s(]|$)', query[pos:]):
+                    break
+                pos += 1
+            tokens.append(('condition', query[start:pos].strip()))
+    return tokens
+
+
+def _parse_condition(text: str) -> Condition:
+    match = _IN_CONDITION.match(text)
+    if match:
+        values = match.group(2).strip()
+        if values[:1] in ('(', '[') and values[-1:] in (')', ']'):
+            values = values[1:-1]
+        return Condition(match.group(1), 'in',
+                         [_unquote(value) for value in values.split(',') if value.strip()])
+    match = _CONDITION.match(text)
+    if not match:
+        raise DataQueryError(f'Error: the query {text} is not correct. Must be '
+                             f'(key=value), (key<value), (key in (v1, v2))...')
+    return Condition(match.group(1), match.group(2), _unquote(match.group(3)))
+
+
+class _Parser:
+    """Recursive descent parser of the query tokens"""
+    def __init__(self, query: str):
+        self.query = query
+        self.tokens = _tokenize(query)
+        self.pos = 0
+
+    def _peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def _error(self, message):
+        raise DataQueryError(f'Error: the query {self.query} is not correct: {message}')
+
+    def parse(self):
+        if not self.tokens:
+            return All()
+        node = self._or()
+        if self._peek() is not None:
+            self._error(f'unexpected {self._peek()!r}')
+        return node
+
+    def _or(self):
+        children = [self._and()]
+        while self._peek() == 'OR':
+            self.pos += 1
+            children.append(self._and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def _and(self):
+        children = [self._not()]
+        while self._peek() == 'AND':
+            self.pos += 1
+            children.append(self._not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def _not(self):
+        token = self._peek()
+        if token == 'NOT':
+            self.pos += 1
+            return Not(self._not())
+        if token == '(':
+            self.pos += 1
+            node = self._or()
+            if self._peek() != ')':
+                self._error('missing )')
+            self.pos += 1
+            return node
+        if isinstance(token, tuple):
+            self.pos += 1
+            return _parse_condition(token[1])
+        if token is None:
+            self._error('missing condition at the end')
+        self._error(f'unexpected {token!r}')
+
+
+class Query:
+    """Compiled query
+
+    Use compile_query to create a Query from a string
+
+    Parameters
+    ----------
+    query: str
+        Query string
+    root:
+        Root node of the conditions tree
+
+    """
+    def __init__(self, query: str, root):
+        self.query = query
+        self.root = root
+
+    def keys(self) -> set:
+        """Get the keys used in the query"""
+        return self.root.keys()
+
+    def evaluate(self, table: QueryTable) -> set:
+        """Get the indices of the data of the table selected by the query"""
+        return self.root.evaluate(table)
+
+    def candidates(self, index):
+        """Preselect the data with a KeyValueIndex
+
+        The preselection contains all the data matching the query, but it
+        may contain data that do not match. Use select to filter them
+
+        Parameters
+        ----------
+        index: KeyValueIndex
+            Index of the dataset
+
+        Returns
+        -------
+        set of the data urls in the index, or None if the index cannot
+        preselect the data
+
+        """
+        return self.root.candidates(index)
+
+    def select(self, search_list) -> list:
+        """Select the data matching the query
+
+        Parameters
+        ----------
+        search_list: list or QueryTable
+            data search list (list of SearchContainer)
+
+        Returns
+        -------
+        list
+            list of selected SearchContainer in the order of search_list
+
+        """
+        table = search_list
+        if not isinstance(search_list, QueryTable):
+            table = QueryTable(search_list)
+        return table.select(self.evaluate(table))
+
+
+@lru_cache(maxsize=256)
+def compile_query(query: str) -> Query:
+    """Parse a query string
+
+    Compiled queries are cached, so compiling the same string again is free
+
+    Parameters
+    ----------
+    query: str
+        Query string (see the module documentation for the syntax)
+
+    Returns
+    -------
+    Query
+        The compiled query
+
+    Raises
+    ------
+    DataQueryError
+        If the query syntax is not correct
+
+    """
+    return Query(query, _Parser(query).parse())
+
+
 def query_list_single(search_list, query):
     """query internal function
 
-    Search if the query is on the search_list
+    Search if the query is on the search_list. It is kept for compatibility,
+    use compile_query to run a query several times
 
     Parameters
     ----------
     search_list: list
         data search list (list of SearchContainer)
     query: str
-        String query with the key=value format. No 'AND', 'OR'...
+        String query with the key=value format
 
     Returns
     -------
@@ -89,93 +593,4 @@ def query_list_single(search_list, query):
         list of selected SearchContainer
 
     """
-    selected_list = list()
-
-    if 'name' in query:
-        split_query = query.split('=')
-        if len(split_query) != 2:
-            raise DataQueryError(
-                'Error: the query ' + query +
-                ' is not correct. Must be (key<=value)'
-            )
-        value = split_query[1]
-        for i in range(len(search_list)):
-            if value in search_list[i].name():
-                selected_list.append(search_list[i])
-        return selected_list
-
-    if "<=" in query:
-        split_query = query.split('<=')
-        if len(split_query) != 2:
-            raise DataQueryError(
-                'Error: the query ' + query +
-                ' is not correct. Must be (key<=value)'
-            )
-        key = split_query[0]
-        value = float(split_query[1].replace(' ', ''))
-        for i in range(len(search_list)):
-            if (
-                search_list[i].is_key(key)
-                and float(search_list[i].value(key).replace(' ', '')) <= value
-            ):
-                selected_list.append(search_list[i])
-
-    elif ">=" in query:
-        split_query = query.split('>=')
-        if len(split_query) != 2:
-            raise DataQueryError(
-                'Error: the query ' + query +
-                ' is not correct. Must be (key>=value)'
-            )
-        key = split_query[0]
-        value = split_query[1]
-        for i in range(len(search_list)):
-            if search_list[i].is_key(key) and \
-                    float(search_list[i].value(key)) >= float(
-                value
-            ):
-                selected_list.append(search_list[i])
-    elif "=" in query:
-        split_query = query.split('=')
-        if len(split_query) != 2:
-            raise DataQueryError(
-                'Error: the query ' + query +
-                ' is not correct. Must be (key=value)'
-            )
-        key = split_query[0]
-        value = split_query[1]
-        for i in range(len(search_list)):
-            if search_list[i].is_key(key) and search_list[i].value(key) == value:
-                selected_list.append(search_list[i])
-    elif "<" in query:
-        split_query = query.split('<')
-        if len(split_query) != 2:
-            raise DataQueryError(
-                'Error: the query ' + query +
-                ' is not correct. Must be (key<value)'
-            )
-        key = split_query[0]
-        value = split_query[1]
-        for i in range(len(search_list)):
-            if search_list[i].is_key(key) and \
-                    float(search_list[i].value(key)) < float(
-                value
-            ):
-                selected_list.append(search_list[i])
-    elif ">" in query:
-        split_query = query.split('>')
-        if len(split_query) != 2:
-            raise DataQueryError(
-                'Error: the query ' + query +
-                ' is not correct. Must be (key>value)'
-            )
-        key = split_query[0]
-        value = split_query[1]
-        for i in range(len(search_list)):
-            if search_list[i].is_key(key) and \
-                    float(search_list[i].value(key)) > float(
-                value
-            ):
-                selected_list.append(search_list[i])
-
-    return selected_list
+    return compile_query(query).select(search_list)
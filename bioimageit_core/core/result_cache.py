@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT result cache module.
+
+This module implements a workspace level cache of the processing results.
+A result is identified by the tool (name and version), the parameters and
+the content hash of the input data. When a job processes data already
+processed with the same tool and parameters, the outputs are copied (or
+linked) from the cache instead of running the tool again.
+
+Example
+-------
+    >>> cache = ResultCache('/workspace/.bioimageit_results', max_size='10GB')
+    >>> key = cache.key('spitfiredeconv2d_v0.1.2', {'sigma': '4'},
+    ...                 [cache.file_hash('population1_001.tif')])
+    >>> if not cache.get(key, {'o': 'o_population1_001.tif'}):
+    ...     # run the tool
+    ...     cache.put(key, {'o': 'o_population1_001.tif'})
+
+Methods
+-------
+parse_size
+
+Classes
+-------
+ResultCache
+
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import stat
+import hashlib
+import threading
+
+from bioimageit_core.core.cache import FileCache
+from bioimageit_core.core.content_store import file_hash
+from bioimageit_core.core.exceptions import ConfigError
+
+_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4}
+
+
+def parse_size(size) -> int:
+    """Convert a size to a number of bytes
+
+    Parameters
+    ----------
+    size: int or str
+        Number of bytes or string with a unit (ex: '500MB', '10 GB')
+
+    Returns
+    -------
+    The size in bytes
+
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    text = str(size).strip().upper().replace(' ', '')
+    for unit in sorted(_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            try:
+                return int(float(text[:-len(unit)]) * _UNITS[unit])
+            except ValueError:
+                break
+    try:
+        return int(text)
+    except ValueError:
+        raise ConfigError(f'Cannot read the cache size {size}')
+
+
+class ResultCache:
+    """Cache of the processing results
+
+    Each result is stored in <root>/<2 first digits>/<key>/ with an
+    entry.json file describing the outputs. The least recently used results
+    are removed when the size of the cache exceeds max_size
+
+    Parameters
+    ----------
+    root: str
+        Directory of the cache. It is created if it does not exists
+    max_size: int or str
+        Maximum size of the cache in bytes (or with a unit, ex: '10GB').
+        The size is not limited if 0
+    mode: str
+        'copy' to copy the outputs to and from the cache, or 'hardlink' to
+        link them (copy when a link is not possible). A linked output shares
+        its content with the cache and with the other outputs restored from
+        the same result, so the linked files are made read-only
+
+    Attributes
+    ----------
+    hits: int
+        Number of results found in the cache
+    misses: int
+        Number of results not found in the cache
+
+    """
+    ENTRY_FILE = 'entry.json'
+    MODES = ['copy', 'hardlink']
+
+    def __init__(self, root: str, max_size=0, mode: str = 'copy'):
+        if mode not in ResultCache.MODES:
+            raise ConfigError(f'Unknown cache mode {mode}. The mode must '
+                              f'be one of {", ".join(ResultCache.MODES)}')
+        self.root = os.path.abspath(root)
+        self.max_size = parse_size(max_size)
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._entries = None  # {key: [last use time, size]}
+        self._hashes = FileCache(4096)
+        os.makedirs(os.path.join(self.root, 'tmp'), exist_ok=True)
+
+    @staticmethod
+    def key(tool: str, parameters: dict, inputs_hashes: list) -> str:
+        """Compute the key of a result
+
+        Parameters
+        ----------
+        tool: str
+            Full name of the tool (name and version)
+        parameters: dict
+            Values of the tool parameters
+        inputs_hashes: list
+            Content hashes of the input data, in the tool inputs order
+
+        Returns
+        -------
+        The key of the result (hexadecimal sha256)
+
+        """
+        content = json.dumps({'tool': tool,
+                              'parameters': {str(k): str(v) for k, v in parameters.items()},
+                              'inputs': list(inputs_hashes)}, sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def file_hash(self, path: str) -> str:
+        """Compute the content hash of a file
+
+        The hashes are kept in memory while the file is not modified
+
+        """
+        return self._hashes.get(os.path.abspath(path), file_hash)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str, destinations: dict) -> bool:
+        """Copy the outputs of a result from the cache
+
+        Parameters
+        ----------
+        key: str
+            Key of the result
+        destinations: dict
+            Path where each output is copied {output name: path}
+
+        Returns
+        -------
+        True if the result is in the cache and the outputs are copied
+
+        """
+        entry_dir = self._entry_dir(key)
+        entry_file = os.path.join(entry_dir, ResultCache.ENTRY_FILE)
+        # the outputs are copied without the lock, so that the jobs workers
+        # restore their results at the same time
+        restored = []
+        try:
+            with open(entry_file) as file:
+                outputs = json.load(file)['outputs']
+            sources = {name: os.path.join(entry_dir, outputs[name])
+                       for name in destinations}
+            for name, destination in destinations.items():
+                self._transfer(sources[name], destination)
+                restored.append(destination)
+            os.utime(entry_file)
+        except (OSError, ValueError, KeyError):
+            # no partial result: remove the outputs already restored
+            for destination in restored:
+                if os.path.lexists(destination):
+                    os.remove(destination)
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            if self._entries is not None and key in self._entries:
+                self._entries[key][0] = time.time()
+            self.hits += 1
+        return True
+
+    def put(self, key: str, sources: dict) -> bool:
+        """Add a result to the cache
+
+        Parameters
+        ----------
+        key: str
+            Key of the result
+        sources: dict
+            Path of each output {output name: path}
+
+        Returns
+        -------
+        True if the result is added, False if an output file is missing
+
+        """
+        if not all(os.path.isfile(source) for source in sources.values()):
+            return False
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return True
+        tmp_dir = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+        os.makedirs(tmp_dir)
+        try:
+            outputs = dict()
+            size = 0
+            for name, source in sources.items():
+                file_name = name.replace('-', '') + os.path.splitext(source)[1]
+                self._transfer(source, os.path.join(tmp_dir, file_name))
+                outputs[name] = file_name
+                size += os.path.getsize(source)
+            with open(os.path.join(tmp_dir, ResultCache.ENTRY_FILE), 'w') as file:
+                json.dump({'outputs': outputs, 'size': size}, file)
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # added by another process in the meantime
+            return os.path.isdir(entry_dir)
+        with self._lock:
+            entries = self._load_entries()
+            entries[key] = [time.time(), size]
+            self._evict(key)
+        return True
+
+    def size(self) -> int:
+        """Get the size of the results in the cache in bytes"""
+        with self._lock:
+            return sum(entry[1] for entry in self._load_entries().values())
+
+    def __contains__(self, key: str):
+        return os.path.isfile(os.path.join(self._entry_dir(key), ResultCache.ENTRY_FILE))
+
+    def _load_entries(self):
+        """Scan the cache directory the first time the entries are needed"""
+        if self._entries is None:
+            entries = dict()
+            for prefix in os.listdir(self.root):
+                prefix_dir = os.path.join(self.root, prefix)
+                if prefix == 'tmp' or not os.path.isdir(prefix_dir):
+                    continue
+                for key in os.listdir(prefix_dir):
+                    entry_file = os.path.join(prefix_dir, key, ResultCache.ENTRY_FILE)
+                    try:
+                        with open(entry_file) as file:
+                            size = json.load(file)['size']
+                        entries[key] = [os.path.getmtime(entry_file), size]
+                    except (OSError, ValueError, KeyError):
+                        continue
+            self._entries = entries
+        return self._entries
+
+    def _evict(self, keep: str):
+        """Remove the least recently used results above max_size"""
+        if self.max_size <= 0:
+            return
+        entries = self._entries
+        total = sum(entry[1] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k][0]):
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= entries.pop(key)[1]
+
+    def _transfer(self, source: str, destination: str):
+        if os.path.lexists(destination):
+            os.remove(destination)
+        if self.mode == 'hardlink':
+            try:
+                os.link(source, destination)
+            except OSError:
+                pass
+            else:
+                # a modification of the output would change the cached result
+                mode = stat.S_IMODE(os.stat(destination).st_mode)
+                os.chmod(destination, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+                return
+        shutil.copyfile(source, destination)
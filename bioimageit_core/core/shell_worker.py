@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT shell worker module.
+
+This module implements long-lived bash processes used by the runners to
+execute many commands in the same environment. The environment is set up
+once (ex: conda activate) when the worker starts, then each command is
+written to the shell input and its output is read until an end marker that
+contains the exit status of the command. Each command runs in a subshell,
+so a cd, export or exit in a command does not change the next ones.
+
+Example
+-------
+    >>> pool = ShellWorkerPool('. ~/miniconda3/etc/profile.d/conda.sh && conda activate myenv')
+    >>> pool.run('python denoise.py -i "image.tif" -o "denoised.tif"', print)
+    0
+    >>> pool.close()
+
+Classes
+-------
+ShellWorker
+ShellWorkerPool
+
+"""
+import uuid
+import threading
+from subprocess import Popen, PIPE, STDOUT
+
+from bioimageit_core.core.exceptions import RunnerExecError
+
+
+class ShellWorker:
+    """A bash process executing commands one after the other
+
+    Parameters
+    ----------
+    init_command: str
+        Command run once when the shell starts (ex: activate an environment).
+        The worker cannot start if it fails
+    executable: str
+        Path of the shell
+
+    """
+    def __init__(self, init_command: str = '', executable: str = '/bin/bash'):
+        self._marker = f'__bioimageit_end_{uuid.uuid4().hex}__'
+        self._process = Popen([executable], stdin=PIPE, stdout=PIPE, stderr=STDOUT,
+                              bufsize=1, universal_newlines=True)
+        if init_command != '':
+            # not in a subshell: the environment is kept for the commands
+            returncode = self._run(init_command, '{ ', '\n}')
+            if returncode != 0:
+                self.close()
+                raise RunnerExecError(f'return code: {returncode}, for the worker '
+                                      f'initialization: {init_command}')
+
+    def is_alive(self):
+        """True if the shell is running"""
+        return self._process.poll() is None
+
+    def run(self, command: str, on_line=None) -> int:
+        """Execute a command in a subshell
+
+        Parameters
+        ----------
+        command: str
+            Command line. It does not read the standard input of the worker,
+            and its changes of the shell state (directory, variables,
+            options, exit) are not kept
+        on_line: callable
+            Function called with each line written by the command (stdout
+            and stderr)
+
+        Returns
+        -------
+        The exit status of the command
+
+        Raises
+        ------
+        RunnerExecError if the shell stopped during the command
+
+        """
+        return self._run(command, '( ', '\n)', on_line)
+
+    def _run(self, command: str, begin: str, end: str, on_line=None) -> int:
+        """Execute a command in a group ({ }) or a subshell (( ))"""
+        if not self.is_alive():
+            raise RunnerExecError('The shell worker is not running')
+        # the leading newline ensures the marker starts a line
+        self._process.stdin.write(f'{begin}{command}{end} < /dev/null\n'
+                                  f'printf "\\n{self._marker} %d\\n" $?\n')
+        self._process.stdin.flush()
+        previous = None
+        for line in self._process.stdout:
+            line = line.rstrip('\n')
+            if line.startswith(self._marker):
+                if previous and on_line is not None:
+                    on_line(previous)
+                return int(line[len(self._marker):])
+            if previous is not None and on_line is not None:
+                on_line(previous)
+            previous = line
+        raise RunnerExecError(f'The shell worker stopped with code {self._process.wait()} '
+                              f'during the command: {command}')
+
+    def close(self):
+        """Stop the shell"""
+        if self.is_alive():
+            try:
+                self._process.stdin.write('exit\n')
+                self._process.stdin.flush()
+            except OSError:
+                pass
+        try:
+            self._process.communicate(timeout=10)
+        except Exception:
+            self._process.kill()
+            self._process.wait()
+
+
+class ShellWorkerPool:
+    """Pool of ShellWorker started on demand
+
+    A command uses an idle worker, or starts a new one if all the workers
+    are busy, so that commands can be run from several threads
+
+    Parameters
+    ----------
+    init_command: str
+        Command run when each worker starts (see ShellWorker)
+
+    """
+    def __init__(self, init_command: str = ''):
+        self.init_command = init_command
+        self._idle = []
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def run(self, command: str, on_line=None) -> int:
+        """Execute a command in a worker (see ShellWorker.run)"""
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+        if worker is None:
+            worker = ShellWorker(self.init_command)
+            with self._lock:
+                self._workers.append(worker)
+        try:
+            return worker.run(command, on_line)
+        finally:
+            with self._lock:
+                if worker.is_alive():
+                    self._idle.append(worker)
+                else:
+                    self._workers.remove(worker)
+
+    def __len__(self):
+        return len(self._workers)
+
+    def close(self):
+        """Stop all the workers"""
+        with self._lock:
+            workers = self._workers
+            self._workers = []
+            self._idle = []
+        for worker in workers:
+            worker.close()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""BioImageIT tool search module.
+
+This module implements a search index over the tools database, built once
+when the database is loaded. The id, name, categories, description and help
+of the tools are split into lowercase tokens. A query token matches the
+tokens equal to it, starting with it (prefix), or at one edit from it
+(fuzzy, for the tokens of 4 characters or more). The tools matching all the
+query tokens are ranked by the weight of the matched fields and the match
+quality. The index also maps each category to its tools.
+
+Example
+-------
+    >>> index = ToolSearchIndex(tools_service.database)
+    >>> [tool.id for tool in index.search('deconv 2d', limit=3)]
+    ['spitfiredeconv2d', 'richardsonlucy2d', 'wiener2d']
+    >>> index.category_tools('Denoising')
+
+Methods
+-------
+tokenize
+
+Classes
+-------
+ToolSearchIndex
+
+"""
+import re
+import heapq
+import bisect
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+# weight of a match in each field of the tools
+FIELD_WEIGHTS = {'id': 4.0, 'name': 4.0, 'categories': 2.0, 'description': 1.0, 'help': 0.5}
+# factor of the weight for each kind of match
+EXACT, PREFIX, FUZZY = 1.0, 0.6, 0.3
+_FUZZY_MIN_LENGTH = 4
+
+
+def tokenize(text: str) -> list:
+    """Split a text into lowercase alphanumeric tokens
+
+    Parameters
+    ----------
+    text: str
+        Text to split
+
+    Returns
+    -------
+    The list of tokens, in the text order
+
+    """
+    return _TOKEN.findall(text.lower())
+
+
+def _deletes(token: str) -> set:
+    """Strings obtained by removing one character of a token"""
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _edit_distance_one(token1: str, token2: str) -> bool:
+    """True if two different tokens are at one substitution, insertion or deletion"""
+    if abs(len(token1) - len(token2)) > 1:
+        return False
+    if len(token1) > len(token2):
+        token1, token2 = token2, token1
+    i = 0
+    while i < len(token1) and token1[i] == token2[i]:
+        i += 1
+    if len(token1) == len(token2):
+        return token1[i + 1:] == token2[i + 1:]
+    return token1[i:] == token2[i + 1:]
+
+
+class ToolSearchIndex:
+    """Inverted index of the tools main information
+
+    Parameters
+    ----------
+    tools: dict
+        Tools to index {fullname: ToolIndexContainer}
+
+    """
+    def __init__(self, tools: dict = None):
+        self.tools = dict()
+        self._postings = dict()  # {token: {fullname: weight}}
+        self._tokens = []  # sorted tokens, for the prefix search
+        self._deletes = dict()  # {token with one character removed: tokens}
+        self._categories = dict()  # {category: [fullnames]}
+        if tools:
+            self.build(tools)
+
+    def build(self, tools: dict):
+        """Index the tools, replacing the previous content of the index"""
+        self.tools = dict(tools)
+        postings = dict()
+        categories = dict()
+        for fullname, tool in self.tools.items():
+            fields = {'id': tool.id, 'name': tool.name,
+                      'categories': ' '.join(tool.categories),
+                      'description': getattr(tool, 'description', ''),
+                      'help': tool.help or ''}
+            for field, text in fields.items():
+                for token in tokenize(text or ''):
+                    weights = postings.setdefault(token, dict())
+                    weights[fullname] = max(weights.get(fullname, 0), FIELD_WEIGHTS[field])
+            for category in tool.categories:
+                categories.setdefault(category, []).append(fullname)
+        self._postings = postings
+        self._tokens = sorted(postings)
+        self._deletes = dict()
+        for token in self._tokens:
+            if len(token) >= _FUZZY_MIN_LENGTH:
+                for delete in _deletes(token) | {token}:
+                    self._deletes.setdefault(delete, []).append(token)
+        self._categories = categories
+
+    def _matches(self, query_token: str) -> dict:
+        """Score of the tools matching a query token {fullname: score}"""
+        matched = {query_token: EXACT} if query_token in self._postings else dict()
+        tokens = self._tokens
+        for k in range(bisect.bisect_left(tokens, query_token), len(tokens)):
+            token = tokens[k]
+            if not token.startswith(query_token):
+                break
+            if token != query_token:
+                # the closer the token length, the better the prefix match
+                matched[token] = PREFIX * len(query_token) / len(token)
+        if len(query_token) >= _FUZZY_MIN_LENGTH:
+            for delete in _deletes(query_token) | {query_token}:
+                for token in self._deletes.get(delete, []):
+                    if token not in matched and _edit_distance_one(query_token, token):
+                        matched[token] = FUZZY
+        if len(matched) == 1:
+            token, factor = matched.popitem()
+            return {fullname: weight * factor
+                    for fullname, weight in self._postings[token].items()}
+        scores = dict()
+        for token, factor in matched.items():
+            for fullname, weight in self._postings[token].items():
+                score = weight * factor
+                if score > scores.get(fullname, 0):
+                    scores[fullname] = score
+        return scores
+
+    def search(self, query: str, limit: int = 0) -> list:
+        """Search the tools matching a query
+
+        Parameters
+        ----------
+        query: str
+            Words to search. A tool must match all the words
+        limit: int
+            Maximum number of tools returned. No limit if 0
+
+        Returns
+        -------
+        The list of the matching ToolIndexContainer, the most relevant first.
+        All the tools, in the database order, if the query is empty
+
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            results = list(self.tools)
+        else:
+            scores = None
+            for query_token in dict.fromkeys(query_tokens):
+                token_scores = self._matches(query_token)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {fullname: score + token_scores[fullname]
+                              for fullname, score in scores.items()
+                              if fullname in token_scores}
+                if not scores:
+                    break
+            # when no token matches, the tools containing the query in their
+            # full name (as the previous substring search) are returned
+            if not scores:
+                keyword = query.lower()
+                scores = {fullname: FUZZY for fullname in self.tools
+                          if keyword in fullname.lower()}
+
+            def rank(fullname):
+                return -scores[fullname], fullname
+            if 0 < limit < len(scores):
+                results = heapq.nsmallest(limit, scores, key=rank)
+            else:
+                results = sorted(scores, key=rank)
+        if limit > 0:
+            results = results[:limit]
+        return [self.tools[fullname] for fullname in results]
+
+    def category_tools(self, category: str) -> list:
+        """Get the ToolIndexContainer of the tools of a category"""
+        return [self.tools[fullname] for fullname in self._categories.get(category, [])]
+
+    def categories(self) -> list:
+        """Get the categories used by the tools"""
+        return list(self._categories)
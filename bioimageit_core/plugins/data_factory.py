@@ -14,6 +14,7 @@ import pkgutil
 from bioimageit_core.core.factory import ObjectFactory
 from bioimageit_core.plugins.data_local import LocalMetadataServiceBuilder
 from bioimageit_core.plugins.data_fsspec import FsspecMetadataServiceBuilder
+from bioimageit_core.plugins.data_sqlite import SqliteMetadataServiceBuilder
 
 
 class MetadataServiceProvider(ObjectFactory):
@@ -33,6 +34,7 @@ discovered_plugins = {
 metadataServices = MetadataServiceProvider()
 metadataServices.register_builder('LOCAL', LocalMetadataServiceBuilder())
 metadataServices.register_builder('FSSPEC', FsspecMetadataServiceBuilder())
+metadataServices.register_builder('SQLITE', SqliteMetadataServiceBuilder())
 
 for name, module in discovered_plugins.items():
     mod = __import__(name)
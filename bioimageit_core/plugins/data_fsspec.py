@@ -19,6 +19,7 @@ from pathlib import Path
 import json
 import re
 import subprocess
+import threading
 
 import fsspec
 
@@ -33,6 +34,7 @@ from bioimageit_core.containers.data_containers import (METADATA_TYPE_RAW,
                                                         RawData,
                                                         ProcessedData,
                                                         ProcessedDataInputContainer,
+                                                        ProcessedDataRootContainer,
                                                         Dataset,
                                                         Experiment,
                                                         Run,
@@ -55,10 +57,21 @@ class FsspecMetadataServiceBuilder:
 
 
 class FsspecMetadataService:
-    """Service for metadata management using the fsspec library"""
+    """Service for metadata management using the fsspec library
+
+    Attributes
+    ----------
+    run_items_buffer: int
+        Number of run items kept in memory before they are appended to the
+        run journal (see add_run_item)
+
+    """
 
     def __init__(self, file_system, host, port, username, password):
         self.service_name = 'FsspecMetadataService'
+        self.run_items_buffer = 32
+        self._run_items = dict()  # {run journal uri: [json lines]}
+        self._run_items_lock = threading.Lock()
         if file_system == 'local':
             self.fs = fsspec.filesystem('file')
         elif file_system == 'sftp':    
@@ -80,6 +93,7 @@ class FsspecMetadataService:
         with self.fs.open(md_uri, 'w') as outfile:
             json.dump(metadata, outfile, indent=4)
 
+    @staticmethod
     def md_file_path(md_uri):
         """get metadata file directory path
         Parameters
@@ -732,6 +746,12 @@ class FsspecMetadataService:
             if 'label' in metadata['origin']['output']:
                 container.output['label'] = \
                     metadata['origin']['output']['label']
+            # origin root raw data
+            if 'root' in metadata['origin']:
+                root = metadata['origin']['root']
+                container.root = ProcessedDataRootContainer(
+                    self.absolute_path(self.normalize_path_sep(root['url']), md_uri),
+                    root['uuid'], root['name'], root['key_value_pairs'])
 
             return container
         #raise DataServiceError(f'Metadata file format not supported {md_uri}')
@@ -782,6 +802,15 @@ class FsspecMetadataService:
             'name': processed_data.output['name'],
             'label': processed_data.output['label'],
         }
+        # origin root raw data
+        if processed_data.root is not None:
+            metadata['origin']['root'] = {
+                'url': self.to_unix_path(
+                    self.relative_path(processed_data.root.uri, md_uri)),
+                'uuid': processed_data.root.uuid,
+                'name': processed_data.root.name,
+                'key_value_pairs': processed_data.root.key_value_pairs
+            }
 
         self._write_json(metadata, md_uri)
 
@@ -920,8 +949,14 @@ class FsspecMetadataService:
         List of Runs
 
         """
-        run_uri = self.join(self.dirname(dataset.md_uri), 'run.md.json')
-        return [self.get_run(run_uri)]
+        dataset_dir = self.dirname(dataset.md_uri)
+        runs = [self.get_run(self.join(dataset_dir, 'run.md.json'))]
+        # runs created in the same dataset by create_run
+        run_id_count = 1
+        while self.fs.isfile(self.join(dataset_dir, f'run_{run_id_count}.md.json')):
+            runs.append(self.get_run(self.join(dataset_dir, f'run_{run_id_count}.md.json')))
+            run_id_count += 1
+        return runs
 
 
     def get_run(self, md_uri):
@@ -1008,6 +1043,104 @@ class FsspecMetadataService:
 
         self._write_json(metadata, run.md_uri)
 
+    def add_run_item(self, run, inputs_uuids, outputs_md_uris):
+        """Record that a data of a run is processed
+
+        The items are appended to the run journal (run.md.jsonl) as the
+        job goes, so that an interrupted job can be resumed. Opening the
+        journal can be slow on a remote file system, so the items are
+        buffered and appended by groups of run_items_buffer items, and when
+        the dataset is compacted (see compact_dataset). The items of the
+        last group are processed again if the job is killed: their data
+        replace the previous ones in the dataset (see create_data)
+
+        Parameters
+        ----------
+        run: Run
+            Metadata of the run
+        inputs_uuids: list
+            UUIDs of the input data of the item (one per run input)
+        outputs_md_uris: list
+            URIs of the processed data created for the item
+
+        """
+        run_uri = self.abspath(run.md_uri)
+        outputs = [self.to_unix_path(self.relative_path(uri, run_uri))
+                   for uri in outputs_md_uris]
+        journal_uri = run_uri + 'l'
+        with self._run_items_lock:
+            lines = self._run_items.setdefault(journal_uri, [])
+            lines.append(json.dumps({'inputs': list(inputs_uuids), 'outputs': outputs}))
+            if len(lines) >= self.run_items_buffer:
+                self._write_run_items(journal_uri)
+
+    def _write_run_items(self, journal_uri):
+        """Append the buffered items of a run to its journal
+
+        The caller must hold _run_items_lock
+
+        """
+        lines = self._run_items.pop(journal_uri, None)
+        if not lines:
+            return
+        if self.fs.exists(journal_uri) and self.fs.size(journal_uri) > 0:
+            with self.fs.open(journal_uri, 'rb') as journal_file:
+                journal_file.seek(-1, os.SEEK_END)
+                if journal_file.read(1) != b'\n':
+                    # end the truncated line of an interrupted append
+                    lines.insert(0, '')
+        with self.fs.open(journal_uri, 'a') as journal_file:
+            journal_file.write('\n'.join(lines) + '\n')
+
+    def compact_dataset(self, md_uri):
+        """Write the buffered items of the runs of a dataset
+
+        Parameters
+        ----------
+        md_uri: str
+            URI of the dataset metadata file
+
+        """
+        dataset_dir = self.dirname(self.abspath(md_uri))
+        with self._run_items_lock:
+            for journal_uri in list(self._run_items):
+                if self.dirname(journal_uri) == dataset_dir:
+                    self._write_run_items(journal_uri)
+
+    def get_run_items(self, run):
+        """Read the items of a run already processed
+
+        Parameters
+        ----------
+        run: Run
+            Metadata of the run
+
+        Returns
+        -------
+        dict {tuple of the inputs uuids: list of the outputs URIs}
+
+        """
+        run_uri = self.abspath(run.md_uri)
+        items = dict()
+        with self._run_items_lock:
+            self._write_run_items(run_uri + 'l')
+        if not self.fs.exists(run_uri + 'l'):
+            return items
+        with self.fs.open(run_uri + 'l') as journal_file:
+            for line in journal_file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # line of an interrupted append
+                    continue
+                items[tuple(entry['inputs'])] = [
+                    self.absolute_path(self.normalize_path_sep(url), run_uri)
+                    for url in entry['outputs']]
+        return items
+
     def get_data_uri(self, data_container):
         return data_container.uri.replace('\\', '\\\\')
 
@@ -1069,7 +1202,11 @@ class FsspecMetadataService:
 
         self.update_processed_data(processed_data)
 
-        # add the data to the dataset
+        # add the data to the dataset. A data created again (the run items
+        # buffered when a job was killed are processed again on resume)
+        # replaces its previous entry
+        dataset.uris = [data_info for data_info in dataset.uris
+                        if data_info.md_uri != data_md_file]
         dataset.uris.append(Container(data_md_file, processed_data.uuid))
         self.update_dataset(dataset)
 
@@ -15,17 +15,21 @@ LocalMetadataService
 import platform
 import os
 import os.path
-from pathlib import Path
+import copy
 import json
 import re
-from shutil import copyfile
 import subprocess
+from contextlib import contextmanager
 import zarr
 import pandas as pd
 
 from bioimageit_formats import FormatsAccess, formatsServices
 
 from bioimageit_core.core.config import ConfigAccess
+from bioimageit_core.core.cache import FileCache
+from bioimageit_core.core.copy_engine import CopyEngine
+from bioimageit_core.core.content_store import ContentStore
+from bioimageit_core.core.index import KeyValueIndex, index_path
 from bioimageit_core.core.utils import generate_uuid
 from bioimageit_core.core.exceptions import DataServiceError
 from bioimageit_core.containers.data_containers import (METADATA_TYPE_RAW,
@@ -34,6 +38,7 @@ from bioimageit_core.containers.data_containers import (METADATA_TYPE_RAW,
                                                         RawData,
                                                         ProcessedData,
                                                         ProcessedDataInputContainer,
+                                                        ProcessedDataRootContainer,
                                                         Dataset,
                                                         Experiment,
                                                         Run,
@@ -50,30 +55,160 @@ class LocalMetadataServiceBuilder:
     def __init__(self):
         self._instance = None
 
-    def __call__(self, **_ignored):
+    def __call__(self, cache=False, cache_size=4096, journal_threshold=1000,
+                 import_workers=1, import_mode='copy', import_hash='sha256',
+                 content_store='', skip_imported=False, **_ignored):
         if not self._instance:
-            self._instance = LocalMetadataService()
+            if not cache:
+                cache_size = 0
+            self._instance = LocalMetadataService(cache_size, journal_threshold,
+                                                  import_workers, import_mode,
+                                                  import_hash, content_store,
+                                                  skip_imported)
         return self._instance
 
 
 class LocalMetadataService:
-    """Service for local metadata management"""
-
-    def __init__(self):
+    """Service for local metadata management
+
+    Parameters
+    ----------
+    cache_size: int
+        Maximum number of parsed metadata files kept in memory. The cache
+        is disabled if 0. It is set with the 'cache' and 'cache_size' keys
+        of the 'metadata' section of the configuration
+    journal_threshold: int
+        Number of data appended to the journal of a dataset before the
+        journal is merged into the dataset metadata file
+    import_workers: int
+        Number of files copied in parallel when data are imported
+    import_mode: str
+        How the imported files are transferred to the experiment: 'copy',
+        'hardlink', 'reflink' or 'reference' (the data stay in place)
+    import_hash: str
+        Algorithm of the content hash computed for each imported data. No
+        hash is computed if empty
+    content_store: str
+        Path of a content-addressed store shared by all the experiments.
+        Imported files are stored once in the store and linked into the
+        experiments. Not used if empty
+    skip_imported: bool
+        If True, import_dir skips the files with the same content hash as a
+        data already in the raw dataset
+
+    """
+
+    def __init__(self, cache_size=0, journal_threshold=1000, import_workers=1,
+                 import_mode='copy', import_hash='', content_store='',
+                 skip_imported=False):
         self.service_name = 'LocalMetadataService'
+        self._cache = None
+        if cache_size > 0:
+            self._cache = FileCache(cache_size)
+        self.journal_threshold = journal_threshold
+        self._journal_sizes = {}
+        store = None
+        if content_store:
+            store = ContentStore(content_store, import_hash or 'sha256')
+        self.copy_engine = CopyEngine(import_workers, import_mode, import_hash, store)
+        self.skip_imported = skip_imported
+        self._indexes = FileCache(64)
+        self._experiments_keys = FileCache(64)
+        self._dirty_indexes = {}
+        self._batch_depth = 0
 
     @staticmethod
-    def _read_json(md_uri: str):
+    def _load_json(md_uri: str):
         """Read the metadata from the a json file"""
         if os.path.getsize(md_uri) > 0:
             with open(md_uri) as json_file:
                 return json.load(json_file)
 
+    def _read_json(self, md_uri: str):
+        """Read the metadata from the cache or from the json file
+
+        The returned dictionary can be shared with the cache and must not
+        be modified
+
+        """
+        if self._cache is not None:
+            return self._cache.get(md_uri, self._load_json)
+        return self._load_json(md_uri)
+
+    def invalidate(self, md_uri=None):
+        """Remove a metadata file from the cache
+
+        This is called by all the update methods. It must be called when a
+        metadata file is modified outside of this service
+
+        Parameters
+        ----------
+        md_uri: str
+            URI of the metadata file. The whole cache is cleared if None
+
+        """
+        if md_uri is not None:
+            md_uri = os.path.abspath(md_uri)
+        self._experiments_keys.invalidate(md_uri)
+        if self._cache is not None:
+            self._cache.invalidate(md_uri)
+
     @staticmethod
     def _write_json(metadata: dict, md_uri: str):
-        """Write the metadata to the a json file"""
-        with open(md_uri, 'w') as outfile:
+        """Write the metadata to the a json file
+
+        The file is written next to the destination and then renamed so that
+        a reader never sees a partially written file
+
+        """
+        tmp_uri = md_uri + '.tmp'
+        with open(tmp_uri, 'w') as outfile:
             json.dump(metadata, outfile, indent=4)
+        os.replace(tmp_uri, md_uri)
+
+    @staticmethod
+    def journal_path(md_uri: str) -> str:
+        """Get the path of the journal of a dataset
+
+        The journal is an append-only file with one json line per data added
+        to the dataset since the last write of the dataset metadata file
+
+        Parameters
+        ----------
+        md_uri: str
+            URI of the dataset metadata file
+
+        Returns
+        -------
+        The path of the journal file (ex: processed_dataset.md.jsonl)
+
+        """
+        return md_uri + 'l'
+
+    @staticmethod
+    def data_url(uri: str, md_uri: str) -> str:
+        """Get the url of a data stored in a metadata file
+
+        Parameters
+        ----------
+        uri: str
+            Path of the data
+        md_uri: str
+            Path of the metadata file
+
+        Returns
+        -------
+        The path of the data relative to the metadata file, or the absolute
+        path if the data is not in the experiment directory (data imported
+        with the 'reference' mode)
+
+        """
+        experiment_dir = os.path.dirname(os.path.dirname(md_uri))
+        abs_uri = os.path.abspath(uri)
+        if os.path.isabs(uri) and not abs_uri.startswith(experiment_dir + os.sep):
+            return LocalMetadataService.to_unix_path(abs_uri)
+        return LocalMetadataService.to_unix_path(
+            LocalMetadataService.relative_path(uri, md_uri))
 
     @staticmethod
     def md_file_path(md_uri):
@@ -140,6 +275,8 @@ class LocalMetadataService:
         """
         if os.path.isfile(file):
             return os.path.abspath(file)
+        if os.path.isabs(file):
+            return file
 
         separator = os.sep
         last_separator = reference_file.rfind(separator)
@@ -281,6 +418,7 @@ class LocalMetadataService:
         raw_dataset.md_uri = raw_dataset_md_url
         raw_dataset.name = 'data'
         self.update_dataset(raw_dataset)
+        self._save_index(index_path(raw_data_path), KeyValueIndex())
         container.raw_dataset = DatasetInfo(raw_dataset.name, raw_dataset_md_url,
                                             raw_dataset.uuid)
 
@@ -361,6 +499,27 @@ class LocalMetadataService:
             return container
         raise DataServiceError('Cannot find the experiment metadata from the given URI')
 
+    def _experiment_keys(self, md_uri):
+        """Read the list of keys of an experiment
+
+        The keys are kept in memory (even if the cache is disabled) since
+        they are needed for each data read
+
+        Parameters
+        ----------
+        md_uri: str
+            URI of the experiment.md.json file
+
+        Returns
+        -------
+        list of the experiment keys
+
+        """
+        if os.path.isfile(md_uri):
+            return self._experiments_keys.get(
+                os.path.abspath(md_uri), lambda uri: self._read_json(uri)['keys'])
+        raise DataServiceError('Cannot find the experiment metadata from the given URI')
+
     def update_experiment(self, experiment):
         """Write an experiment to the database
 
@@ -395,6 +554,7 @@ class LocalMetadataService:
         for key in experiment.keys:
             metadata['keys'].append(key)
         self._write_json(metadata, md_uri_)
+        self.invalidate(md_uri_)
 
     def import_data(self, experiment, data_path, name, author, format_,
                     date='now', key_value_pairs=dict):
@@ -427,53 +587,27 @@ class LocalMetadataService:
         raw_dataset_uri = os.path.abspath(experiment.raw_dataset.url)
         data_dir_path = os.path.dirname(raw_dataset_uri)
 
-        # create the new data uri
-        data_base_name = os.path.basename(data_path)
-        filtered_name = data_base_name.replace(' ', '')
-        filtered_name, ext = os.path.splitext(filtered_name)
-        md_uri = os.path.join(data_dir_path, filtered_name + '.md.json')
-
-        # create the container
-        metadata = RawData()
-        metadata.uuid = generate_uuid()
-        metadata.md_uri = md_uri
-        metadata.name = name
-        metadata.author = author
-        metadata.format = format_
-        metadata.date = date
-        metadata.key_value_pairs = key_value_pairs
-
         # import data
-        # print('import data with format:', metadata.format)
-        print('IMAGE ZARR ?')
-
-        if metadata.format == 'bioformat':
+        if format_ == 'bioformat':
+            metadata = self._create_raw_data(data_dir_path, data_path, name, author,
+                                             format_, date, key_value_pairs)
             self._import_file_bioformat(raw_dataset_uri, data_path, data_dir_path, metadata.name,
                                         metadata.author, metadata.date)
-        elif metadata.format == 'imagezarr':
+        elif format_ == 'imagezarr':
+            metadata = self._create_raw_data(data_dir_path, data_path, name, author,
+                                             format_, date, key_value_pairs)
+            filtered_name = os.path.basename(metadata.md_uri)[:-len('.md.json')]
             destination_path = os.path.join(data_dir_path, filtered_name + '.zarr')
-            raw_dataset_container = self.get_dataset(raw_dataset_uri)
-            raw_dataset_container.uris.append(Container(md_uri=metadata.md_uri, uuid=metadata.uuid))
             metadata.uri = destination_path
-            self.update_dataset(raw_dataset_container)
             self.update_raw_data(metadata)
+            self.add_data_to_dataset(raw_dataset_uri, metadata)
 
             self._import_file_zarr(data_path, destination_path)
-            print("IMAGE ZARR !")
         else:
-            format_service = formatsServices.get(metadata.format)
-            files_to_copy = format_service.files(data_path)
-            for file_ in files_to_copy:
-                origin_base_name = os.path.basename(file_)
-                destination_path = os.path.join(data_dir_path, origin_base_name)
-                copyfile(file_, destination_path)
-            metadata.uri = os.path.join(data_dir_path, data_base_name)  # URI is main file
-            self.update_raw_data(metadata)
-
+            metadata = self._copy_raw_data(data_dir_path, data_path, name, author,
+                                           format_, date, key_value_pairs)
             # add data to experiment RawDataSet
-            raw_dataset_container = self.get_dataset(raw_dataset_uri)
-            raw_dataset_container.uris.append(Container(md_uri=metadata.md_uri, uuid=metadata.uuid))
-            self.update_dataset(raw_dataset_container)
+            self.add_data_to_dataset(raw_dataset_uri, metadata)
 
         # add key-value pairs to experiment
         for key in key_value_pairs:
@@ -482,6 +616,58 @@ class LocalMetadataService:
 
         return metadata
 
+    @staticmethod
+    def _create_raw_data(data_dir_path, data_path, name, author, format_, date,
+                         key_value_pairs):
+        """Create the container of a data imported in the raw dataset
+
+        Parameters
+        ----------
+        data_dir_path: str
+            Path of the raw dataset directory
+        data_path: str
+            Path of the data to import
+
+        Returns
+        -------
+        RawData container with a new uuid and md_uri. The data uri is not set
+
+        """
+        filtered_name = os.path.basename(data_path).replace(' ', '')
+        filtered_name, _ = os.path.splitext(filtered_name)
+
+        metadata = RawData()
+        metadata.uuid = generate_uuid()
+        metadata.md_uri = os.path.join(data_dir_path, filtered_name + '.md.json')
+        metadata.name = name
+        metadata.author = author
+        metadata.format = format_
+        metadata.date = date
+        metadata.key_value_pairs = key_value_pairs
+        return metadata
+
+    def _copy_raw_data(self, data_dir_path, data_path, name, author, format_, date,
+                       key_value_pairs):
+        """Copy a data to the raw dataset directory and write its metadata file
+
+        The data is not added to the raw dataset
+
+        Returns
+        -------
+        RawData container of the imported data
+
+        """
+        metadata = self._create_raw_data(data_dir_path, data_path, name, author,
+                                         format_, date, key_value_pairs)
+        digests = {}
+        self.copy_engine.transfer(formatsServices.get(format_).files(data_path),
+                                  data_dir_path, digests=digests)
+        # URI is main file
+        metadata.uri = self.copy_engine.destination(data_path, data_dir_path)
+        metadata.hash = digests.get(data_path, '')
+        self.update_raw_data(metadata)
+        return metadata
+
     def _import_file_bioformat(self, raw_dataset_uri, file_path, destination_dir, data_name, author,
                                date):
         fiji_exe = ConfigAccess.instance().get('fiji')
@@ -583,8 +769,6 @@ class LocalMetadataService:
             List of observers to notify the progress
 
         """
-        files = os.listdir(dir_uri)
-        count = 0
         key_value_pairs = {}
         if directory_tag_key != '':
             key_value_pairs[directory_tag_key] = os.path.dirname(dir_uri)
@@ -592,16 +776,87 @@ class LocalMetadataService:
         if format_ == 'bioformat':
             self._import_dir_bioformat(experiment.raw_dataset.md_uri, dir_uri, filter_,
                                        author, format_, date, directory_tag_key)
-        else:
-            for file in files:
-                count += 1
-                r1 = re.compile(filter_)
-                if r1.search(file):
-                    if observers is not None:
-                        for obs in observers:
-                            obs.notify_progress(int(100 * count / len(files)), file)
+        elif format_ == 'imagezarr':
+            regexp = re.compile(filter_)
+            for file in sorted(os.listdir(dir_uri)):
+                if regexp.search(file):
                     self.import_data(experiment, os.path.join(dir_uri, file), file, author,
                                      format_, date, key_value_pairs)
+        else:
+            # scan the directory once, copy all the files with the copy engine,
+            # write the data metadata files, then write the raw dataset and
+            # the experiment only once
+            regexp = re.compile(filter_)
+            files = [file for file in sorted(os.listdir(dir_uri)) if regexp.search(file)]
+            raw_dataset_uri = os.path.abspath(experiment.raw_dataset.url)
+            data_dir_path = os.path.dirname(raw_dataset_uri)
+            raw_dataset = self.get_dataset(raw_dataset_uri)
+            digests = {}
+            if self.skip_imported:
+                files = self._filter_imported(raw_dataset, dir_uri, files, digests)
+            format_service = formatsServices.get(format_)
+            sources = []
+            for file in files:
+                sources.extend(format_service.files(os.path.join(dir_uri, file)))
+
+            def notify_copy(index):
+                if observers is not None:
+                    for obs in observers:
+                        obs.notify_progress(int(100 * index / len(sources)),
+                                            os.path.basename(sources[index]))
+            self.copy_engine.transfer(sources, data_dir_path, notify_copy, digests)
+
+            with self.batch():
+                for file in files:
+                    data_path = os.path.join(dir_uri, file)
+                    metadata = self._create_raw_data(data_dir_path, data_path, file, author,
+                                                     format_, date, key_value_pairs)
+                    metadata.uri = self.copy_engine.destination(data_path, data_dir_path)
+                    metadata.hash = digests.get(data_path, '')
+                    self.update_raw_data(metadata)
+                    raw_dataset.uris.append(Container(metadata.md_uri, metadata.uuid))
+            self.update_dataset(raw_dataset)
+            if observers is not None:
+                for obs in observers:
+                    obs.notify_progress(100, 'done')
+
+            for key in key_value_pairs:
+                experiment.set_key(key)
+            self.update_experiment(experiment)
+
+    def _filter_imported(self, raw_dataset, dir_uri, files, digests):
+        """Remove the files already imported in the raw dataset
+
+        Parameters
+        ----------
+        raw_dataset: Dataset
+            Container of the raw dataset
+        dir_uri: str
+            Directory of the files
+        files: list
+            Names of the files to import
+        digests: dict
+            Dictionary {path: hash} filled with the hashes of the files to
+            import
+
+        Returns
+        -------
+        The list of the files names that are not in the raw dataset
+
+        """
+        imported = set()
+        for data_info in raw_dataset.uris:
+            raw_data = self.get_raw_data(data_info.md_uri)
+            if raw_data is not None and raw_data.hash:
+                imported.add(raw_data.hash)
+        paths = [os.path.join(dir_uri, file) for file in files]
+        hashes = self.copy_engine.hash_files(paths)
+        kept = []
+        for file, path, digest in zip(files, paths, hashes):
+            if digest not in imported:
+                digests[path] = digest
+                kept.append(file)
+        return kept
 
     def get_raw_data(self, md_uri):
         """Read a raw data from the database
@@ -617,7 +872,7 @@ class LocalMetadataService:
         """
         md_uri = os.path.abspath(md_uri)
         if os.path.isfile(md_uri) and md_uri.endswith('.md.json'):
-            metadata = LocalMetadataService._read_json(md_uri)
+            metadata = self._read_json(md_uri)
             container = RawData()
             if 'uuid' in metadata:
                 container.uuid = metadata['uuid']
@@ -631,19 +886,21 @@ class LocalMetadataService:
             container.uri = LocalMetadataService.absolute_path(
                 LocalMetadataService.normalize_path_sep(
                     metadata['common']['url']), md_uri)
+            if 'hash' in metadata['common']:
+                container.hash = metadata['common']['hash']
 
             # metadata
             if 'metadata' in metadata:
-                container.metadata = metadata['metadata']
+                container.metadata = copy.deepcopy(metadata['metadata'])
 
             # key_value_pairs
             if 'key_value_pairs' in metadata:
                 for key in metadata['key_value_pairs']:
                     container.key_value_pairs[key] = metadata['key_value_pairs'][key]
             # read keys from the experiment
-            experiment_uri = os.path.join(Path(Path(md_uri).parent).parent, 'experiment.md.json') 
-            experiment = self.get_experiment(experiment_uri) 
-            for key in experiment.keys:
+            experiment_uri = os.path.join(os.path.dirname(os.path.dirname(md_uri)),
+                                          'experiment.md.json')
+            for key in self._experiment_keys(experiment_uri):
                 if 'key_value_pairs' in metadata:
                     if key not in metadata['key_value_pairs']:
                         container.key_value_pairs[key] = ''
@@ -671,8 +928,9 @@ class LocalMetadataService:
         metadata['common']['author'] = raw_data.author
         metadata['common']['date'] = raw_data.date
         metadata['common']['format'] = raw_data.format
-        metadata['common']['url'] = LocalMetadataService.to_unix_path(
-            LocalMetadataService.relative_path(raw_data.uri, md_uri))
+        metadata['common']['url'] = LocalMetadataService.data_url(raw_data.uri, md_uri)
+        if raw_data.hash:
+            metadata['common']['hash'] = raw_data.hash
 
         metadata['metadata'] = raw_data.metadata
 
@@ -681,6 +939,183 @@ class LocalMetadataService:
             metadata['key_value_pairs'][key] = raw_data.key_value_pairs[key]
 
         self._write_json(metadata, md_uri)
+        self.invalidate(md_uri)
+
+        # update the index of the dataset if it exists
+        index_uri = index_path(os.path.dirname(md_uri))
+        if self._has_index(index_uri):
+            index = self._load_index(index_uri)
+            if index is not None:
+                url = os.path.basename(md_uri)
+                index.set(url, raw_data.uuid, raw_data.name, raw_data.key_value_pairs)
+                self._index_changed(index_uri, index, [url])
+
+    @contextmanager
+    def batch(self):
+        """Defer the writes of the datasets indexes
+
+        The indexes modified in the block are written once at the end of the
+        block. Use it when many data are updated:
+
+            >>> with service.batch():
+            ...     for raw_data in data_list:
+            ...         service.update_raw_data(raw_data)
+
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                dirty_indexes = self._dirty_indexes
+                self._dirty_indexes = {}
+                for index_uri, index in dirty_indexes.items():
+                    self._save_index(index_uri, index)
+
+    def _has_index(self, index_uri):
+        """Check if an index exists in the memory or in the files"""
+        return index_uri in self._dirty_indexes or os.path.isfile(index_uri) \
+            or os.path.isfile(KeyValueIndex.delta_path(index_uri))
+
+    def _load_index(self, index_uri):
+        """Read an index from the memory or from its files"""
+        if index_uri in self._dirty_indexes:
+            return self._dirty_indexes[index_uri]
+        index = self._indexes.get(index_uri, KeyValueIndex.load)
+        # the cache only checks the index file: reload the index if the delta
+        # was modified by another service
+        try:
+            delta_size = os.path.getsize(KeyValueIndex.delta_path(index_uri))
+        except OSError:
+            delta_size = 0
+        if index is not None and delta_size != index.delta_size:
+            index = KeyValueIndex.load(index_uri)
+            if index is not None:
+                self._indexes.put(index_uri, index)
+        return index
+
+    def _index_changed(self, index_uri, index, urls):
+        """Record the entries modified in an index
+
+        The entries are appended to the index delta file. The index file is
+        rewritten only when the delta reaches journal_threshold entries, or
+        at the end of a batch
+
+        """
+        if self._batch_depth > 0:
+            self._dirty_indexes[index_uri] = index
+            return
+        index.append(index_uri, urls)
+        if index.delta_count >= self.journal_threshold:
+            self._save_index(index_uri, index)
+
+    def _save_index(self, index_uri, index):
+        """Write an index, or mark it to be written at the end of a batch"""
+        if self._batch_depth > 0:
+            self._dirty_indexes[index_uri] = index
+            return
+        index.save(index_uri)
+        self._indexes.put(index_uri, index)
+
+    def get_index(self, dataset):
+        """Get the key-value index of a dataset
+
+        The index is updated with the data added or removed from the dataset
+        since it was written. Only the metadata files of the added data are
+        read
+
+        Parameters
+        ----------
+        dataset: Dataset
+            Container of the dataset
+
+        Returns
+        -------
+        The KeyValueIndex of the dataset, or None if the dataset has no
+        index (see rebuild_index)
+
+        """
+        dataset_dir = os.path.dirname(os.path.abspath(dataset.md_uri))
+        index_uri = index_path(dataset_dir)
+        if not self._has_index(index_uri):
+            return None
+        index = self._load_index(index_uri)
+        if index is None:
+            return None
+
+        urls = {}
+        for data_info in dataset.uris:
+            urls[os.path.relpath(data_info.md_uri, dataset_dir)] = data_info.md_uri
+        changed = [url for url in index.entries if url not in urls]
+        for url in changed:
+            index.remove(url)
+        for url, md_uri in urls.items():
+            if url not in index:
+                raw_data = self.get_raw_data(md_uri)
+                if raw_data is not None:
+                    index.set(url, raw_data.uuid, raw_data.name, raw_data.key_value_pairs)
+                    changed.append(url)
+        if changed:
+            self._index_changed(index_uri, index, changed)
+        return index
+
+    def rebuild_index(self, dataset):
+        """Create the key-value index of a dataset from its data metadata files
+
+        Parameters
+        ----------
+        dataset: Dataset
+            Container of the dataset
+
+        Returns
+        -------
+        The new KeyValueIndex of the dataset
+
+        """
+        dataset_dir = os.path.dirname(os.path.abspath(dataset.md_uri))
+        index = KeyValueIndex()
+        for data_info in dataset.uris:
+            raw_data = self.get_raw_data(data_info.md_uri)
+            if raw_data is not None:
+                index.set(os.path.relpath(data_info.md_uri, dataset_dir), raw_data.uuid,
+                          raw_data.name, raw_data.key_value_pairs)
+        index_uri = index_path(dataset_dir)
+        self._dirty_indexes.pop(index_uri, None)
+        self._save_index(index_uri, index)
+        return index
+
+    def query_dataset(self, dataset, query):
+        """Select the data of a dataset with its key-value index
+
+        Only the index is read, the data metadata files are not opened
+
+        Parameters
+        ----------
+        dataset: Dataset
+            Container of the dataset
+        query: Query
+            Compiled query (see bioimageit_core.core.query.compile_query)
+
+        Returns
+        -------
+        The list of the md_uri of the selected data in the dataset order, or
+        None if the dataset has no index
+
+        """
+        index = self.get_index(dataset)
+        if index is None:
+            return None
+        dataset_dir = os.path.dirname(os.path.abspath(dataset.md_uri))
+        experiment_uri = os.path.join(os.path.dirname(dataset_dir), 'experiment.md.json')
+        keys = self._experiment_keys(experiment_uri)
+        candidates = query.candidates(index)
+        search_list = []
+        for data_info in dataset.uris:
+            url = os.path.relpath(data_info.md_uri, dataset_dir)
+            if url in index and (candidates is None or url in candidates):
+                search_list.append(index.search_container(url, data_info.md_uri, keys))
+        return [info.uri() for info in query.select(search_list)]
 
     def get_processed_data(self, md_uri):
         """Read a processed data from the database
@@ -731,6 +1166,13 @@ class LocalMetadataService:
             if 'label' in metadata['origin']['output']:
                 container.output['label'] = \
                     metadata['origin']['output']['label']
+            # origin root raw data
+            if 'root' in metadata['origin']:
+                root = metadata['origin']['root']
+                container.root = ProcessedDataRootContainer(
+                    LocalMetadataService.absolute_path(
+                        LocalMetadataService.normalize_path_sep(root['url']), md_uri),
+                    root['uuid'], root['name'], root['key_value_pairs'])
 
             return container
         #raise DataServiceError(f'Metadata file format not supported {md_uri}')
@@ -781,8 +1223,18 @@ class LocalMetadataService:
             'name': processed_data.output['name'],
             'label': processed_data.output['label'],
         }
+        # origin root raw data
+        if processed_data.root is not None:
+            metadata['origin']['root'] = {
+                'url': LocalMetadataService.to_unix_path(
+                    LocalMetadataService.relative_path(processed_data.root.uri, md_uri)),
+                'uuid': processed_data.root.uuid,
+                'name': processed_data.root.name,
+                'key_value_pairs': processed_data.root.key_value_pairs
+            }
 
         self._write_json(metadata, md_uri)
+        self.invalidate(md_uri)
 
     def get_dataset(self, md_uri):
         """Read a dataset from the database using it URI
@@ -804,7 +1256,13 @@ class LocalMetadataService:
             container.uuid = metadata["uuid"]
             container.md_uri = md_uri
             container.name = metadata['name']
-            for uri in metadata['urls']:
+            urls = metadata['urls']
+            journal = self._read_journal(md_uri)
+            if journal:
+                # skip the entries already merged if a compaction was interrupted
+                merged = set(uri['url'] for uri in urls)
+                urls = urls + [uri for uri in journal if uri['url'] not in merged]
+            for uri in urls:
                 container.uris.append(
                     Container(LocalMetadataService.absolute_path(
                         LocalMetadataService.normalize_path_sep(uri['url']),
@@ -814,8 +1272,112 @@ class LocalMetadataService:
             return container
         raise DataServiceError('Dataset not found')
 
+    def _read_journal(self, md_uri):
+        """Read the entries of a dataset journal
+
+        Parameters
+        ----------
+        md_uri: str
+            Absolute URI of the dataset metadata file
+
+        Returns
+        -------
+        list of dict {'uuid': ..., 'url': ...}
+
+        """
+        journal_uri = LocalMetadataService.journal_path(md_uri)
+        entries = LocalMetadataService._read_json_lines(journal_uri)
+        self._journal_sizes[journal_uri] = len(entries)
+        return entries
+
+    @staticmethod
+    def _read_json_lines(uri):
+        """Read an append-only file with one json entry per line
+
+        A truncated line (interrupted append) is ignored
+
+        """
+        if not os.path.isfile(uri):
+            return []
+        entries = []
+        with open(uri) as json_lines_file:
+            for line in json_lines_file:
+                line = line.strip()
+                if line:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # line of an interrupted append
+                        continue
+        return entries
+
+    @staticmethod
+    def _append_json_line(uri, entry):
+        """Append a json entry to an append-only file
+
+        If the last line is truncated (interrupted append), the entry is
+        written on a new line so that it can be read
+
+        """
+        line = json.dumps(entry) + '\n'
+        with open(uri, 'a+') as json_lines_file:
+            size = json_lines_file.tell()
+            if size > 0:
+                json_lines_file.seek(size - 1)
+                if json_lines_file.read(1) != '\n':
+                    line = '\n' + line
+            json_lines_file.write(line)
+
+    def add_data_to_dataset(self, dataset_md_uri, data):
+        """Add a data at the end of a dataset
+
+        The data is appended to the dataset journal instead of rewriting the
+        dataset metadata file. The journal is merged into the dataset file
+        when it reaches journal_threshold entries or with compact_dataset
+
+        Parameters
+        ----------
+        dataset_md_uri: str
+            URI of the dataset metadata file
+        data: RawData or ProcessedData
+            Container of the data metadata (only md_uri and uuid are used)
+
+        """
+        md_uri = os.path.abspath(dataset_md_uri)
+        journal_uri = LocalMetadataService.journal_path(md_uri)
+        if journal_uri not in self._journal_sizes:
+            self._read_journal(md_uri)
+        tmp_url = LocalMetadataService.to_unix_path(
+            LocalMetadataService.relative_path(data.md_uri, md_uri))
+        LocalMetadataService._append_json_line(journal_uri, {'uuid': data.uuid,
+                                                             'url': tmp_url})
+        self._journal_sizes[journal_uri] += 1
+        if self._journal_sizes[journal_uri] >= self.journal_threshold:
+            self.compact_dataset(md_uri)
+
+    def compact_dataset(self, md_uri):
+        """Merge the journals of a dataset into the dataset metadata file
+
+        The delta of the dataset index is also merged into the index file
+
+        Parameters
+        ----------
+        md_uri: str
+            URI of the dataset metadata file
+
+        """
+        md_uri = os.path.abspath(md_uri)
+        if os.path.isfile(LocalMetadataService.journal_path(md_uri)):
+            self.update_dataset(self.get_dataset(md_uri))
+        index_uri = index_path(os.path.dirname(md_uri))
+        if index_uri not in self._dirty_indexes \
+                and os.path.isfile(KeyValueIndex.delta_path(index_uri)):
+            index = self._load_index(index_uri)
+            if index is not None:
+                self._save_index(index_uri, index)
+
     def update_dataset(self, dataset):
-        """Read a processed data from the database
+        """Write a dataset to the database
 
         Parameters
         ----------
@@ -829,11 +1391,16 @@ class LocalMetadataService:
         metadata['name'] = dataset.name
         metadata['urls'] = list()
         for uri in dataset.uris:
-            print('uri=', uri)
             tmp_url = LocalMetadataService.to_unix_path(
                 LocalMetadataService.relative_path(uri.md_uri, md_uri))
             metadata['urls'].append({"uuid": uri.uuid, 'url': tmp_url})
         self._write_json(metadata, md_uri)
+        self.invalidate(md_uri)
+        # the dataset file now contains all the data of the journal
+        journal_uri = LocalMetadataService.journal_path(md_uri)
+        if os.path.isfile(journal_uri):
+            os.remove(journal_uri)
+        self._journal_sizes[journal_uri] = 0
 
     def create_dataset(self, experiment, dataset_name):
         """Create a processed dataset in an experiment
@@ -919,8 +1486,14 @@ class LocalMetadataService:
         List of Runs
 
         """
-        run_uri = os.path.join(os.path.dirname(dataset.md_uri), 'run.md.json')
-        return [self.get_run(run_uri)]
+        dataset_dir = os.path.dirname(os.path.abspath(dataset.md_uri))
+        runs = [self.get_run(os.path.join(dataset_dir, 'run.md.json'))]
+        # runs created in the same dataset by create_run
+        run_id_count = 1
+        while os.path.isfile(os.path.join(dataset_dir, f'run_{run_id_count}.md.json')):
+            runs.append(self.get_run(os.path.join(dataset_dir, f'run_{run_id_count}.md.json')))
+            run_id_count += 1
+        return runs
 
 
     def get_run(self, md_uri):
@@ -1006,6 +1579,54 @@ class LocalMetadataService:
             )
 
         self._write_json(metadata, run.md_uri)
+        self.invalidate(run.md_uri)
+
+    def add_run_item(self, run, inputs_uuids, outputs_md_uris):
+        """Record that a data of a run is processed
+
+        The items are appended to the run journal (run.md.jsonl) as the
+        job goes, so that an interrupted job can be resumed
+
+        Parameters
+        ----------
+        run: Run
+            Metadata of the run
+        inputs_uuids: list
+            UUIDs of the input data of the item (one per run input)
+        outputs_md_uris: list
+            URIs of the processed data created for the item
+
+        """
+        run_uri = os.path.abspath(run.md_uri)
+        outputs = [LocalMetadataService.to_unix_path(
+                       LocalMetadataService.relative_path(uri, run_uri))
+                   for uri in outputs_md_uris]
+        LocalMetadataService._append_json_line(LocalMetadataService.journal_path(run_uri),
+                                               {'inputs': list(inputs_uuids),
+                                                'outputs': outputs})
+
+    def get_run_items(self, run):
+        """Read the items of a run already processed
+
+        Parameters
+        ----------
+        run: Run
+            Metadata of the run
+
+        Returns
+        -------
+        dict {tuple of the inputs uuids: list of the outputs URIs}
+
+        """
+        run_uri = os.path.abspath(run.md_uri)
+        items = dict()
+        for entry in LocalMetadataService._read_json_lines(
+                LocalMetadataService.journal_path(run_uri)):
+            items[tuple(entry['inputs'])] = [
+                LocalMetadataService.absolute_path(
+                    LocalMetadataService.normalize_path_sep(url), run_uri)
+                for url in entry['outputs']]
+        return items
 
     def get_data_uri(self, data_container):
         return data_container.uri.replace('\\', '\\\\')
@@ -1070,7 +1691,7 @@ class LocalMetadataService:
 
         # add the data to the dataset
         dataset.uris.append(Container(data_md_file, processed_data.uuid))
-        self.update_dataset(dataset)
+        self.add_data_to_dataset(md_uri, processed_data)
 
         return processed_data
 
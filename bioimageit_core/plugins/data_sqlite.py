@@ -0,0 +1,1043 @@
+# -*- coding: utf-8 -*-
+"""bioimageit_core SQLite metadata service.
+
+This module implements a service for metadata (Data, DataSet and
+Experiment) management where all the metadata of an experiment are stored
+in a single SQLite database file (experiment.sqlite) in the experiment
+directory. The data files are stored in the experiment directory with the
+same layout as the LOCAL service.
+
+The metadata URIs (md_uri) are the same as the LOCAL service ones
+(ex: myexperiment/data/population1_001.md.json) but they are keys in the
+database instead of files. This allows to migrate an experiment between the
+two services with import_local_experiment and export_local_experiment.
+
+Classes
+-------
+SqliteMetadataServiceBuilder
+SqliteMetadataService
+
+"""
+import os
+import os.path
+import re
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+import zarr
+import pandas as pd
+
+from bioimageit_formats import FormatsAccess, formatsServices
+
+from bioimageit_core.core.config import ConfigAccess
+from bioimageit_core.core.utils import generate_uuid
+from bioimageit_core.core.copy_engine import CopyEngine
+from bioimageit_core.core.content_store import ContentStore
+from bioimageit_core.core.exceptions import DataServiceError
+from bioimageit_core.containers.data_containers import (METADATA_TYPE_RAW,
+                                                        METADATA_TYPE_PROCESSED,
+                                                        Container,
+                                                        RawData,
+                                                        ProcessedData,
+                                                        ProcessedDataInputContainer,
+                                                        ProcessedDataRootContainer,
+                                                        Dataset,
+                                                        Experiment,
+                                                        Run,
+                                                        RunInputContainer,
+                                                        RunParameterContainer,
+                                                        DatasetInfo,
+                                                        )
+from bioimageit_core.plugins.data_local import LocalMetadataService
+from skimage.io import imread
+
+
+SQLITE_FILE = 'experiment.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiment (
+    uuid TEXT PRIMARY KEY,
+    name TEXT,
+    author TEXT,
+    date TEXT,
+    keys TEXT
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    md_uri TEXT PRIMARY KEY,
+    uuid TEXT,
+    name TEXT,
+    type TEXT,
+    position INTEGER
+);
+CREATE TABLE IF NOT EXISTS dataset_data (
+    dataset TEXT,
+    position INTEGER,
+    md_uri TEXT,
+    uuid TEXT,
+    PRIMARY KEY (dataset, position)
+);
+CREATE TABLE IF NOT EXISTS data (
+    md_uri TEXT PRIMARY KEY,
+    uuid TEXT,
+    dataset TEXT,
+    type TEXT,
+    name TEXT,
+    author TEXT,
+    date TEXT,
+    format TEXT,
+    url TEXT,
+    metadata TEXT,
+    origin TEXT,
+    hash TEXT
+);
+CREATE TABLE IF NOT EXISTS key_value_pairs (
+    md_uri TEXT,
+    key TEXT,
+    value TEXT,
+    PRIMARY KEY (md_uri, key)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    md_uri TEXT PRIMARY KEY,
+    uuid TEXT,
+    dataset TEXT,
+    dataset_uuid TEXT,
+    process_name TEXT,
+    process_url TEXT,
+    inputs TEXT,
+    parameters TEXT
+);
+CREATE INDEX IF NOT EXISTS dataset_data_dataset ON dataset_data (dataset);
+CREATE INDEX IF NOT EXISTS data_dataset ON data (dataset);
+CREATE INDEX IF NOT EXISTS data_name ON data (name);
+CREATE INDEX IF NOT EXISTS data_uuid ON data (uuid);
+CREATE INDEX IF NOT EXISTS data_hash ON data (hash);
+CREATE INDEX IF NOT EXISTS key_value ON key_value_pairs (key, value);
+CREATE INDEX IF NOT EXISTS runs_dataset ON runs (dataset);
+"""
+
+
+class SqliteMetadataServiceBuilder:
+    """Service builder for the metadata service"""
+
+    def __init__(self):
+        self._instance = None
+
+    def __call__(self, import_workers=1, import_mode='copy', import_hash='sha256',
+                 content_store='', **_ignored):
+        if not self._instance:
+            self._instance = SqliteMetadataService(import_workers, import_mode,
+                                                   import_hash, content_store)
+        return self._instance
+
+
+class SqliteMetadataService:
+    """Service for metadata management in one SQLite database per experiment
+
+    Parameters
+    ----------
+    import_workers: int
+        Number of files copied in parallel when data are imported
+    import_mode: str
+        How the imported files are transferred to the experiment: 'copy',
+        'hardlink', 'reflink' or 'reference' (the data stay in place)
+    import_hash: str
+        Algorithm of the content hash computed for each imported data. No
+        hash is computed if empty
+    content_store: str
+        Path of a content-addressed store shared by all the experiments.
+        Not used if empty
+
+    """
+
+    def __init__(self, import_workers=1, import_mode='copy', import_hash='',
+                 content_store=''):
+        self.service_name = 'SqliteMetadataService'
+        store = None
+        if content_store:
+            store = ContentStore(content_store, import_hash or 'sha256')
+        self.copy_engine = CopyEngine(import_workers, import_mode, import_hash, store)
+        self._connections = {}
+        self._experiment_dirs = {}
+        self._lock = threading.RLock()
+
+    def _connect(self, db_path: str):
+        """Get the connection to a database. The database is created if needed"""
+        connection = self._connections.get(db_path)
+        if connection is None:
+            connection = sqlite3.connect(db_path, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(_SCHEMA)
+            columns = [row['name'] for row in connection.execute('PRAGMA table_info(data)')]
+            if 'hash' not in columns:
+                connection.execute('ALTER TABLE data ADD COLUMN hash TEXT')
+            self._connections[db_path] = connection
+        return connection
+
+    def close(self):
+        """Close all the opened databases"""
+        with self._lock:
+            for connection in self._connections.values():
+                connection.close()
+            self._connections = {}
+            self._experiment_dirs = {}
+
+    def _experiment_dir(self, md_uri: str) -> str:
+        """Find the experiment directory containing a metadata URI
+
+        Parameters
+        ----------
+        md_uri: str
+            URI of the experiment, a dataset, a data or a run
+
+        Returns
+        -------
+        The path of the experiment directory
+
+        """
+        path = os.path.abspath(md_uri)
+        if path.endswith(SQLITE_FILE) or not os.path.isdir(path):
+            path = os.path.dirname(path)
+        if path in self._experiment_dirs:
+            return self._experiment_dirs[path]
+        directory = path
+        for _ in range(3):
+            if os.path.isfile(os.path.join(directory, SQLITE_FILE)):
+                self._experiment_dirs[path] = directory
+                return directory
+            directory = os.path.dirname(directory)
+        raise DataServiceError(f'Cannot find the experiment database for {md_uri}')
+
+    @contextmanager
+    def _database(self, md_uri: str):
+        """Open a transaction on the database of the experiment containing md_uri
+
+        Yields
+        ------
+        The database connection and the experiment directory
+
+        """
+        experiment_dir = self._experiment_dir(md_uri)
+        with self._lock:
+            connection = self._connect(os.path.join(experiment_dir, SQLITE_FILE))
+            with connection:
+                yield connection, experiment_dir
+
+    @staticmethod
+    def _key(path: str, experiment_dir: str) -> str:
+        """Convert a path to a database key (unix path relative to the experiment)"""
+        path = os.path.abspath(path)
+        if path.startswith(experiment_dir + os.sep):
+            return LocalMetadataService.to_unix_path(path[len(experiment_dir) + 1:])
+        return path
+
+    @staticmethod
+    def _path(key: str, experiment_dir: str) -> str:
+        """Convert a database key to an absolute path"""
+        if key is None or key == '':
+            return ''
+        if os.path.isabs(key):
+            return key
+        return os.path.join(experiment_dir,
+                            LocalMetadataService.normalize_path_sep(key))
+
+    def needs_cleanning(self):
+        return False
+
+    def create_experiment(self, name, author, date='now', keys=None,
+                          destination=''):
+        """Create a new experiment
+
+        Parameters
+        ----------
+        name: str
+            Name of the experiment
+        author: str
+            username of the experiment author
+        date: str
+            Creation date of the experiment
+        keys: list
+            List of keys used for the experiment vocabulary
+        destination: str
+            Destination where the experiment is created. It is a the path of the
+            directory where the experiment will be created for local use case
+
+        Returns
+        -------
+        Experiment container with the experiment metadata
+
+        """
+        if keys is None:
+            keys = []
+        if destination == '':
+            destination = ConfigAccess.instance().config['workspace']
+        uri = os.path.abspath(destination)
+        if not os.path.exists(uri):
+            raise DataServiceError(
+                'Cannot create Experiment: the destination '
+                'directory does not exists'
+            )
+
+        experiment_path = os.path.join(uri, name.replace(' ', ''))
+        if os.path.exists(experiment_path):
+            raise DataServiceError(
+                'Cannot create Experiment: the experiment '
+                'directory already exists'
+            )
+        os.mkdir(experiment_path)
+        os.mkdir(os.path.join(experiment_path, 'data'))
+        with self._lock:
+            self._connect(os.path.join(experiment_path, SQLITE_FILE))
+
+        container = Experiment()
+        container.uuid = generate_uuid()
+        container.md_uri = os.path.join(experiment_path, 'experiment.md.json')
+        container.name = name
+        container.author = author
+        container.date = date
+        container.keys = keys
+
+        raw_dataset = Dataset()
+        raw_dataset.uuid = generate_uuid()
+        raw_dataset.md_uri = os.path.join(experiment_path, 'data', 'raw_dataset.md.json')
+        raw_dataset.name = 'data'
+        self.update_dataset(raw_dataset)
+        container.raw_dataset = DatasetInfo(raw_dataset.name, raw_dataset.md_uri,
+                                            raw_dataset.uuid)
+        self.update_experiment(container)
+        return container
+
+    def get_workspace_experiments(self, workspace_uri):
+        """Read the experiments in the user workspace
+
+        Parameters
+        ----------
+        workspace_uri: str
+            URI of the workspace
+
+        Returns
+        -------
+        list of experiment containers
+
+        """
+        experiments = []
+        if os.path.exists(workspace_uri):
+            for dir_ in os.listdir(workspace_uri):
+                if os.path.isfile(os.path.join(workspace_uri, dir_, SQLITE_FILE)):
+                    experiment = self.get_experiment(os.path.join(workspace_uri, dir_))
+                    experiments.append({'md_uri': experiment.md_uri, 'info': experiment})
+        return experiments
+
+    def get_experiment(self, md_uri):
+        """Read an experiment from the database
+
+        Parameters
+        ----------
+        md_uri: str
+            URI of the experiment. It is either the path of the experiment
+            directory, the experiment.md.json URI or the experiment.sqlite file
+
+        Returns
+        -------
+        Experiment container with the experiment metadata
+
+        """
+        with self._database(md_uri) as (db, experiment_dir):
+            row = db.execute('SELECT * FROM experiment').fetchone()
+            if row is None:
+                raise DataServiceError('Cannot find the experiment metadata from the given URI')
+            container = Experiment()
+            container.uuid = row['uuid']
+            container.md_uri = os.path.join(experiment_dir, 'experiment.md.json')
+            container.name = row['name']
+            container.author = row['author']
+            container.date = row['date']
+            container.keys = json.loads(row['keys'])
+            for dataset in db.execute('SELECT * FROM datasets WHERE position IS NOT NULL '
+                                      'ORDER BY position'):
+                info = DatasetInfo(dataset['name'],
+                                   self._path(dataset['md_uri'], experiment_dir),
+                                   dataset['uuid'])
+                if dataset['type'] == METADATA_TYPE_RAW:
+                    container.raw_dataset = info
+                else:
+                    container.processed_datasets.append(info)
+            return container
+
+    def update_experiment(self, experiment):
+        """Write an experiment to the database
+
+        Parameters
+        ----------
+        experiment: Experiment
+            Container of the experiment metadata
+
+        """
+        with self._database(experiment.md_uri) as (db, experiment_dir):
+            db.execute('DELETE FROM experiment')
+            db.execute('INSERT INTO experiment (uuid, name, author, date, keys) '
+                       'VALUES (?, ?, ?, ?, ?)',
+                       (experiment.uuid, experiment.name, experiment.author,
+                        experiment.date, json.dumps(experiment.keys)))
+            db.execute('UPDATE datasets SET position = NULL')
+            datasets = [(experiment.raw_dataset, METADATA_TYPE_RAW)]
+            datasets += [(info, METADATA_TYPE_PROCESSED)
+                         for info in experiment.processed_datasets]
+            for position, (info, type_) in enumerate(datasets):
+                db.execute('INSERT INTO datasets (md_uri, uuid, name, type, position) '
+                           'VALUES (?, ?, ?, ?, ?) ON CONFLICT (md_uri) DO UPDATE SET '
+                           'uuid=excluded.uuid, name=excluded.name, type=excluded.type, '
+                           'position=excluded.position',
+                           (self._key(info.url, experiment_dir), info.uuid, info.name,
+                            type_, position))
+
+    def import_data(self, experiment, data_path, name, author, format_,
+                    date='now', key_value_pairs=dict):
+        """import one data to the experiment
+
+        The data is imported to the raw dataset
+
+        Parameters
+        ----------
+        experiment: Experiment
+            Container of the experiment metadata
+        data_path: str
+            Path of the accessible data on your local computer
+        name: str
+            Name of the data
+        author: str
+            Person who created the data
+        format_: str
+            Format of the data (ex: tif)
+        date: str
+            Date when the data where created
+        key_value_pairs: dict
+            Dictionary {key:value, key:value} to annotate files
+
+        Returns
+        -------
+        class RawData containing the metadata
+
+        """
+        if format_ in ['bioformat', 'imagezarr']:
+            raise DataServiceError(f'The SQLITE metadata service cannot import '
+                                   f'{format_} data')
+        raw_dataset_uri = os.path.abspath(experiment.raw_dataset.url)
+        metadata = self._copy_raw_data(os.path.dirname(raw_dataset_uri), data_path, name,
+                                       author, format_, date, key_value_pairs)
+        self.add_data_to_dataset(raw_dataset_uri, metadata)
+
+        for key in key_value_pairs:
+            experiment.set_key(key)
+        self.update_experiment(experiment)
+        return metadata
+
+    def _copy_raw_data(self, data_dir_path, data_path, name, author, format_, date,
+                       key_value_pairs, transfer=True, digests=None):
+        """Copy a data to the raw dataset directory and write its metadata
+
+        The data is not added to the raw dataset. The files are not copied
+        if transfer is False, and their hashes are then read from digests
+
+        Returns
+        -------
+        RawData container of the imported data
+
+        """
+        data_base_name = os.path.basename(data_path)
+        filtered_name, _ = os.path.splitext(data_base_name.replace(' ', ''))
+
+        metadata = RawData()
+        metadata.uuid = generate_uuid()
+        metadata.md_uri = os.path.join(data_dir_path, filtered_name + '.md.json')
+        metadata.name = name
+        metadata.author = author
+        metadata.format = format_
+        metadata.date = date
+        metadata.key_value_pairs = key_value_pairs
+
+        if digests is None:
+            digests = {}
+        if transfer:
+            self.copy_engine.transfer(formatsServices.get(format_).files(data_path),
+                                      data_dir_path, digests=digests)
+        metadata.hash = digests.get(data_path, '')
+        metadata.uri = self.copy_engine.destination(data_path, data_dir_path)
+        self.update_raw_data(metadata)
+        return metadata
+
+    def import_dir(self, experiment, dir_uri, filter_, author, format_, date,
+                   directory_tag_key='', observers=None):
+        """Import data from a directory to the experiment
+
+        Parameters
+        ----------
+        experiment: Experiment
+            Container of the experiment metadata
+        dir_uri: str
+            URI of the directory containing the data to be imported
+        filter_: str
+            Regular expression to filter which files in the folder
+            to import
+        author: str
+            Name of the person who created the data
+        format_: str
+            Format of the image (ex: tif)
+        date: str
+            Date when the data where created
+        directory_tag_key
+            If the string directory_tag_key is not empty, a new tag key entry with the
+            key={directory_tag_key} and the value={the directory name}.
+        observers: list
+            List of observers to notify the progress
+
+        """
+        if format_ in ['bioformat', 'imagezarr']:
+            raise DataServiceError(f'The SQLITE metadata service cannot import '
+                                   f'{format_} data')
+        key_value_pairs = {}
+        if directory_tag_key != '':
+            key_value_pairs[directory_tag_key] = os.path.dirname(dir_uri)
+        regexp = re.compile(filter_)
+        files = [file for file in sorted(os.listdir(dir_uri)) if regexp.search(file)]
+        raw_dataset_uri = os.path.abspath(experiment.raw_dataset.url)
+        data_dir_path = os.path.dirname(raw_dataset_uri)
+        format_service = formatsServices.get(format_)
+        sources = []
+        for file in files:
+            sources.extend(format_service.files(os.path.join(dir_uri, file)))
+
+        def notify_copy(index):
+            if observers is not None:
+                for obs in observers:
+                    obs.notify_progress(int(100 * index / len(sources)),
+                                        os.path.basename(sources[index]))
+        digests = {}
+        self.copy_engine.transfer(sources, data_dir_path, notify_copy, digests)
+
+        for file in files:
+            metadata = self._copy_raw_data(data_dir_path, os.path.join(dir_uri, file), file,
+                                           author, format_, date, key_value_pairs,
+                                           transfer=False, digests=digests)
+            self.add_data_to_dataset(raw_dataset_uri, metadata)
+        if observers is not None:
+            for obs in observers:
+                obs.notify_progress(100, 'done')
+
+        for key in key_value_pairs:
+            experiment.set_key(key)
+        self.update_experiment(experiment)
+
+    def get_raw_data(self, md_uri):
+        """Read a raw data from the database
+
+        Parameters
+        ----------
+        md_uri: str
+            URI if the raw data
+        Returns
+        -------
+        RawData object containing the raw data metadata
+
+        """
+        with self._database(md_uri) as (db, experiment_dir):
+            key = self._key(md_uri, experiment_dir)
+            row = db.execute('SELECT * FROM data WHERE md_uri = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            container = RawData()
+            self._read_common(row, container, experiment_dir)
+            container.type = row['type']
+            if row['metadata']:
+                container.metadata = json.loads(row['metadata'])
+            container.hash = row['hash'] or ''
+            for pair in db.execute('SELECT key, value FROM key_value_pairs '
+                                   'WHERE md_uri = ?', (key,)):
+                container.key_value_pairs[pair['key']] = pair['value']
+            keys = db.execute('SELECT keys FROM experiment').fetchone()
+            if keys is not None:
+                for exp_key in json.loads(keys['keys']):
+                    if exp_key not in container.key_value_pairs:
+                        container.key_value_pairs[exp_key] = ''
+            return container
+
+    def _read_common(self, row, container, experiment_dir):
+        """Copy the common data metadata from a database row to a container"""
+        container.uuid = row['uuid']
+        container.md_uri = self._path(row['md_uri'], experiment_dir)
+        container.name = row['name']
+        container.author = row['author']
+        container.date = row['date']
+        container.format = row['format']
+        container.uri = self._path(row['url'], experiment_dir)
+
+    def _write_data(self, db, experiment_dir, data, type_, metadata='', origin='',
+                    hash_=None):
+        """Insert or replace a data row"""
+        key = self._key(data.md_uri, experiment_dir)
+        db.execute('INSERT OR REPLACE INTO data (md_uri, uuid, dataset, type, name, author, '
+                   'date, format, url, metadata, origin, hash) '
+                   'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                   (key, data.uuid, os.path.dirname(key), type_, data.name, data.author,
+                    data.date, data.format, self._key(data.uri, experiment_dir),
+                    metadata, origin, hash_))
+        return key
+
+    def update_raw_data(self, raw_data):
+        """Write a raw data to the database
+
+        Parameters
+        ----------
+        raw_data: RawData
+            Container with the raw data metadata
+
+        """
+        with self._database(raw_data.md_uri) as (db, experiment_dir):
+            key = self._write_data(db, experiment_dir, raw_data, METADATA_TYPE_RAW,
+                                   metadata=json.dumps(raw_data.metadata),
+                                   hash_=raw_data.hash or None)
+            db.execute('DELETE FROM key_value_pairs WHERE md_uri = ?', (key,))
+            db.executemany('INSERT INTO key_value_pairs (md_uri, key, value) '
+                           'VALUES (?, ?, ?)',
+                           [(key, k, v) for k, v in raw_data.key_value_pairs.items()])
+
+    def get_processed_data(self, md_uri):
+        """Read a processed data from the database
+
+        Parameters
+        ----------
+        md_uri: str
+            URI if the processed data
+
+        Returns
+        -------
+        ProcessedData object containing the raw data metadata
+
+        """
+        with self._database(md_uri) as (db, experiment_dir):
+            row = db.execute('SELECT * FROM data WHERE md_uri = ?',
+                             (self._key(md_uri, experiment_dir),)).fetchone()
+            if row is None or row['type'] != METADATA_TYPE_PROCESSED:
+                return None
+            container = ProcessedData()
+            self._read_common(row, container, experiment_dir)
+            origin = json.loads(row['origin'])
+            container.run = Container(self._path(origin['run']['url'], experiment_dir),
+                                      origin['run']['uuid'])
+            for input_ in origin['inputs']:
+                container.inputs.append(
+                    ProcessedDataInputContainer(input_['name'],
+                                                self._path(input_['url'], experiment_dir),
+                                                input_['uuid'],
+                                                input_['type'])
+                )
+            container.output = dict(origin['output'])
+            if 'root' in origin:
+                root = origin['root']
+                container.root = ProcessedDataRootContainer(
+                    self._path(root['url'], experiment_dir), root['uuid'], root['name'],
+                    root['key_value_pairs'])
+            return container
+
+    def update_processed_data(self, processed_data):
+        """Write a processed data to the database
+
+        Parameters
+        ----------
+        processed_data: ProcessedData
+            Container with the processed data metadata
+
+        """
+        with self._database(processed_data.md_uri) as (db, experiment_dir):
+            origin = {
+                'run': {'url': self._key(processed_data.run.md_uri, experiment_dir),
+                        'uuid': processed_data.run.uuid},
+                'inputs': [{'name': input_.name,
+                            'url': self._key(input_.uri, experiment_dir),
+                            'uuid': input_.uuid,
+                            'type': input_.type} for input_ in processed_data.inputs],
+                'output': {'name': processed_data.output['name'],
+                           'label': processed_data.output['label']}
+            }
+            if processed_data.root is not None:
+                origin['root'] = {'url': self._key(processed_data.root.uri, experiment_dir),
+                                  'uuid': processed_data.root.uuid,
+                                  'name': processed_data.root.name,
+                                  'key_value_pairs': processed_data.root.key_value_pairs}
+            self._write_data(db, experiment_dir, processed_data, METADATA_TYPE_PROCESSED,
+                             origin=json.dumps(origin))
+
+    def get_dataset(self, md_uri):
+        """Read a dataset from the database using it URI
+
+        Parameters
+        ----------
+        md_uri: str
+            URI if the dataset
+
+        Returns
+        -------
+        Dataset object containing the dataset metadata
+
+        """
+        with self._database(md_uri) as (db, experiment_dir):
+            key = self._key(md_uri, experiment_dir)
+            row = db.execute('SELECT * FROM datasets WHERE md_uri = ?', (key,)).fetchone()
+            if row is None:
+                raise DataServiceError('Dataset not found')
+            container = Dataset()
+            container.uuid = row['uuid']
+            container.md_uri = self._path(key, experiment_dir)
+            container.name = row['name']
+            for data in db.execute('SELECT md_uri, uuid FROM dataset_data WHERE dataset = ? '
+                                   'ORDER BY position', (key,)):
+                container.uris.append(Container(self._path(data['md_uri'], experiment_dir),
+                                                data['uuid']))
+            return container
+
+    def update_dataset(self, dataset):
+        """Write a dataset to the database
+
+        Parameters
+        ----------
+        dataset: Dataset
+            Container with the dataset metadata
+
+        """
+        with self._database(dataset.md_uri) as (db, experiment_dir):
+            key = self._key(dataset.md_uri, experiment_dir)
+            db.execute('INSERT INTO datasets (md_uri, uuid, name) VALUES (?, ?, ?) '
+                       'ON CONFLICT (md_uri) DO UPDATE SET uuid=excluded.uuid, '
+                       'name=excluded.name', (key, dataset.uuid, dataset.name))
+            db.execute('DELETE FROM dataset_data WHERE dataset = ?', (key,))
+            db.executemany('INSERT INTO dataset_data (dataset, position, md_uri, uuid) '
+                           'VALUES (?, ?, ?, ?)',
+                           [(key, position, self._key(uri.md_uri, experiment_dir), uri.uuid)
+                            for position, uri in enumerate(dataset.uris)])
+
+    def add_data_to_dataset(self, dataset_md_uri, data):
+        """Add a data at the end of a dataset
+
+        Parameters
+        ----------
+        dataset_md_uri: str
+            URI of the dataset
+        data: RawData or ProcessedData
+            Container of the data metadata (only md_uri and uuid are used)
+
+        """
+        with self._database(dataset_md_uri) as (db, experiment_dir):
+            key = self._key(dataset_md_uri, experiment_dir)
+            db.execute('INSERT INTO dataset_data (dataset, position, md_uri, uuid) '
+                       'SELECT ?, COALESCE(MAX(position) + 1, 0), ?, ? FROM dataset_data '
+                       'WHERE dataset = ?',
+                       (key, self._key(data.md_uri, experiment_dir), data.uuid, key))
+
+    def create_dataset(self, experiment, dataset_name):
+        """Create a processed dataset in an experiment
+
+        Parameters
+        ----------
+        experiment: Experiment
+            Object containing the experiment metadata
+        dataset_name: str
+            Name of the dataset
+
+        Returns
+        -------
+        Dataset object containing the new dataset metadata
+
+        """
+        experiment_dir = os.path.dirname(os.path.abspath(experiment.md_uri))
+        dataset_dir = os.path.join(experiment_dir, dataset_name)
+        if not os.path.isdir(dataset_dir):
+            os.mkdir(dataset_dir)
+        container = Dataset()
+        container.uuid = generate_uuid()
+        container.md_uri = os.path.join(dataset_dir, 'processed_dataset.md.json')
+        container.name = dataset_name
+        self.update_dataset(container)
+
+        experiment.processed_datasets.append(
+            DatasetInfo(dataset_name, container.md_uri, container.uuid)
+            )
+        self.update_experiment(experiment)
+        return container
+
+    def create_run(self, dataset, run_info):
+        """Create a new run metadata
+
+        Parameters
+        ----------
+        dataset: Dataset
+            Object of the dataset metadata
+        run_info: Run
+            Object containing the metadata of the run. md_uri is ignored and
+            created automatically by this method
+
+        Returns
+        -------
+        Run object with the metadata and the new created md_uri
+
+        """
+        dataset_dir = os.path.dirname(os.path.abspath(dataset.md_uri))
+        with self._database(dataset.md_uri) as (db, experiment_dir):
+            run_md_file_name = "run.md.json"
+            run_id_count = 0
+            while db.execute('SELECT 1 FROM runs WHERE md_uri = ?',
+                             (self._key(os.path.join(dataset_dir, run_md_file_name),
+                                        experiment_dir),)).fetchone():
+                run_id_count += 1
+                run_md_file_name = "run_" + str(run_id_count) + ".md.json"
+
+        run_info.processed_dataset = dataset
+        run_info.uuid = generate_uuid()
+        run_info.md_uri = os.path.join(dataset_dir, run_md_file_name)
+        self._write_run(run_info)
+        return run_info
+
+    def get_dataset_runs(self, dataset):
+        """Read the run metadata from a dataset
+
+        Parameters
+        ----------
+        dataset: Dataset
+
+        Returns
+        -------
+        List of Runs
+
+        """
+        with self._database(dataset.md_uri) as (db, experiment_dir):
+            rows = db.execute('SELECT md_uri FROM runs WHERE dataset = ? ORDER BY rowid',
+                              (self._key(dataset.md_uri, experiment_dir),)).fetchall()
+            return [self.get_run(self._path(row['md_uri'], experiment_dir)) for row in rows]
+
+    def get_run(self, md_uri):
+        """Read a run metadata from the data base
+
+        Parameters
+        ----------
+        md_uri
+            URI of the run entry in the database
+
+        Returns
+        -------
+        Run: object containing the run metadata
+
+        """
+        with self._database(md_uri) as (db, experiment_dir):
+            row = db.execute('SELECT * FROM runs WHERE md_uri = ?',
+                             (self._key(md_uri, experiment_dir),)).fetchone()
+            if row is None:
+                raise DataServiceError('Run not found')
+            container = Run()
+            container.uuid = row['uuid']
+            container.md_uri = self._path(row['md_uri'], experiment_dir)
+            container.process_name = row['process_name']
+            container.process_uri = LocalMetadataService.normalize_path_sep(row['process_url'])
+            container.processed_dataset = Container(self._path(row['dataset'], experiment_dir),
+                                                    row['dataset_uuid'])
+            for input_ in json.loads(row['inputs']):
+                container.inputs.append(
+                    RunInputContainer(input_['name'], input_['dataset'], input_['query'],
+                                      input_['origin_output_name'])
+                )
+            for parameter in json.loads(row['parameters']):
+                container.parameters.append(
+                    RunParameterContainer(parameter['name'], parameter['value'])
+                )
+            return container
+
+    def _write_run(self, run):
+        """Write a run metadata to the data base
+
+        Parameters
+        ----------
+        run
+            Object containing the run metadata
+
+        """
+        with self._database(run.md_uri) as (db, experiment_dir):
+            inputs = [{'name': input_.name,
+                       'dataset': input_.dataset,
+                       'query': input_.query,
+                       'origin_output_name': input_.origin_output_name}
+                      for input_ in run.inputs]
+            parameters = [{'name': parameter.name, 'value': parameter.value}
+                          for parameter in run.parameters]
+            db.execute('INSERT OR REPLACE INTO runs (md_uri, uuid, dataset, dataset_uuid, '
+                       'process_name, process_url, inputs, parameters) '
+                       'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       (self._key(run.md_uri, experiment_dir), run.uuid,
+                        self._key(run.processed_dataset.md_uri, experiment_dir),
+                        run.processed_dataset.uuid, run.process_name,
+                        LocalMetadataService.to_unix_path(run.process_uri),
+                        json.dumps(inputs), json.dumps(parameters)))
+
+    def get_data_uri(self, data_container):
+        return data_container.uri.replace('\\', '\\\\')
+
+    def create_data_uri(self, dataset, run, processed_data):
+        """Create the URI of the new data
+
+        Parameters
+        ----------
+        dataset: Dataset
+            Object of the dataset metadata
+        run: Run
+            Metadata of the run
+        processed_data: ProcessedData
+            Object containing the new processed data. md_uri is ignored and
+            created automatically by this method
+
+        Returns
+        -------
+        ProcessedData object with the metadata and the new created md_uri
+
+        """
+        dataset_dir = os.path.dirname(os.path.abspath(dataset.md_uri))
+        extension = FormatsAccess.instance().get(processed_data.format).extension
+        processed_data.uri = os.path.join(dataset_dir, f"{processed_data.name}.{extension}").replace('\\', '\\\\')
+        return processed_data
+
+    def create_data(self, dataset, run, processed_data):
+        """Create a new processed data for a given dataset
+
+        Parameters
+        ----------
+        dataset: Dataset
+            Object of the dataset metadata
+        run: Run
+            Metadata of the run
+        processed_data: ProcessedData
+            Object containing the new processed data. md_uri is ignored and
+            created automatically by this method
+
+        Returns
+        -------
+        ProcessedData object with the metadata and the new created md_uri
+
+        """
+        dataset_dir = os.path.dirname(os.path.abspath(dataset.md_uri))
+        processed_data.uuid = generate_uuid()
+        processed_data.md_uri = os.path.join(dataset_dir, processed_data.name + '.md.json')
+        extension = FormatsAccess.instance().get(processed_data.format).extension
+        processed_data.uri = os.path.join(dataset_dir, f"{processed_data.name}.{extension}")
+        processed_data.run = run
+        self.update_processed_data(processed_data)
+
+        self.add_data_to_dataset(dataset.md_uri, processed_data)
+        dataset.uris.append(Container(processed_data.md_uri, processed_data.uuid))
+        return processed_data
+
+    def download_data(self, md_uri, destination_file_uri):
+        if destination_file_uri == '':
+            raw_data = self.get_raw_data(md_uri)
+            return raw_data.uri
+        return destination_file_uri
+
+    def view_data(self, md_uri):
+        raw_data = self.get_raw_data(md_uri)
+        if raw_data.format == 'imagetiff':
+            return imread(raw_data.uri)
+        if raw_data.format == 'imagezarr':
+            return zarr.open(os.path.join(raw_data.uri, "0", "0"), mode='r')
+        if raw_data.format == 'tablecsv' or raw_data.format == 'numbercsv':
+            return pd.read_csv(raw_data.uri)
+        return None
+
+    def import_local_experiment(self, md_uri):
+        """Create the SQLite database of an experiment stored with the LOCAL service
+
+        The database is created in the experiment directory from the
+        .md.json files. The .md.json files are not modified
+
+        Parameters
+        ----------
+        md_uri: str
+            URI of the experiment.md.json file (or the experiment directory)
+
+        Returns
+        -------
+        Experiment container with the experiment metadata
+
+        """
+        local_service = LocalMetadataService()
+        md_uri = os.path.abspath(md_uri)
+        if os.path.isdir(md_uri):
+            md_uri = os.path.join(md_uri, 'experiment.md.json')
+        experiment = local_service.get_experiment(md_uri)
+        experiment_dir = os.path.dirname(experiment.md_uri)
+        db_path = os.path.join(experiment_dir, SQLITE_FILE)
+        if os.path.exists(db_path):
+            raise DataServiceError(f'The experiment database {db_path} already exists')
+        with self._lock:
+            self._connect(db_path)
+
+        self.update_experiment(experiment)
+        raw_dataset = local_service.get_dataset(experiment.raw_dataset.url)
+        self.update_dataset(raw_dataset)
+        for data_info in raw_dataset.uris:
+            raw_data = local_service.get_raw_data(data_info.md_uri)
+            if raw_data is not None:
+                # get_raw_data set the missing experiment keys to empty values
+                raw_data.key_value_pairs = {key: value for key, value in
+                                            raw_data.key_value_pairs.items() if value != ''}
+                self.update_raw_data(raw_data)
+
+        for dataset_info in experiment.processed_datasets:
+            dataset = local_service.get_dataset(dataset_info.url)
+            self.update_dataset(dataset)
+            run_uris = set()
+            for data_info in dataset.uris:
+                processed_data = local_service.get_processed_data(data_info.md_uri)
+                if processed_data is not None:
+                    self.update_processed_data(processed_data)
+                    run_uris.add(processed_data.run.md_uri)
+            run_uris.add(os.path.join(os.path.dirname(dataset.md_uri), 'run.md.json'))
+            for run_uri in sorted(run_uris):
+                if os.path.isfile(run_uri):
+                    try:
+                        run = local_service.get_run(run_uri)
+                    except KeyError:
+                        # run files written by older versions use another layout
+                        continue
+                    run.processed_dataset = Container(dataset.md_uri, dataset.uuid)
+                    self._write_run(run)
+        return self.get_experiment(experiment_dir)
+
+    def export_local_experiment(self, md_uri):
+        """Write the .md.json files of an experiment stored in a SQLite database
+
+        The files are written in the experiment directory so that the
+        experiment can be read with the LOCAL service
+
+        Parameters
+        ----------
+        md_uri: str
+            URI of the experiment
+
+        Returns
+        -------
+        Experiment container with the experiment metadata
+
+        """
+        local_service = LocalMetadataService()
+        experiment = self.get_experiment(md_uri)
+        datasets = [experiment.raw_dataset] + experiment.processed_datasets
+        for dataset_info in datasets:
+            dataset = self.get_dataset(dataset_info.url)
+            local_service.update_dataset(dataset)
+            for data_info in dataset.uris:
+                if dataset_info is experiment.raw_dataset:
+                    local_service.update_raw_data(self.get_raw_data(data_info.md_uri))
+                else:
+                    local_service.update_processed_data(
+                        self.get_processed_data(data_info.md_uri))
+            for run in self.get_dataset_runs(dataset):
+                local_service._write_run(run)
+        local_service.update_experiment(experiment)
+        return experiment
@@ -10,13 +10,19 @@ ProcessServiceProvider
 
 """
 import os
+import shlex
+import shutil
 import platform
+import threading
 import subprocess
 from subprocess import Popen, PIPE
+from concurrent.futures import ThreadPoolExecutor
 
 from bioimageit_core.core.observer import Observable
 from bioimageit_core.core.config import ConfigAccess
 from bioimageit_core.core.exceptions import ConfigError, RunnerExecError
+from bioimageit_core.core.filelock import FileLock
+from bioimageit_core.core.shell_worker import ShellWorkerPool
 from bioimageit_core.containers.tools_containers import Tool
 
 
@@ -38,6 +44,11 @@ class CondaRunnerService(Observable):
     To initialize the database, you need to set the xml_dirs from
     the configuration and then call initialize
 
+    With the persistent_worker setting of the runner configuration, the
+    environment of a tool is activated once by set_up in long-lived shells,
+    and each command is sent to one of them instead of activating the
+    environment for every data (not available on Windows)
+
     """
 
     def __init__(self):
@@ -48,6 +59,31 @@ class CondaRunnerService(Observable):
             self.conda_dir = ConfigAccess.instance().get('runner')['conda_dir']
         else:
             raise ConfigError('conda_dir is not set in the configuration file in runner section')
+        self.persistent_worker = bool(conf_runner.get('persistent_worker', False)) \
+            and platform.system() != 'Windows'
+        # shell workers of each environment {env name: [ShellWorkerPool, number of jobs]}
+        self._workers = dict()
+        self._workers_lock = threading.Lock()
+        # names of the installed envs, listed once (see _env_registry)
+        self._envs = None
+        self._envs_lock = threading.Lock()
+
+    @staticmethod
+    def _env_name(process: Tool):
+        requirements = process.requirements[0]
+        if 'env' in requirements:
+            return requirements['env']
+        return process.id
+
+    @staticmethod
+    def _command(args):
+        """Build a bash command line where each argument is quoted
+
+        A value containing $, backquotes or quotes stays one argument and
+        is not expanded by the shell
+
+        """
+        return ' '.join(shlex.quote(str(arg)) for arg in args)
 
     def set_up(self, process: Tool, job_id: int):
         """setup the runner
@@ -65,47 +101,173 @@ class CondaRunnerService(Observable):
         requirements = process.requirements[0]
         if requirements['origin'] == 'package' \
                 and requirements['type'] == 'conda':
+            env_name = self._env_name(process)
+            self._install_env(requirements, env_name, job_id)
+            if self.persistent_worker:
+                self._start_workers(env_name)
+        else:
+            raise RunnerExecError(f'Error: service conda cannot run the tool {process.fullname()}')
+
+    # file written in an env directory once the env is created and initialized
+    READY_MARKER = '.bioimageit_ready'
+
+    def _env_dir(self, env_name: str) -> str:
+        return os.path.join(self.conda_dir, 'envs', env_name)
+
+    def _is_env_ready(self, env_name: str) -> bool:
+        return os.path.isfile(os.path.join(self._env_dir(env_name), self.READY_MARKER))
+
+    def _env_registry(self) -> set:
+        """Get the names of the installed envs
+
+        Only the envs with a ready marker are installed: conda creates the
+        env directory at the start of the creation. The envs directory is
+        listed once and kept until invalidate_envs
+
+        """
+        with self._envs_lock:
+            if self._envs is None:
+                envs_dir = os.path.join(self.conda_dir, 'envs')
+                names = os.listdir(envs_dir) if os.path.isdir(envs_dir) else []
+                self._envs = set(name for name in names if self._is_env_ready(name))
+            return self._envs
+
+    def invalidate_envs(self):
+        """Read again the list of the installed envs at the next job"""
+        with self._envs_lock:
+            self._envs = None
+
+    def _install_env(self, requirements: dict, env_name: str, job_id: int) -> bool:
+        """Create a conda env if it does not exists
+
+        The env is created by one thread and one process at a time: the
+        creation holds a lock file in the conda directory. A ready marker is
+        written in the env directory when the env is created and
+        initialized. An env directory without the marker (creation running
+        in another process without the lock, failed or interrupted) is
+        removed and the env is created again
+
+        Parameters
+        ----------
+        requirements: dict
+            Requirements of the tool (package and init command)
+        env_name: str
+            Name of the env
+        job_id: int
+            unique ID of the job. 0 is main app, and positive is a subprocess
+
+        Returns
+        -------
+        True if the env is created, False if it already exists
+
+        """
+        if env_name in self._env_registry():
+            self.notify(f'{env_name} env already exists', job_id)
+            return False
+        lock_file = os.path.join(self.conda_dir, '.bioimageit_locks', f'{env_name}.lock')
+        with FileLock(lock_file):
+            # the env can be created by another job while waiting for the lock
+            if self._is_env_ready(env_name):
+                self.invalidate_envs()
+                self.notify(f'{env_name} env already exists', job_id)
+                return False
+            env_dir = self._env_dir(env_name)
+            if os.path.isdir(env_dir):
+                self.notify(f'{env_name} env is incomplete, it is created again', job_id)
+                shutil.rmtree(env_dir)
             package = requirements['package']
-            env_name = process.id
             init = ''
-            if 'env' in requirements:
-                env_name = requirements['env']
             if 'init' in requirements:
-                init = requirements['init']    
-
-            # get the list of envs
-            envs_list = os.listdir(os.path.join(self.conda_dir, 'envs'))
-
-            if env_name not in envs_list:
+                init = requirements['init']
+            try:
                 # install: create env
                 if platform.system() == 'Windows':
                     # create env
                     condaexe = os.path.join(self.conda_dir, 'condabin', 'conda.bat')
                     args_install = f"{condaexe} create -y -n {env_name} {package}"
-                    print("install env cmd:", args_install)
+                    self.notify(f"Conda install env cmd: {args_install}", job_id)
                     subprocess.run(args_install, check=True)
                     # init run commmand
                     if init != '':
                         args_init = f"{condaexe} activate {env_name} && {init}"
-                        print("init env cmd:", args_init)
+                        self.notify(f"Conda init env cmd: {args_init}", job_id)
                         subprocess.run(args_init, check=True)
 
-                else:    
+                else:
                     condash = os.path.join(self.conda_dir, 'etc', 'profile.d', 'conda.sh')
                     args_install = f". {condash} && conda create -y -n {env_name} {package}"
-                    print("install env cmd:", args_install)
+                    self.notify(f"Conda install env cmd: {args_install}", job_id)
                     subprocess.run(args_install, shell=True, executable='/bin/bash',
                                    check=True)
                     # init run commmand
                     if init != '':
-                        args_init = f". {condash} && conda activate {env_name} && {init}"    
-                        print("init env cmd:", args_init)
+                        args_init = f". {condash} && conda activate {env_name} && {init}"
+                        self.notify(f"Conda init env cmd: {args_init}", job_id)
                         subprocess.run(args_init, shell=True, executable='/bin/bash',
-                                       check=True)               
-            else:
-                self.notify(f'{env_name} env already exists', job_id)
-        else:
-            raise RunnerExecError(f'Error: service conda cannot run the tool {process.fullname()}')
+                                       check=True)
+                with open(os.path.join(env_dir, self.READY_MARKER), 'w'):
+                    pass
+            except (subprocess.CalledProcessError, OSError) as err:
+                raise RunnerExecError(f'Cannot create the env {env_name}: {err}')
+            finally:
+                self.invalidate_envs()
+        return True
+
+    def provision(self, tools: list, max_workers: int = 4) -> dict:
+        """Create the envs of tools ahead of time
+
+        The envs are created in parallel, each env once even if several
+        tools use it
+
+        Parameters
+        ----------
+        tools: list
+            Tool of each tool to provision. The tools that are not conda
+            packages are ignored
+        max_workers: int
+            Number of envs created at the same time
+
+        Returns
+        -------
+        dict {env name: error message, empty if the env is ready}
+
+        """
+        envs = dict()
+        for tool in tools:
+            if len(tool.requirements) == 0:
+                continue
+            requirements = tool.requirements[0]
+            if requirements.get('origin') == 'package' and requirements.get('type') == 'conda':
+                envs.setdefault(self._env_name(tool), requirements)
+
+        def install(item):
+            env_name, requirements = item
+            try:
+                self._install_env(requirements, env_name, 0)
+            except (RunnerExecError, OSError) as err:
+                return env_name, str(err)
+            return env_name, ''
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            return dict(executor.map(install, envs.items()))
+
+    def _start_workers(self, env_name: str):
+        """Create the pool of shell workers of an environment for a new job"""
+        with self._workers_lock:
+            if env_name in self._workers:
+                self._workers[env_name][1] += 1
+                return
+            condash = os.path.join(self.conda_dir, 'etc', 'profile.d', 'conda.sh')
+            pool = ShellWorkerPool(f'. {shlex.quote(condash)} && '
+                                   f'conda activate {shlex.quote(env_name)}')
+            self._workers[env_name] = [pool, 1]
+        # start the first worker now to report an activation error in set_up
+        try:
+            pool.run('true')
+        except RunnerExecError:
+            with self._workers_lock:
+                del self._workers[env_name]
+            raise
 
     def exec(self, process: Tool, args, job_id: int):
         """Execute a process
@@ -120,10 +282,16 @@ class CondaRunnerService(Observable):
             unique ID of the job. 0 is main app, and positive is a subprocess
 
         """
-        requirements = process.requirements[0]
-        env_name = process.id
-        if 'env' in requirements:
-            env_name = requirements['env']
+        env_name = self._env_name(process)
+        with self._workers_lock:
+            workers = self._workers.get(env_name)
+        if workers is not None:
+            command = self._command(args)
+            self.notify(f"Conda exec cmd (worker {env_name}): {command}", job_id)
+            returncode = workers[0].run(command, lambda line: self.notify(line.strip(), job_id))
+            if returncode != 0:
+                raise RunnerExecError(f'return code: {returncode}, for command: {command}')
+            return
 
         if platform.system() == 'Windows':
             condaexe = os.path.join(self.conda_dir, 'condabin', 'conda.bat')
@@ -138,9 +306,8 @@ class CondaRunnerService(Observable):
                 raise RunnerExecError(f'return code: {p.returncode}, for command: {p.args}')
         else:    
             condash = os.path.join(self.conda_dir, 'etc', 'profile.d', 'conda.sh')
-            args_str = '. "' + condash + '"' + ' && conda activate '+env_name+' &&'
-            for arg in args:
-                args_str += ' ' + '"' + arg + '"'
+            args_str = f'. {shlex.quote(condash)} && conda activate {shlex.quote(env_name)} && ' \
+                       + self._command(args)
             self.notify(f"Conda exec cmd: {args_str}", job_id)
             with Popen(args_str, shell=True, executable='/bin/bash', stdout=PIPE, bufsize=1,
                        universal_newlines=True) as p:
@@ -162,4 +329,13 @@ class CondaRunnerService(Observable):
             unique ID of the job. 0 is main app, and positive is a subprocess
 
         """
-        pass
+        env_name = self._env_name(process)
+        with self._workers_lock:
+            workers = self._workers.get(env_name)
+            if workers is None:
+                return
+            workers[1] -= 1
+            if workers[1] > 0:
+                return
+            del self._workers[env_name]
+        workers[0].close()
@@ -11,6 +11,11 @@ ProcessServiceProvider
 """
 
 import os
+import json
+import uuid
+import shlex
+import atexit
+import threading
 import subprocess
 
 from bioimageit_core.core.config import ConfigAccess
@@ -62,13 +67,123 @@ class DockerRunnerService(Observable):
     To initialize the database, you need to set the xml_dirs from
     the configuration and then call initialize
 
+    The containers are kept running after a job (keep_containers setting)
+    and reused by the next jobs with the same image. They are removed when
+    the application ends. The image is pulled only if it is not available
+    locally or if its tag was moved to another digest in the registry,
+    unless the pull setting is 'always'
+
     """
 
     def __init__(self):
         super().__init__()
         self.service_name = 'LocalRunnerService'
+        config = ConfigAccess.instance().config.get('runner', {})
+        self.pull = config.get('pull', 'missing')
+        self.keep_containers = bool(config.get('keep_containers', True))
+        # running containers {image uri: [container name, number of jobs]}
+        self._containers = dict()
+        self._image_locks = dict()
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _docker(self, args, job_id: int = 0):
+        """Run a docker command
+
+        Returns
+        -------
+        The CompletedProcess with the output (stdout and stderr) of the command
+
+        """
+        self.notify(f'docker cmd: {" ".join(args)}', job_id)
+        try:
+            return subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                  universal_newlines=True)
+        except OSError as err:
+            raise RunnerExecError(f'cannot run the command {args}: {err}')
+
+    def _check(self, completed, message: str):
+        if completed.returncode != 0:
+            raise RunnerExecError(f'{message}, return code: {completed.returncode}, '
+                                  f'for command: {completed.args}\n{completed.stdout}')
+
+    def _is_running(self, container_name: str) -> bool:
+        completed = self._docker(['docker', 'inspect', '-f', '{{.State.Running}}',
+                                  container_name])
+        return completed.returncode == 0 and completed.stdout.strip() == 'true'
+
+    def _local_digests(self, image_uri: str):
+        """Get the registry digests of a local image
+
+        Returns
+        -------
+        The list of the digests (sha256:...), or None if the image is not
+        available locally
+
+        """
+        completed = self._docker(['docker', 'image', 'inspect', '-f',
+                                  '{{json .RepoDigests}}', image_uri])
+        if completed.returncode != 0:
+            return None
+        try:
+            repo_digests = json.loads(completed.stdout) or []
+        except ValueError:
+            repo_digests = []
+        return [repo_digest.split('@', 1)[-1] for repo_digest in repo_digests]
+
+    def _registry_digest(self, image_uri: str, job_id: int):
+        """Get the digest of an image tag in the registry
+
+        Returns
+        -------
+        The digest (sha256:...), or None if the registry cannot be read
+        (ex: no network)
+
+        """
+        completed = self._docker(['docker', 'buildx', 'imagetools', 'inspect',
+                                  '--format', '{{json .Manifest}}', image_uri], job_id)
+        if completed.returncode != 0:
+            return None
+        try:
+            return json.loads(completed.stdout).get('digest')
+        except (ValueError, AttributeError):
+            return None
+
+    def _pull(self, image_uri: str, job_id: int):
+        """Pull an image if its digest is not available locally
+
+        An image given with a digest (name@sha256:...) is pulled only if it
+        is not available locally. For an image given with a tag, the local
+        digests are compared with the digest of the tag in the registry. The
+        local image is used if the registry cannot be read
 
-    def set_up(self, process: Tool):
+        """
+        if self.pull != 'always':
+            local_digests = self._local_digests(image_uri)
+            if local_digests is not None:
+                if '@' in image_uri:
+                    self.notify(f'{image_uri} is available locally', job_id)
+                    return
+                registry_digest = self._registry_digest(image_uri, job_id)
+                if registry_digest is None:
+                    self.notify_warning(f'cannot read the digest of {image_uri} in the '
+                                        f'registry, the local image is used', job_id)
+                    return
+                if registry_digest in local_digests:
+                    self.notify(f'{image_uri} ({registry_digest}) is available locally',
+                                job_id)
+                    return
+        self._check(self._docker(['docker', 'pull', image_uri], job_id),
+                    f'cannot pull the image {image_uri}')
+
+    def _container_name(self, process: Tool) -> str:
+        with self._lock:
+            container = self._containers.get(process.container()['uri'])
+        if container is None:
+            raise RunnerExecError(f'No container is running for the tool {process.fullname()}')
+        return container[0]
+
+    def set_up(self, process: Tool, job_id: int = 0):
         """setup the runner
 
         Add here the code to initialize the runner
@@ -77,6 +192,8 @@ class DockerRunnerService(Observable):
         ----------
         process
             Metadata of the process
+        job_id: int
+            unique ID of the job. 0 is main app, and positive is a subprocess
 
         """
         # check container type
@@ -85,67 +202,58 @@ class DockerRunnerService(Observable):
                 "The process " + process.name + " is not compatible with Docker"
             )
         image_uri = process.container()['uri']
-
-        # pull the docker image
-        pull_args = ['docker', 'pull', image_uri]
-        # print('pull cmd: ', pull_args)
-        # print()
-        subprocess.run(pull_args)
-
-        # run the docker image (to create container)
-        docker_data_dir = '/app/data/'
-        working_dir = get_docker_working_dir()
-
-        # get a name for the image
-        image_uri = process.container()['uri']
-        image_name = extract_image_name(process)
-
-        run_args = [
-            'docker',
-            'run',
-            '--name',
-            image_name,
-            '-v',
-            working_dir + ':' + docker_data_dir,
-            '-it',
-            '-d',
-            image_uri,
-        ]
-        print('run cmd: ', run_args)
-        print()
-        subprocess.run(run_args)
-
-    def exec(self, process: Tool, args):
-        """Execute a process
-
-        Parameters
-        ----------
-        process
-            Metadata of the process
-        args
-            list of arguments
-
-        """
-
-        # get a name for the image
-        image_name = extract_image_name(process)
+        with self._lock:
+            image_lock = self._image_locks.setdefault(image_uri, threading.Lock())
+        with image_lock:
+            with self._lock:
+                container = self._containers.get(image_uri)
+            if container is not None:
+                if self._is_running(container[0]):
+                    with self._lock:
+                        container[1] += 1
+                    self.notify(f'reuse the container {container[0]}', job_id)
+                    return
+                # stopped container (ex: docker restarted)
+                self._docker(['docker', 'rm', '-f', container[0]], job_id)
+
+            # pull the docker image
+            self._pull(image_uri, job_id)
+
+            # run the docker image (to create container)
+            docker_data_dir = '/app/data/'
+            working_dir = get_docker_working_dir()
+
+            # get a name for the container
+            container_name = f'{extract_image_name(process)}_{uuid.uuid4().hex[:8]}'
+            run_args = [
+                'docker',
+                'run',
+                '--name',
+                container_name,
+                '-v',
+                working_dir + ':' + docker_data_dir,
+                '-it',
+                '-d',
+                image_uri,
+            ]
+            self._check(self._docker(run_args, job_id),
+                        f'cannot start a container of {image_uri}')
+            with self._lock:
+                self._containers[image_uri] = [container_name, 1]
+
+    def _container_args(self, process: Tool, args):
+        """Convert the paths of the arguments to the paths in the container"""
         docker_data_dir = '/app/data/'
         working_dir = get_docker_working_dir()
-
-        # exec the command
-
-        exec_args = ['docker', 'exec', image_name]
+        container_args = []
         for arg in args:
             arg = arg.replace('\\\\', '/').replace('\\', "/")
-            print('arg =', arg)
             modified_arg = arg
 
             modified_arg = modified_arg.replace(working_dir, docker_data_dir)
 
             for input_ in process.inputs:
-                # print('input ', input_.name, ' is data ', input_.is_data)
                 if input_.is_data:
-                    # print('input ', input_.name, ' goes to  modify_io_path with value ', input_.value)
                     modif_arg = self.modify_io_path(
                         arg, input_.value, working_dir, docker_data_dir
                     )
@@ -153,19 +261,96 @@ class DockerRunnerService(Observable):
                         modified_arg = modif_arg
             for output in process.outputs:
                 if output.is_data:
-                    # print('output ', output.name, ' goes to  modify_io_path with value ', output.value)
                     modif_arg = self.modify_io_path(
                         arg, output.value, working_dir, docker_data_dir
                     )
                     if modif_arg != '':
                         modified_arg = modif_arg
-            exec_args.append(modified_arg)
-        print('exec cmd: ', exec_args)
-        print()
-        subprocess.run(exec_args)
-        # subprocess.run(['docker', 'stop', image_name])
+            container_args.append(modified_arg)
+        return container_args
+
+    def exec(self, process: Tool, args, job_id: int = 0):
+        """Execute a process
+
+        Parameters
+        ----------
+        process
+            Metadata of the process
+        args
+            list of arguments
+        job_id: int
+            unique ID of the job. 0 is main app, and positive is a subprocess
+
+        """
+        exec_args = ['docker', 'exec', self._container_name(process)] + \
+            self._container_args(process, args)
+        completed = self._docker(exec_args, job_id)
+        for line in completed.stdout.splitlines():
+            self.notify(line, job_id)
+        self._check(completed, 'the command failed')
 
-    def tear_down(self, process: Tool):
+    def exec_batch(self, process: Tool, args_list: list, job_id: int = 0) -> list:
+        """Execute a process on several data with one docker exec
+
+        The commands are written to a script in the working directory and
+        run one after the other in the container
+
+        Parameters
+        ----------
+        process
+            Metadata of the process
+        args_list
+            list of the arguments of each command
+        job_id: int
+            unique ID of the job. 0 is main app, and positive is a subprocess
+
+        Returns
+        -------
+        list with None for each command that succeeded, or the
+        RunnerExecError of the command
+
+        """
+        container_name = self._container_name(process)
+        working_dir = get_docker_working_dir()
+        marker = f'__bioimageit_end_{uuid.uuid4().hex}__'
+        script_name = f'.bioimageit_batch_{uuid.uuid4().hex}.sh'
+        commands = []
+        lines = []
+        for i, args in enumerate(args_list):
+            command = ' '.join(shlex.quote(arg) for arg in self._container_args(process, args))
+            commands.append(command)
+            lines.append(f'{command} < /dev/null 2>&1')
+            lines.append(f'printf "\\n{marker} {i} %d\\n" $?')
+        script_path = os.path.join(working_dir, script_name)
+        with open(script_path, 'w', newline='\n') as script:
+            script.write('#!/bin/sh\n' + '\n'.join(lines) + '\n')
+        try:
+            completed = self._docker(['docker', 'exec', container_name, 'sh',
+                                      '/app/data/' + script_name], job_id)
+        finally:
+            os.remove(script_path)
+
+        results = [None] * len(args_list)
+        done = set()
+        output = []
+        for line in completed.stdout.splitlines():
+            if line.startswith(marker):
+                i, returncode = [int(value) for value in line[len(marker):].split()]
+                if returncode != 0:
+                    results[i] = RunnerExecError(f'return code: {returncode}, for command: '
+                                                 f'{commands[i]}\n' + '\n'.join(output))
+                done.add(i)
+                output = []
+            elif line != '' or output:
+                self.notify(line, job_id)
+                output.append(line)
+        for i in range(len(args_list)):
+            if i not in done:
+                results[i] = RunnerExecError(f'the batch stopped before the command: '
+                                             f'{commands[i]}\n{completed.stdout}')
+        return results
+
+    def tear_down(self, process: Tool, job_id: int = 0):
         """tear down the runner
 
         Add here the code to down/clean the runner
@@ -174,21 +359,34 @@ class DockerRunnerService(Observable):
         ----------
         process
             Metadata of the process
+        job_id: int
+            unique ID of the job. 0 is main app, and positive is a subprocess
 
         """
-        image_name = extract_image_name(process)
-
+        image_uri = process.container()['uri']
+        with self._lock:
+            container = self._containers.get(image_uri)
+            if container is None:
+                return
+            container[1] -= 1
+            if container[1] > 0 or self.keep_containers:
+                return
+            del self._containers[image_uri]
+        self._remove_container(container[0], job_id)
+
+    def _remove_container(self, container_name: str, job_id: int = 0):
         # stop container
-        stop_args = ['docker', 'stop', image_name]
-        print('stop cmd: ', stop_args)
-        print()
-        subprocess.run(stop_args)
-
+        self._docker(['docker', 'stop', container_name], job_id)
         # remove container
-        rm_args = ['docker', 'rm', image_name]
-        print('rm cmd: ', rm_args)
-        print()
-        subprocess.run(rm_args)
+        self._docker(['docker', 'rm', container_name], job_id)
+
+    def close(self):
+        """Stop and remove all the containers started by the runner"""
+        with self._lock:
+            containers = list(self._containers.values())
+            self._containers = dict()
+        for container in containers:
+            self._remove_container(container[0])
 
     @staticmethod
     def modify_io_path(
@@ -13,6 +13,7 @@ ProcessServiceProvider
 import subprocess
 
 from bioimageit_core.core.observer import Observable
+from bioimageit_core.core.exceptions import RunnerExecError
 from bioimageit_core.containers.tools_containers import Tool
 
 
@@ -40,7 +41,7 @@ class LocalRunnerService(Observable):
         super().__init__()
         self.service_name = 'LocalRunnerService'
 
-    def set_up(self, process: Tool):
+    def set_up(self, process: Tool, job_id: int = 0):
         """setup the runner
 
         Add here the code to initialize the runner
@@ -49,11 +50,13 @@ class LocalRunnerService(Observable):
         ----------
         tool
             Metadata of the tool
+        job_id: int
+            unique ID of the job. 0 is main app, and positive is a subprocess
 
         """
         pass
 
-    def exec(self, process: Tool, args):
+    def exec(self, process: Tool, args, job_id: int = 0):
         """Execute a process
 
         Parameters
@@ -62,11 +65,18 @@ class LocalRunnerService(Observable):
             Metadata of the process
         args
             list of arguments
+        job_id: int
+            unique ID of the job. 0 is main app, and positive is a subprocess
 
         """
-        subprocess.run(args)
-
-    def tear_down(self, process: Tool):
+        try:
+            completed = subprocess.run(args)
+        except OSError as err:
+            raise RunnerExecError(f'cannot run the command {args}: {err}')
+        if completed.returncode != 0:
+            raise RunnerExecError(f'return code: {completed.returncode}, for command: {args}')
+
+    def tear_down(self, process: Tool, job_id: int = 0):
         """tear down the runner
 
         Add here the code to down/clean the runner
@@ -75,6 +85,8 @@ class LocalRunnerService(Observable):
         ----------
         process
             Metadata of the process
+        job_id: int
+            unique ID of the job. 0 is main app, and positive is a subprocess
 
         """
         pass
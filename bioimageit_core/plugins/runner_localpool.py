@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""bioimageit_core local pool process service.
+
+This module implements a service to run the tools installed locally on a
+bounded pool of resources. Each command reserves CPU and memory slots before
+it starts, so the data processed at the same time (max_workers) cannot
+overload a shared node. The commands run with a timeout and resource limits
+(RLIMIT), and the resources used by each command are reported to the
+observers.
+
+Classes
+-------
+ResourceSlots
+LocalPoolRunnerServiceBuilder
+LocalPoolRunnerService
+
+"""
+
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from bioimageit_core.core.observer import Observable
+from bioimageit_core.core.exceptions import ConfigError, RunnerExecError
+from bioimageit_core.core.result_cache import parse_size
+from bioimageit_core.containers.tools_containers import Tool
+from bioimageit_core.containers.runners_containers import ExecStats
+
+
+class LocalPoolRunnerServiceBuilder:
+    """Service builder for the runner service"""
+
+    def __init__(self):
+        self._instance = None
+
+    def __call__(self, cpu_slots=0, memory=0, command_cpus=1, command_memory=0,
+                 timeout=0, cpu_time_limit=0, **_ignored):
+        if not self._instance:
+            self._instance = LocalPoolRunnerService(cpu_slots, memory, command_cpus,
+                                                    command_memory, timeout, cpu_time_limit)
+        return self._instance
+
+
+class ResourceSlots:
+    """CPU and memory available to the commands
+
+    Parameters
+    ----------
+    cpus: int
+        Number of CPU slots
+    memory: int
+        Memory in bytes. The memory is not limited if 0
+
+    """
+    def __init__(self, cpus: int, memory: int = 0):
+        self.cpus = cpus
+        self.memory = memory
+        self.free_cpus = cpus
+        self.free_memory = memory
+        self._condition = threading.Condition()
+
+    def _clamp(self, cpus: int, memory: int):
+        # a command needing more than the total would wait forever
+        cpus = min(cpus, self.cpus)
+        memory = min(memory, self.memory) if self.memory > 0 else 0
+        return cpus, memory
+
+    def acquire(self, cpus: int, memory: int = 0):
+        """Wait until the resources are free and reserve them"""
+        cpus, memory = self._clamp(cpus, memory)
+        with self._condition:
+            self._condition.wait_for(lambda: self.free_cpus >= cpus and
+                                     self.free_memory >= memory)
+            self.free_cpus -= cpus
+            self.free_memory -= memory
+
+    def release(self, cpus: int, memory: int = 0):
+        """Free resources reserved with acquire"""
+        cpus, memory = self._clamp(cpus, memory)
+        with self._condition:
+            self.free_cpus += cpus
+            self.free_memory += memory
+            self._condition.notify_all()
+
+
+class LocalPoolRunnerService(Observable):
+    """Service for local runner exec on a bounded pool of resources
+
+    Parameters
+    ----------
+    cpu_slots: int
+        Number of CPU slots shared by the commands. The number of CPUs of
+        the machine if 0
+    memory: int or str
+        Memory shared by the commands (ex: '16GB'). Not limited if 0
+    command_cpus: int
+        CPU slots reserved by each command
+    command_memory: int or str
+        Memory reserved by each command. It is also the maximum address
+        space of the command (RLIMIT_AS). Not limited if 0
+    timeout: float
+        Maximum duration of a command in seconds. Not limited if 0
+    cpu_time_limit: int
+        Maximum CPU time of a command in seconds (RLIMIT_CPU). Not limited
+        if 0
+
+    Attributes
+    ----------
+    stats: dict
+        ExecStats of the commands run by each job {job_id: [ExecStats]}
+
+    """
+
+    def __init__(self, cpu_slots: int = 0, memory=0, command_cpus: int = 1,
+                 command_memory=0, timeout: float = 0, cpu_time_limit: int = 0):
+        super().__init__()
+        self.service_name = 'LocalPoolRunnerService'
+        try:
+            cpu_slots = int(cpu_slots) or os.cpu_count() or 1
+            self.command_cpus = max(1, int(command_cpus))
+            self.timeout = float(timeout)
+            self.cpu_time_limit = int(cpu_time_limit)
+        except ValueError as err:
+            raise ConfigError(f'Wrong value in the LOCALPOOL runner configuration: {err}')
+        self.command_memory = parse_size(command_memory)
+        self.slots = ResourceSlots(cpu_slots, parse_size(memory))
+        self.stats = dict()
+        self._stats_lock = threading.Lock()
+
+    def set_up(self, process: Tool, job_id: int = 0):
+        """setup the runner
+
+        Add here the code to initialize the runner
+
+        Parameters
+        ----------
+        tool
+            Metadata of the tool
+        job_id: int
+            unique ID of the job. 0 is main app, and positive is a subprocess
+
+        """
+        with self._stats_lock:
+            self.stats[job_id] = []
+
+    def _limits(self):
+        """Resource limits of the commands [(resource, value)]"""
+        limits = []
+        if resource is not None and self.command_memory > 0:
+            limits.append((resource.RLIMIT_AS, self.command_memory))
+        if resource is not None and self.cpu_time_limit > 0:
+            limits.append((resource.RLIMIT_CPU, self.cpu_time_limit))
+        return limits
+
+    def _command(self, args):
+        """Get the command to start
+
+        Without prlimit (ex: macOS), the command is started by a shell that
+        sets the limits with ulimit
+
+        """
+        limits = self._limits()
+        if not limits or hasattr(resource, 'prlimit'):
+            return args
+        options = []
+        for limit, value in limits:
+            if limit == resource.RLIMIT_AS:
+                options.append(f'ulimit -v {value // 1024}')
+            else:
+                options.append(f'ulimit -t {value}')
+        return ['/bin/sh', '-c', ' && '.join(options) + ' && exec "$@"', 'sh'] + list(args)
+
+    def _limit_resources(self, pid: int):
+        """Set the resource limits of a started process
+
+        The limits are set from the parent with prlimit, since a preexec_fn
+        is not safe when the commands are started by several threads
+
+        """
+        if not hasattr(resource, 'prlimit'):
+            return
+        for limit, value in self._limits():
+            try:
+                resource.prlimit(pid, limit, (value, value))
+            except ProcessLookupError:
+                # the command already ended
+                return
+
+    @staticmethod
+    def _wait_exit(popen):
+        """Wait for the end of a process without reaping it
+
+        Its PID cannot be reused by another process until _wait is called
+
+        """
+        if hasattr(os, 'waitid'):
+            os.waitid(os.P_PID, popen.pid, os.WEXITED | os.WNOWAIT)
+
+    def _wait(self, popen):
+        """Wait for the end of a process and get its resources usage
+
+        Returns
+        -------
+        (return code, cpu time, peak memory in bytes). The cpu time and peak
+        memory are None when the platform does not report them
+
+        """
+        if not hasattr(os, 'wait4'):
+            return popen.wait(), None, None
+        _, status, usage = os.wait4(popen.pid, 0)
+        if os.WIFSIGNALED(status):
+            popen.returncode = -os.WTERMSIG(status)
+        else:
+            popen.returncode = os.WEXITSTATUS(status)
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        max_rss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+        return popen.returncode, usage.ru_utime + usage.ru_stime, max_rss
+
+    def exec(self, process: Tool, args, job_id: int = 0):
+        """Execute a process
+
+        The command waits for free CPU and memory slots, then runs with the
+        resource limits. Its output and used resources are sent to the
+        observers
+
+        Parameters
+        ----------
+        process
+            Metadata of the process
+        args
+            list of arguments
+        job_id: int
+            unique ID of the job. 0 is main app, and positive is a subprocess
+
+        Raises
+        ------
+        RunnerExecError if the command cannot start, fails or is too long
+
+        """
+        self.slots.acquire(self.command_cpus, self.command_memory)
+        try:
+            start = time.perf_counter()
+            try:
+                popen = subprocess.Popen(self._command(args), stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT, universal_newlines=True)
+            except OSError as err:
+                raise RunnerExecError(f'cannot run the command {args}: {err}')
+            self._limit_resources(popen.pid)
+            timer = None
+            timed_out = threading.Event()
+            if self.timeout > 0:
+                def kill():
+                    timed_out.set()
+                    # not popen.kill(), that can reap the process
+                    if hasattr(os, 'wait4'):
+                        os.kill(popen.pid, signal.SIGKILL)
+                    else:
+                        popen.kill()
+                timer = threading.Timer(self.timeout, kill)
+                timer.start()
+            try:
+                for line in popen.stdout:
+                    self.notify(line.rstrip('\n'), job_id)
+                popen.stdout.close()
+                self._wait_exit(popen)
+            finally:
+                # the timer is stopped before the process is reaped, so that
+                # it cannot kill another process reusing the PID
+                if timer is not None:
+                    timer.cancel()
+                    timer.join()
+            returncode, cpu_time, max_rss = self._wait(popen)
+            stats = ExecStats(os.path.basename(str(args[0])), returncode,
+                              time.perf_counter() - start, cpu_time, max_rss)
+        finally:
+            self.slots.release(self.command_cpus, self.command_memory)
+
+        with self._stats_lock:
+            self.stats.setdefault(job_id, []).append(stats)
+        self.notify(f'resources used by {stats}', job_id)
+        if timed_out.is_set():
+            raise RunnerExecError(f'timeout after {self.timeout}s, for command: {args}')
+        if returncode != 0:
+            raise RunnerExecError(f'return code: {returncode}, for command: {args}')
+
+    def job_stats(self, job_id: int = 0) -> ExecStats:
+        """Get the total resources used by the commands of a job
+
+        Returns
+        -------
+        ExecStats with the sum of the wall and cpu times, and the highest
+        peak memory of the commands
+
+        """
+        with self._stats_lock:
+            stats = list(self.stats.get(job_id, []))
+        total = ExecStats(f'{len(stats)} commands')
+        for item in stats:
+            total.wall_time += item.wall_time
+            if item.cpu_time is not None:
+                total.cpu_time = (total.cpu_time or 0) + item.cpu_time
+            if item.max_rss is not None:
+                total.max_rss = max(total.max_rss or 0, item.max_rss)
+        return total
+
+    def tear_down(self, process: Tool, job_id: int = 0):
+        """tear down the runner
+
+        Add here the code to down/clean the runner
+
+        Parameters
+        ----------
+        process
+            Metadata of the process
+        job_id: int
+            unique ID of the job. 0 is main app, and positive is a subprocess
+
+        """
+        self.notify(f'resources used by {self.job_stats(job_id)}', job_id)
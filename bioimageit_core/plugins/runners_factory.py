@@ -11,6 +11,7 @@ RunnerServiceProvider
 
 from bioimageit_core.core.factory import ObjectFactory
 from bioimageit_core.plugins.runner_local import LocalRunnerServiceBuilder
+from bioimageit_core.plugins.runner_localpool import LocalPoolRunnerServiceBuilder
 from bioimageit_core.plugins.runner_conda import CondaRunnerServiceBuilder
 #from bioimageit_core.runners.service_singularity import \
 #    SingularityRunnerServiceBuilder
@@ -26,6 +27,7 @@ class RunnerServiceProvider(ObjectFactory):
 
 runnerServices = RunnerServiceProvider()
 runnerServices.register_builder('LOCAL', LocalRunnerServiceBuilder())
+runnerServices.register_builder('LOCALPOOL', LocalPoolRunnerServiceBuilder())
 runnerServices.register_builder('CONDA', CondaRunnerServiceBuilder())
 #runnerServices.register_builder('SINGULARITY',
 #                                SingularityRunnerServiceBuilder())
@@ -10,9 +10,12 @@ ProcessServiceProvider
 
 """
 import os
+import time
+import pickle
 import xml.etree.ElementTree as ETree
 import json
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 
 from bioimageit_core.containers.pipeline_containers import (Pipeline, PipelineParameter, 
                                                             PipelineStep, PipelineInput, 
@@ -33,6 +36,8 @@ from bioimageit_core.containers.tools_containers import (Tool,
                                                          PARAM_BOOLEAN,
                                                          PARAM_STRING
                                                          )
+from bioimageit_core.core.cache import FileCache
+from bioimageit_core.core.tool_search import ToolSearchIndex
 from bioimageit_core.core.exceptions import ToolsServiceError, ToolNotFoundError
 
 
@@ -42,12 +47,13 @@ class LocalToolsServiceBuilder:
     def __init__(self):
         self._instance = None
 
-    def __call__(self, xml_dirs, categories, **_ignored):
+    def __call__(self, xml_dirs, categories, rebuild_index=False, tools_cache_size=256,
+                 parse_workers=1, **_ignored):
         if not self._instance:
-            self._instance = LocalToolsService()
+            self._instance = LocalToolsService(int(tools_cache_size), int(parse_workers))
             self._instance.xml_dirs = xml_dirs
             self._instance.categories_json = categories
-            self._instance.load()
+            self._instance.load(rebuild_index)
         return self._instance
 
 
@@ -57,14 +63,46 @@ class LocalToolsService:
     To initialize the database, you need to set the xml_dirs from
     the configuration and then call initialize
 
+    The main information of the tools are saved in an index file next to
+    the categories file. At the next load, only the XML files that are new
+    or modified since the index was written are parsed
+
+    When two XML files declare the same tool id and version, the first file
+    (in the xml_dirs order, then in the alphabetical order of the paths) is
+    kept, and the conflict is recorded
+
+    Parameters
+    ----------
+    tools_cache_size: int
+        Maximum number of parsed tools kept in memory by get_tool
+    parse_workers: int
+        Number of threads parsing the XML files when the database is built
+
+    Attributes
+    ----------
+    conflicts: dict
+        Paths of the XML files declaring the same tool {fullname: [paths]}.
+        The first path is the one in the database
+    parse_timings: dict
+        Time spent parsing each XML file in seconds {path: time} during the
+        last build of the database. The files read from the index are not
+        parsed
+
     """
+    INDEX_FILE = '.bioimageit_tools_index.json'
+    INDEX_FORMAT = 2
 
-    def __init__(self):
+    def __init__(self, tools_cache_size: int = 256, parse_workers: int = 1):
         self.service_name = 'LocalProcessService'
         self.xml_dirs = []
         self.categories_json = ''
         self.database = {}
         self.categories = []
+        self.tools_cache = FileCache(tools_cache_size, signature=self._tool_signature)
+        self.parse_workers = parse_workers
+        self.conflicts = dict()
+        self.parse_timings = dict()
+        self.search_index = ToolSearchIndex()
 
     def _load_categories(self):
         """Load the categories database
@@ -92,39 +130,213 @@ class LocalToolsService:
             container.parent = categories['parent']
             self.categories.append(container)
 
-    def load(self):
-        """Build the process and categories database"""
-        self._load_database()
+    def load(self, rebuild_index: bool = False):
+        """Build the process and categories database
+
+        Parameters
+        ----------
+        rebuild_index: bool
+            True to parse all the XML files, even if they did not change
+            since the index file was written
+
+        """
+        self._load_database(rebuild_index)
         self._load_categories()
 
-    def _load_database(self):
+    def _index_file(self) -> str:
+        """Path of the tools index file, or '' if there is no categories file"""
+        if self.categories_json == '':
+            return ''
+        return os.path.join(os.path.dirname(os.path.abspath(self.categories_json)),
+                            LocalToolsService.INDEX_FILE)
+
+    @staticmethod
+    def _read_index(index_file: str) -> dict:
+        """Read the entries of the tools index file
+
+        Returns
+        -------
+        The entry of each XML file {path: entry}. Empty if the file is
+        missing, unreadable or from another format
+
+        """
+        try:
+            with open(index_file) as file:
+                content = json.load(file)
+        except (OSError, ValueError):
+            return dict()
+        if not isinstance(content, dict) or \
+                content.get('format') != LocalToolsService.INDEX_FORMAT:
+            return dict()
+        return content.get('tools', dict())
+
+    @staticmethod
+    def _write_index(index_file: str, entries: dict):
+        """Write the tools index file
+
+        The index is only an optimization: it is not written if the
+        directory is read only
+
+        """
+        tmp_file = f'{index_file}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_file, 'w') as file:
+                json.dump({'format': LocalToolsService.INDEX_FORMAT, 'tools': entries}, file)
+            os.replace(tmp_file, index_file)
+        except OSError:
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+
+    def _load_database(self, rebuild_index: bool = False):
         """Build the database
 
         Parse the source directories and build the database
 
+        Parameters
+        ----------
+        rebuild_index: bool
+            True to ignore the index file
+
         """
+        index_file = self._index_file()
+        previous = dict()
+        if index_file != '' and not rebuild_index:
+            previous = self._read_index(index_file)
+        entries = dict()
+        self.conflicts = dict()
+        self.parse_timings = dict()
+        paths = []
         for dir_ in self.xml_dirs:
-            # print("process database parse dir ", dir_)
-            # print("process database parse dir abs ", os.path.abspath(dir_))
-            self._parse_dir(os.path.abspath(dir_))
+            paths.extend(self._list_xml_files(os.path.abspath(dir_)))
+        self._parse_files(paths, previous, entries)
+        self.search_index.build(self.database)
+        if index_file != '' and entries != previous and \
+                (entries or os.path.isfile(index_file)):
+            self._write_index(index_file, entries)
+
+    @staticmethod
+    def _file_state(process_path: str) -> list:
+        """Modification time and size of a tool XML file and of its .shed.yml"""
+        stat = os.stat(process_path)
+        state = [stat.st_mtime_ns, stat.st_size, None]
+        shed_file = os.path.join(os.path.dirname(process_path), '.shed.yml')
+        if os.path.isfile(shed_file):
+            shed_stat = os.stat(shed_file)
+            state[2] = [shed_stat.st_mtime_ns, shed_stat.st_size]
+        return state
 
-    def _parse_dir(self, root_dir: str):
+    @staticmethod
+    def _tool_signature(process_path: str):
+        """Signature of a tool in the tools cache (see FileCache.signature)
+
+        The tool categories are read from the .shed.yml file
+
+        """
+        try:
+            return LocalToolsService._file_state(process_path)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _index_from_dict(tool: dict) -> ToolIndexContainer:
+        info = ToolIndexContainer()
+        info.uri = tool['uri']
+        info.id = tool['id']
+        info.name = tool['name']
+        info.version = tool['version']
+        info.type = tool['type']
+        info.categories = tool['categories']
+        info.description = tool['description']
+        info.help = tool['help']
+        return info
+
+    @staticmethod
+    def _list_xml_files(root_dir: str) -> list:
+        """Get the paths of the XML files of a directory, in alphabetical order"""
+        paths = []
+        for current_path, subs, files in os.walk(root_dir):
+            subs.sort()
+            for file in sorted(files):
+                if file.endswith('.xml'):
+                    paths.append(os.path.join(current_path, file))
+        return paths
+
+    @staticmethod
+    def _timed_parse(process_path: str):
+        start = time.perf_counter()
+        info = ToolParser(process_path).parse_main_info()
+        return info, time.perf_counter() - start
+
+    def _add_tool(self, info: ToolIndexContainer):
+        """Add a tool to the database, unless another file declares the same tool"""
+        fullname = info.id + '_v' + info.version
+        existing = self.database.get(fullname)
+        if existing is not None and existing.uri != info.uri:
+            self.conflicts.setdefault(fullname, [existing.uri]).append(info.uri)
+            return
+        self.database[fullname] = info
+
+    def _parse_files(self, paths: list, previous: dict = None, entries: dict = None):
+        """Load process info XMLs
+
+        The files are parsed on parse_workers threads, and added to the
+        database in the order of paths
+
+        Parameters
+        ----------
+        paths
+            Paths of the XML files
+        previous
+            Entries of the index file {path: entry}. The files that did not
+            change are not parsed
+        entries
+            The entries of the files are added to it
+
+        """
+        previous = previous or dict()
+        states = [self._file_state(process_path) for process_path in paths]
+        infos = [None] * len(paths)
+        to_parse = []
+        for i, process_path in enumerate(paths):
+            entry = previous.get(process_path)
+            if entry is not None and entry['state'] == states[i]:
+                if entry['tool'] is not None:
+                    infos[i] = self._index_from_dict(entry['tool'])
+            else:
+                to_parse.append(i)
+
+        to_parse_paths = [paths[i] for i in to_parse]
+        if self.parse_workers > 1 and len(to_parse) > 1:
+            with ThreadPoolExecutor(max_workers=self.parse_workers) as executor:
+                results = list(executor.map(self._timed_parse, to_parse_paths))
+        else:
+            results = [self._timed_parse(process_path) for process_path in to_parse_paths]
+        for i, (info, duration) in zip(to_parse, results):
+            infos[i] = info
+            self.parse_timings[paths[i]] = duration
+
+        for process_path, state, info in zip(paths, states, infos):
+            if entries is not None:
+                entries[process_path] = {'state': state,
+                                         'tool': info.to_dict() if info else None}
+            if info:
+                self._add_tool(info)
+
+    def _parse_dir(self, root_dir: str, previous: dict = None, entries: dict = None):
         """Load process info XMLs
 
         Parameters
         ----------
         root_dir
             Directory to parse
+        previous
+            Entries of the index file {path: entry}. The files that did not
+            change are not parsed
+        entries
+            The entries of the parsed directory are added to it
 
         """
-        for current_path, subs, files in os.walk(root_dir):
-            for file in files:
-                if file.endswith('.xml'):
-                    process_path = os.path.join(current_path, file)
-                    parser = ToolParser(process_path)
-                    info = parser.parse_main_info()
-                    if info:
-                        self.database[info.id + '_v' + info.version] = info
+        self._parse_files(self._list_xml_files(root_dir), previous, entries)
 
     @staticmethod
     def read_tool(uri: str) -> Tool:
@@ -143,6 +355,10 @@ class LocalToolsService:
         parser = ToolParser(uri)
         return parser.parse()
 
+    @staticmethod
+    def _dump_tool(uri: str) -> bytes:
+        return pickle.dumps(LocalToolsService.read_tool(uri), pickle.HIGHEST_PROTOCOL)
+
     @staticmethod
     def read_process_index(uri: str) -> ToolIndexContainer:
         """Read the basic indexation information of a Process
@@ -160,34 +376,34 @@ class LocalToolsService:
         parser = ToolParser(uri)
         return parser.parse_main_info()
 
-    def search(self, keyword: str):
+    def search(self, keyword: str, limit: int = 0):
         """Search a process using a keyword in the database
 
-        This method print the list of funded processed
+        The keyword words are searched in the id, name, categories,
+        description and help of the tools, with prefix and approximate
+        matching (see ToolSearchIndex)
 
         Parameters
         ----------
         keyword
             Keyword to search in the database
+        limit
+            Maximum number of processes returned. No limit if 0
 
         Returns
         -------
-        The list of the processes index information
+        The list of the processes index information, the most relevant first
 
         """
-        list_ = []
-        if keyword == '':
-            for name in self.database:
-                list_.append(self.database[name])
-        else:
-            for name in self.database:
-                if keyword.lower() in name.lower():
-                    list_.append(self.database[name])
-        return list_
+        return self.search_index.search(keyword, limit)
 
     def get_tool(self, fullname: str):
         """Get a process by name
 
+        The parsed tools are kept in memory (serialized) while their XML
+        and .shed.yml files are not modified. Each call returns a new copy that the caller
+        can modify. Unpickling is several times faster than a deepcopy
+
         Parameters
         ----------
         fullname
@@ -195,13 +411,12 @@ class LocalToolsService:
 
         Returns
         -------
-        The URI of the process or None
+        The Tool container of the process
 
         """
-        print('get tool:', fullname)
         if fullname in self.database:
-            parser = ToolParser(self.database[fullname].uri)
-            return parser.parse()
+            content = self.tools_cache.get(self.database[fullname].uri, self._dump_tool)
+            return pickle.loads(content)
         else:
             raise ToolNotFoundError(f'The tool {fullname} cannot be found in the database')
 
@@ -225,12 +440,7 @@ class LocalToolsService:
             ID of the category
 
         """
-        out_list = []
-        for name in self.database:
-            process_container = self.database[name]
-            if category in process_container.categories:
-                out_list.append(process_container)
-        return out_list
+        return self.search_index.category_tools(category)
 
     def get_processes_database(self):
         """Get the dictionary of processed"""
@@ -276,6 +486,7 @@ class PipelineParser:
             step_container.name = step['name']
             step_container.tool = step['tool']
             step_container.output_dataset_name = step['output_dataset_name']
+            step_container.max_workers = int(step.get('max_workers', 0))
             for input in step['inputs']:
                 input_container = PipelineInput()
                 input_container.name = input['name']
@@ -352,13 +563,14 @@ class ToolParser:
         if 'type' in self._root.attrib:
             info.type = self._root.attrib['type']
         for child in self._root:
-            if child.tag == 'help':
+            if child.tag == 'description' and child.text:
+                info.description = child.text.replace('\t', '').strip()
+            elif child.tag == 'help':
                 tmp = child.text
                 tmp = tmp.replace(" ", "")
                 tmp = tmp.replace("\n", "")
                 tmp = tmp.replace("\t", "")
                 info.help = tmp
-                break
         info.categories = self._parse_categories()
         return info
 
@@ -0,0 +1,93 @@
+import unittest
+import os
+import os.path
+import json
+import shutil
+import tempfile
+
+from bioimageit_core.core.cache import FileCache
+from bioimageit_core.plugins.data_local import LocalMetadataService
+from bioimageit_core.core.serialize import serialize_raw_data
+from tests.metadata import create_raw_data
+
+
+def read_json(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file = os.path.join(self.tmp_dir, 'data.md.json')
+        with open(self.file, 'w') as file:
+            json.dump({'name': 'data1'}, file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_hit(self):
+        cache = FileCache(10)
+        cache.get(self.file, read_json)
+        value = cache.get(self.file, read_json)
+        self.assertEqual(value['name'], 'data1')
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_file_changed(self):
+        cache = FileCache(10)
+        cache.get(self.file, read_json)
+        with open(self.file, 'w') as file:
+            json.dump({'name': 'data1_changed'}, file)
+        value = cache.get(self.file, read_json)
+        self.assertEqual(value['name'], 'data1_changed')
+
+    def test_lru(self):
+        cache = FileCache(2)
+        files = []
+        for i in range(3):
+            file = os.path.join(self.tmp_dir, f'data{i}.md.json')
+            with open(file, 'w') as fp:
+                json.dump({'name': f'data{i}'}, fp)
+            files.append(file)
+            cache.get(file, read_json)
+        self.assertEqual(len(cache), 2)
+        self.assertFalse(files[0] in cache)
+        self.assertTrue(files[2] in cache)
+
+    def test_invalidate(self):
+        cache = FileCache(10)
+        cache.get(self.file, read_json)
+        cache.invalidate(self.file)
+        self.assertFalse(self.file in cache)
+
+
+class TestLocalMetadataServiceCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.experiment_dir = os.path.join(self.tmp_dir, 'test_metadata_local')
+        shutil.copytree(os.path.join('tests', 'test_metadata_local'),
+                        self.experiment_dir)
+        self.rawdata_file = os.path.join(self.experiment_dir, 'data',
+                                         'population1_001.md.json')
+        self.service = LocalMetadataService(cache_size=100)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_raw_data(self):
+        self.service.get_raw_data(self.rawdata_file)
+        raw_data = self.service.get_raw_data(self.rawdata_file)
+        ref_raw_data = create_raw_data()
+        ref_raw_data.uri = os.path.join(self.experiment_dir, 'data',
+                                        'population1_001.tif')
+        self.assertEqual(serialize_raw_data(raw_data),
+                         serialize_raw_data(ref_raw_data))
+        self.assertGreater(self.service._cache.hits, 0)
+
+    def test_update_raw_data(self):
+        raw_data = self.service.get_raw_data(self.rawdata_file)
+        raw_data.set_key_value_pair('Population', 'population2')
+        self.service.update_raw_data(raw_data)
+        raw_data = self.service.get_raw_data(self.rawdata_file)
+        self.assertEqual(raw_data.key_value_pairs['Population'], 'population2')
@@ -0,0 +1,44 @@
+import unittest
+
+from bioimageit_core.core.command import CommandTemplate
+from bioimageit_core.core.exceptions import RunnerExecError
+
+
+class TestCommandTemplate(unittest.TestCase):
+    def test_render(self):
+        template = CommandTemplate('denoise -i ${i} --out=${o}.tif -s ${sigma}', sep='/')
+        self.assertEqual(template.slots, {'i', 'o', 'sigma'})
+        self.assertEqual(template.render({'i': 'my image.tif', 'o': "it's", 'sigma': 4}),
+                         ['denoise', '-i', 'my image.tif', "--out=it's.tif", '-s', '4'])
+
+    def test_bind(self):
+        template = CommandTemplate('denoise -i ${i} -s ${sigma}${unit}', sep='/')
+        bound = template.bind({'sigma': 2, 'unit': 'px', 'other': 1})
+        self.assertEqual(bound.slots, {'i'})
+        self.assertEqual(template.slots, {'i', 'sigma', 'unit'})
+        self.assertEqual(bound.render({'i': 'a.tif'}), ['denoise', '-i', 'a.tif', '-s', '2px'])
+
+    def test_constants(self):
+        template = CommandTemplate('$__fiji__ --headless -macro "$__tool_directory__/run.ijm" ${i}',
+                                   {'$__fiji__': '/opt/Fiji.app/ImageJ --console',
+                                    '$__tool_directory__': '/tools/my tool'}, sep='/')
+        self.assertEqual(template.render({'i': 'a.tif'}),
+                         ['/opt/Fiji.app/ImageJ', '--console', '--headless', '-macro',
+                          '/tools/my tool/run.ijm', 'a.tif'])
+
+    def test_separator(self):
+        template = CommandTemplate('tools/denoise ${i}', sep='\\')
+        self.assertEqual(template.render({'i': 'C:/data/a.tif'}),
+                         ['tools\\denoise', 'C:\\data\\a.tif'])
+
+    def test_errors(self):
+        template = CommandTemplate('denoise -i ${i} -o ${o}', sep='/')
+        with self.assertRaises(RunnerExecError) as context:
+            template.render({'i': 'a.tif'})
+        self.assertIn('No value for o', str(context.exception))
+        with self.assertRaises(RunnerExecError):
+            CommandTemplate('denoise -i "${i}', sep='/')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import os
+import os.path
+import sys
+import stat
+import shutil
+import hashlib
+import tempfile
+from unittest import mock
+
+from bioimageit_core.core.copy_engine import CopyEngine
+from bioimageit_core.core import content_store
+from bioimageit_core.core.content_store import ContentStore, file_hash
+from bioimageit_core.core.exceptions import DataServiceError
+from bioimageit_core.plugins.data_local import LocalMetadataService
+
+
+class TestCopyEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.tmp_dir, 'source')
+        self.destination_dir = os.path.join(self.tmp_dir, 'destination')
+        os.mkdir(self.source_dir)
+        os.mkdir(self.destination_dir)
+        self.sources = []
+        for i in range(5):
+            file = os.path.join(self.source_dir, f'population1_00{i}.txt')
+            with open(file, 'w') as fp:
+                fp.write(str(i))
+            self.sources.append(file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _check_content(self, destinations):
+        for i, destination in enumerate(destinations):
+            with open(destination) as fp:
+                self.assertEqual(fp.read(), str(i))
+
+    def test_copy(self):
+        engine = CopyEngine(max_workers=3)
+        notified = []
+        destinations = engine.transfer(self.sources, self.destination_dir, notified.append)
+        self.assertEqual(sorted(notified), list(range(5)))
+        self.assertEqual(destinations[2], os.path.join(self.destination_dir,
+                                                       'population1_002.txt'))
+        self._check_content(destinations)
+
+    def test_hardlink(self):
+        engine = CopyEngine(max_workers=2, mode=CopyEngine.HARDLINK)
+        destinations = engine.transfer(self.sources, self.destination_dir)
+        self._check_content(destinations)
+        self.assertTrue(os.path.samefile(destinations[0], self.sources[0]))
+        if sys.platform != 'win32':
+            self.assertFalse(os.stat(destinations[0]).st_mode & stat.S_IWUSR)
+
+    def test_reflink(self):
+        engine = CopyEngine(mode=CopyEngine.REFLINK)
+        self._check_content(engine.transfer(self.sources, self.destination_dir))
+
+    def test_reference(self):
+        engine = CopyEngine(mode=CopyEngine.REFERENCE)
+        destinations = engine.transfer(self.sources, self.destination_dir)
+        self.assertEqual(destinations, self.sources)
+        self.assertEqual(os.listdir(self.destination_dir), [])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(DataServiceError):
+            CopyEngine(mode='move')
+
+    def test_import_dir_reference(self):
+        service = LocalMetadataService(import_workers=2, import_mode=CopyEngine.REFERENCE)
+        experiment = service.create_experiment('myexperiment', 'me', '2021-01-01',
+                                               destination=self.destination_dir)
+        service.import_dir(experiment, self.source_dir, r'\.txt$', 'me', 'numbercsv',
+                           '2021-01-01')
+        dataset = service.get_dataset(experiment.raw_dataset.url)
+        self.assertEqual(len(dataset.uris), 5)
+        raw_data = service.get_raw_data(dataset.uris[1].md_uri)
+        self.assertEqual(raw_data.uri, self.sources[1])
+
+
+class TestContentStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.tmp_dir, 'source')
+        os.mkdir(self.source_dir)
+        for i in range(3):
+            with open(os.path.join(self.source_dir, f'population1_00{i}.txt'), 'w') as fp:
+                fp.write(str(i % 2))
+        self.store_dir = os.path.join(self.tmp_dir, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_file_hash(self):
+        self.assertEqual(file_hash(os.path.join(self.source_dir, 'population1_000.txt')),
+                         'sha256:' + hashlib.sha256(b'0').hexdigest())
+
+    def test_store_once(self):
+        store = ContentStore(self.store_dir)
+        path_0, digest_0 = store.add(os.path.join(self.source_dir, 'population1_000.txt'))
+        path_2, digest_2 = store.add(os.path.join(self.source_dir, 'population1_002.txt'))
+        self.assertEqual(digest_0, digest_2)
+        self.assertEqual(path_0, path_2)
+        self.assertTrue(digest_0 in store)
+        if sys.platform != 'win32':
+            self.assertFalse(os.stat(path_0).st_mode & stat.S_IWUSR)
+
+    def test_stored_content_not_copied(self):
+        store = ContentStore(self.store_dir)
+        store.add(os.path.join(self.source_dir, 'population1_000.txt'))
+        with mock.patch.object(content_store.shutil, 'copyfile') as copyfile:
+            store.add(os.path.join(self.source_dir, 'population1_002.txt'))
+            copyfile.assert_not_called()
+
+    def test_import_dir(self):
+        for name in ['experiment1', 'experiment2']:
+            service = LocalMetadataService(import_hash='sha256', content_store=self.store_dir)
+            experiment = service.create_experiment(name, 'me', '2021-01-01',
+                                                   destination=self.tmp_dir)
+            service.import_dir(experiment, self.source_dir, r'\.txt$', 'me', 'numbercsv',
+                               '2021-01-01')
+        dataset = service.get_dataset(experiment.raw_dataset.url)
+        raw_data = service.get_raw_data(dataset.uris[0].md_uri)
+        self.assertEqual(raw_data.hash, 'sha256:' + hashlib.sha256(b'0').hexdigest())
+        self.assertTrue(os.path.samefile(
+            raw_data.uri, os.path.join(self.tmp_dir, 'experiment1', 'data',
+                                       'population1_000.txt')))
+
+    def test_skip_imported(self):
+        service = LocalMetadataService(import_hash='sha256', skip_imported=True)
+        experiment = service.create_experiment('myexperiment', 'me', '2021-01-01',
+                                               destination=self.tmp_dir)
+        service.import_dir(experiment, self.source_dir, r'_000\.txt$', 'me', 'numbercsv',
+                           '2021-01-01')
+        service.import_dir(experiment, self.source_dir, r'\.txt$', 'me', 'numbercsv',
+                           '2021-01-01')
+        dataset = service.get_dataset(experiment.raw_dataset.url)
+        names = [service.get_raw_data(uri.md_uri).name for uri in dataset.uris]
+        self.assertEqual(names, ['population1_000.txt', 'population1_001.txt'])
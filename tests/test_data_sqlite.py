@@ -0,0 +1,83 @@
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+
+from bioimageit_core.containers.data_containers import Run, RunParameterContainer
+from bioimageit_core.core.serialize import serialize_raw_data, serialize_processed_data
+from bioimageit_core.plugins.data_local import LocalMetadataService
+from bioimageit_core.plugins.data_sqlite import SqliteMetadataService, SQLITE_FILE
+
+
+class TestSqliteMetadataService(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.experiment_dir = os.path.join(self.tmp_dir, 'myexperiment')
+        shutil.copytree(os.path.join('tests', 'test_metadata_local'),
+                        self.experiment_dir)
+        self.service = SqliteMetadataService()
+        self.service.import_local_experiment(self.experiment_dir)
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_import_local_experiment(self):
+        self.assertTrue(os.path.isfile(os.path.join(self.experiment_dir, SQLITE_FILE)))
+        experiment = self.service.get_experiment(self.experiment_dir)
+        self.assertEqual(experiment.name, 'myexperiment')
+        self.assertEqual(experiment.keys, ['Population', 'number'])
+        self.assertEqual(len(experiment.processed_datasets), 2)
+
+        local_service = LocalMetadataService()
+        raw_dataset = self.service.get_dataset(experiment.raw_dataset.url)
+        self.assertEqual(len(raw_dataset.uris), 3)
+        for data_info in raw_dataset.uris:
+            self.assertEqual(serialize_raw_data(self.service.get_raw_data(data_info.md_uri)),
+                             serialize_raw_data(local_service.get_raw_data(data_info.md_uri)))
+
+        dataset = self.service.get_dataset(experiment.processed_datasets[0].url)
+        processed_data = self.service.get_processed_data(dataset.uris[0].md_uri)
+        self.assertEqual(serialize_processed_data(processed_data),
+                         serialize_processed_data(local_service.get_processed_data(dataset.uris[0].md_uri)))
+        runs = self.service.get_dataset_runs(dataset)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(runs[0].process_name, 'SPARTION 2D')
+
+    def test_update_raw_data(self):
+        experiment = self.service.get_experiment(self.experiment_dir)
+        md_uri = self.service.get_dataset(experiment.raw_dataset.url).uris[0].md_uri
+        raw_data = self.service.get_raw_data(md_uri)
+        raw_data.key_value_pairs['Population'] = 'population2'
+        self.service.update_raw_data(raw_data)
+        self.assertEqual(self.service.get_raw_data(md_uri).key_value_pairs['Population'],
+                         'population2')
+
+    def test_create_run(self):
+        experiment = self.service.get_experiment(self.experiment_dir)
+        dataset = self.service.create_dataset(experiment, 'process3')
+        run = Run()
+        run.process_name = 'process3'
+        run.process_uri = 'process3.xml'
+        run.parameters.append(RunParameterContainer('sigma', '2'))
+        run = self.service.create_run(dataset, run)
+        self.assertTrue(run.md_uri.endswith('run.md.json'))
+        run_2 = self.service.create_run(dataset, run)
+        self.assertTrue(run_2.md_uri.endswith('run_1.md.json'))
+        self.assertEqual(self.service.get_run(run.md_uri).parameters[0].value, '2')
+        experiment = self.service.get_experiment(self.experiment_dir)
+        self.assertEqual(experiment.processed_datasets[-1].name, 'process3')
+
+    def test_export_local_experiment(self):
+        export_dir = os.path.join(self.tmp_dir, 'export')
+        shutil.copytree(self.experiment_dir, export_dir)
+        for root, _, files in os.walk(export_dir):
+            for file in files:
+                if file.endswith('.md.json'):
+                    os.remove(os.path.join(root, file))
+        self.service.export_local_experiment(export_dir)
+        experiment = LocalMetadataService().get_experiment(
+            os.path.join(export_dir, 'experiment.md.json'))
+        self.assertEqual(experiment.name, 'myexperiment')
+        self.assertEqual(len(experiment.processed_datasets), 2)
@@ -0,0 +1,76 @@
+import unittest
+import os
+import os.path
+import json
+import shutil
+import tempfile
+
+from bioimageit_core.containers.data_containers import Container
+from bioimageit_core.plugins.data_local import LocalMetadataService
+
+
+class TestDatasetJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.service = LocalMetadataService(journal_threshold=3)
+        self.experiment = self.service.create_experiment('myexperiment', 'me', '2021-01-01',
+                                                         destination=self.tmp_dir)
+        self.dataset_uri = self.experiment.raw_dataset.url
+        self.journal_uri = LocalMetadataService.journal_path(self.dataset_uri)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _add(self, i):
+        data = Container(os.path.join(self.tmp_dir, 'myexperiment', 'data',
+                                      f'data{i}.md.json'), f'uuid{i}')
+        self.service.add_data_to_dataset(self.dataset_uri, data)
+
+    def test_append(self):
+        self._add(0)
+        self._add(1)
+        self.assertTrue(os.path.isfile(self.journal_uri))
+        with open(self.dataset_uri) as file:
+            self.assertEqual(json.load(file)['urls'], [])
+        dataset = self.service.get_dataset(self.dataset_uri)
+        self.assertEqual([uri.uuid for uri in dataset.uris], ['uuid0', 'uuid1'])
+
+    def test_interrupted_append(self):
+        self._add(0)
+        with open(self.journal_uri, 'a') as file:
+            file.write('{"uuid": "uu')
+        self._add(1)
+        self._add(2)
+        dataset = LocalMetadataService().get_dataset(self.dataset_uri)
+        self.assertEqual([uri.uuid for uri in dataset.uris], ['uuid0', 'uuid1', 'uuid2'])
+        self.service.compact_dataset(self.dataset_uri)
+        with open(self.dataset_uri) as file:
+            self.assertEqual(len(json.load(file)['urls']), 3)
+
+    def test_threshold(self):
+        for i in range(4):
+            self._add(i)
+        with open(self.dataset_uri) as file:
+            urls = json.load(file)['urls']
+        self.assertEqual([url['url'] for url in urls],
+                         ['data0.md.json', 'data1.md.json', 'data2.md.json'])
+        dataset = self.service.get_dataset(self.dataset_uri)
+        self.assertEqual(len(dataset.uris), 4)
+
+    def test_compact(self):
+        self._add(0)
+        self._add(1)
+        self.service.compact_dataset(self.dataset_uri)
+        self.assertFalse(os.path.isfile(self.journal_uri))
+        with open(self.dataset_uri) as file:
+            self.assertEqual(len(json.load(file)['urls']), 2)
+
+    def test_interrupted_compaction(self):
+        self._add(0)
+        self._add(1)
+        # dataset file written but journal not removed
+        shutil.copyfile(self.journal_uri, self.journal_uri + '.bak')
+        self.service.compact_dataset(self.dataset_uri)
+        shutil.move(self.journal_uri + '.bak', self.journal_uri)
+        dataset = LocalMetadataService().get_dataset(self.dataset_uri)
+        self.assertEqual(len(dataset.uris), 2)
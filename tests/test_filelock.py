@@ -0,0 +1,44 @@
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+from bioimageit_core.core.filelock import FileLock
+
+
+class TestFileLock(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'locks', 'env.lock')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_exclusive(self):
+        events = []
+
+        def locked(name):
+            with FileLock(self.path, poll_interval=0.01):
+                events.append(('start', name))
+                time.sleep(0.05)
+                events.append(('end', name))
+
+        threads = [threading.Thread(target=locked, args=(i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(0, 6, 2):
+            self.assertEqual(events[i][0], 'start')
+            self.assertEqual(events[i + 1], ('end', events[i][1]))
+
+    def test_timeout(self):
+        with FileLock(self.path) as lock:
+            self.assertTrue(lock.is_locked())
+            with self.assertRaises(TimeoutError):
+                FileLock(self.path, timeout=0.05, poll_interval=0.01).acquire()
+        self.assertFalse(lock.is_locked())
+        with FileLock(self.path, timeout=0):
+            pass
@@ -0,0 +1,129 @@
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+from unittest import mock
+
+from bioimageit_core.core.index import KeyValueIndex, index_path
+from bioimageit_core.core.query import compile_query
+from bioimageit_core.plugins.data_local import LocalMetadataService
+
+
+class TestKeyValueIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = KeyValueIndex()
+        for i in range(5):
+            self.index.set(f'data{i}.md.json', f'uuid{i}', f'data{i}',
+                           {'Population': f'population{i % 2}', 'number': str(i)})
+
+    def test_equal(self):
+        self.assertEqual(self.index.equal('Population', 'population1'),
+                         {'data1.md.json', 'data3.md.json'})
+        self.assertEqual(self.index.equal('Population', 'other'), set())
+
+    def test_range(self):
+        self.assertEqual(self.index.range('number', '<', 2),
+                         {'data0.md.json', 'data1.md.json'})
+        self.assertEqual(self.index.range('number', '>=', 3),
+                         {'data3.md.json', 'data4.md.json'})
+
+    def test_save_load(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = index_path(os.path.join(tmp_dir, 'data'))
+            self.index.save(path)
+            index = KeyValueIndex.load(path)
+            self.assertEqual(index.entries, self.index.entries)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_delta(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = index_path(os.path.join(tmp_dir, 'data'))
+            self.index.save(path)
+            self.index.set('data1.md.json', 'uuid1', 'data1', {'Population': 'other'})
+            self.index.remove('data2.md.json')
+            self.index.append(path, ['data1.md.json', 'data2.md.json'])
+            with open(KeyValueIndex.delta_path(path), 'a') as file:
+                file.write('{"url": "trunc')
+            index = KeyValueIndex.load(path)
+            self.assertEqual(index.entries, self.index.entries)
+            self.assertEqual(index.delta_count, 2)
+            self.index.set('data5.md.json', 'uuid5', 'data5', {'Population': 'other'})
+            self.index.append(path, ['data5.md.json'])
+            index = KeyValueIndex.load(path)
+            self.assertEqual(index.entries, self.index.entries)
+            index.save(path)
+            self.assertFalse(os.path.isfile(KeyValueIndex.delta_path(path)))
+            self.assertEqual(KeyValueIndex.load(path).entries, self.index.entries)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_candidates(self):
+        query = compile_query('Population=population1 AND number>1')
+        self.assertEqual(query.candidates(self.index), {'data3.md.json'})
+        self.assertIsNone(compile_query('name=data1').candidates(self.index))
+
+
+class TestDatasetIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.service = LocalMetadataService()
+        self.experiment = self.service.create_experiment('myexperiment', 'me', '2021-01-01',
+                                                         destination=self.tmp_dir)
+        images_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'test_images', 'data')
+        self.service.import_dir(self.experiment, images_dir, r'population1_00[1-4]\.tif$',
+                                'me', 'imagetiff', '2021-01-01')
+        self.dataset = self.service.get_dataset(self.experiment.raw_dataset.url)
+        with self.service.batch():
+            for i, data_info in enumerate(self.dataset.uris):
+                raw_data = self.service.get_raw_data(data_info.md_uri)
+                raw_data.set_key_value_pair('number', str(i))
+                self.service.update_raw_data(raw_data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_index_updated(self):
+        index = self.service.get_index(self.dataset)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(len(index.equal('number', '2')), 1)
+
+    def test_query_opens_selected_data(self):
+        query = compile_query('number>=2')
+        with mock.patch.object(LocalMetadataService, 'get_raw_data') as get_raw_data:
+            uris = self.service.query_dataset(self.dataset, query)
+            get_raw_data.assert_not_called()
+        self.assertEqual(uris, [info.md_uri for info in self.dataset.uris[2:]])
+
+    def test_import_appends_to_delta(self):
+        index_uri = index_path(os.path.join(self.tmp_dir, 'myexperiment', 'data'))
+        stat = os.stat(index_uri)
+        images_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'test_images', 'data')
+        for name in ['population1_005.tif', 'population1_006.tif', 'population1_007.tif']:
+            self.service.import_data(self.experiment, os.path.join(images_dir, name),
+                                     name, 'me', 'imagetiff', '2021-01-01',
+                                     key_value_pairs={'number': name[-5]})
+            self.assertEqual(os.stat(index_uri).st_mtime_ns, stat.st_mtime_ns)
+        self.assertEqual(os.stat(index_uri).st_ino, stat.st_ino)
+        self.assertTrue(os.path.isfile(KeyValueIndex.delta_path(index_uri)))
+
+        self.service._indexes.invalidate()
+        dataset = self.service.get_dataset(self.experiment.raw_dataset.url)
+        self.assertEqual(len(self.service.get_index(dataset).equal('number', '6')), 1)
+        self.service.compact_dataset(dataset.md_uri)
+        self.assertFalse(os.path.isfile(KeyValueIndex.delta_path(index_uri)))
+        self.assertEqual(len(self.service.get_index(dataset)), 7)
+
+    def test_rebuild(self):
+        os.remove(index_path(os.path.join(self.tmp_dir, 'myexperiment', 'data')))
+        self.service._indexes.invalidate()
+        self.assertIsNone(self.service.get_index(self.dataset))
+        index = self.service.rebuild_index(self.dataset)
+        self.assertEqual(len(index.equal('number', '0')), 1)
+        self.assertEqual(len(self.service.query_dataset(self.dataset,
+                                                        compile_query('number<2'))), 2)
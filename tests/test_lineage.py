@@ -0,0 +1,48 @@
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+
+from bioimageit_core.containers import ProcessedData
+from bioimageit_core.core.lineage import lineage_root, backfill_lineage
+from bioimageit_core.plugins.data_local import LocalMetadataService
+
+
+class TestLineage(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.experiment_dir = os.path.join(self.tmp_dir, 'experiment')
+        shutil.copytree(os.path.join('tests', 'test_metadata_local'), self.experiment_dir)
+        self.service = LocalMetadataService()
+        self.experiment = self.service.get_experiment(
+            os.path.join(self.experiment_dir, 'experiment.md.json'))
+        self.data_uri = os.path.join(self.experiment_dir, 'process2',
+                                     'population1_001_o_o.md.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lineage_root(self):
+        processed_data = self.service.get_processed_data(self.data_uri)
+        self.assertIsNone(processed_data.root)
+        parents = dict()
+        root = lineage_root(self.service, processed_data, parents)
+        self.assertEqual(root.name, 'population1_001.tif')
+        self.assertEqual(root.key_value_pairs['Population'], 'population1')
+        self.assertEqual(len(parents), 2)
+
+    def test_backfill(self):
+        self.assertEqual(backfill_lineage(self.service, self.experiment), 5)
+        processed_data = self.service.get_processed_data(self.data_uri)
+        self.assertEqual(processed_data.root.name, 'population1_001.tif')
+        self.assertEqual(os.path.abspath(processed_data.root.uri),
+                         os.path.join(self.experiment_dir, 'data', 'population1_001.md.json'))
+        # the root is read without walking the processing chain
+        processed_data.inputs = []
+        self.assertEqual(lineage_root(self.service, processed_data).name,
+                         'population1_001.tif')
+        self.assertEqual(backfill_lineage(self.service, self.experiment), 0)
+
+    def test_no_input(self):
+        self.assertIsNone(lineage_root(self.service, ProcessedData()))
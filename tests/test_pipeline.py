@@ -0,0 +1,223 @@
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+from bioimageit_core.api import Request
+from bioimageit_core.containers import Tool, ToolParameterContainer
+from bioimageit_core.containers.pipeline_containers import (Pipeline, PipelineStep,
+                                                            PipelineInput, PipelineParameter,
+                                                            PipelineStepPlan)
+from bioimageit_core.core.exceptions import PipelineError
+from bioimageit_core.core.observer import Observable
+from bioimageit_core.core.pipeline_graph import PipelineGraph
+from tests.test_run_job import FakeRunner
+
+
+def create_step(name, inputs):
+    step = PipelineStep()
+    step.name = name
+    step.tool = 'copy_v1.0'
+    step.output_dataset_name = name
+    for dataset in inputs:
+        step.add_input(PipelineInput(name='i', dataset=dataset))
+    return step
+
+
+class TestPipelineGraph(unittest.TestCase):
+    def test_levels(self):
+        steps = [create_step('c', ['a', 'b']), create_step('a', ['data']),
+                 create_step('b', ['data']), create_step('d', ['a'])]
+        graph = PipelineGraph(steps)
+        self.assertEqual(graph.schedule(), [['a', 'b'], ['c', 'd']])
+
+    def test_missing_input(self):
+        with self.assertRaises(PipelineError):
+            PipelineGraph([create_step('a', ['unknown'])])
+        graph = PipelineGraph([create_step('a', ['previous'])], datasets=['previous'])
+        self.assertEqual(graph.schedule(), [['a']])
+
+    def test_cycle(self):
+        with self.assertRaises(PipelineError):
+            PipelineGraph([create_step('a', ['b']), create_step('b', ['a'])])
+
+    def test_failed_step_skips_dependents(self):
+        steps = [create_step('a', ['data']), create_step('b', ['a']),
+                 create_step('c', ['b']), create_step('d', ['data'])]
+
+        def run_step(step):
+            if step.name == 'a':
+                raise PipelineError('failed')
+            return step.name
+
+        summary = PipelineGraph(steps).execute(run_step)
+        self.assertEqual(summary.failed, {'a': 'failed'})
+        self.assertEqual(sorted(summary.skipped), ['b', 'c'])
+        self.assertEqual(summary.jobs, {'d': 'd'})
+        self.assertEqual(sorted(summary.timings), ['a', 'd'])
+
+    def test_steps_updated_by_coordinator(self):
+        steps = [create_step('a', ['data']), create_step('b', ['data']),
+                 create_step('c', ['a', 'b'])]
+        coordinator = threading.current_thread()
+        ran_in_workers = []
+
+        def run_step(step):
+            self.assertIsNot(threading.current_thread(), coordinator)
+            ran_in_workers.append(any(step.already_ran for step in steps))
+            return step.name
+
+        summary = PipelineGraph(steps).execute(run_step)
+        self.assertEqual(summary.jobs, {'a': 'a', 'b': 'b', 'c': 'c'})
+        self.assertTrue(all(step.already_ran for step in steps))
+        # c starts after a and b are marked as ran
+        self.assertEqual(ran_in_workers[-1], True)
+
+    def test_new_job_threads(self):
+        observable = Observable()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            job_ids = list(executor.map(lambda _: observable.new_job(), range(200)))
+        self.assertEqual(sorted(job_ids), list(range(1, 201)))
+
+
+class TestRunPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.request = Request(os.path.join('tests', 'config.json'), log=False)
+        self.request.connect(init_process=False, init_runner=False)
+        self.runner = FakeRunner()
+        self.runner.fail = False
+        self.request.runner_service = self.runner
+        self.experiment = self.request.create_experiment('myexperiment', 'me',
+                                                         destination=self.tmp_dir)
+        self.request.import_dir(self.experiment, os.path.join('tests', 'test_images', 'data'),
+                                filter_=r'population1_00[1-3]\.tif$', author='me')
+        self.tool = Tool()
+        self.tool.name = 'copy'
+        self.tool.version = '1.0'
+        self.tool.uri = os.path.join(self.tmp_dir, 'copy.xml')
+        self.tool.command = 'copy ${i} ${o}'
+        output = ToolParameterContainer()
+        output.name = 'o'
+        output.type = 'imagetiff'
+        self.tool.outputs.append(output)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_run_pipeline(self):
+        pipeline = Pipeline()
+        pipeline.name = 'copies'
+        pipeline.steps = [create_step('second', ['first']), create_step('first', ['data']),
+                          create_step('other', ['data'])]
+        pipeline.steps[1].max_workers = 3
+        with mock.patch.object(self.request, 'get_tool', return_value=self.tool):
+            summary = self.request.run_pipeline(self.experiment, pipeline)
+        self.assertIs(pipeline.summary, summary)
+        self.assertTrue(summary.is_success())
+        self.assertEqual(summary.schedule, [['first', 'other'], ['second']])
+        self.assertEqual(summary.order[-1], 'second')
+        self.assertEqual(set(summary.timings), {'first', 'other', 'second'})
+        start_second = summary.timings['second'][0]
+        start_first, duration_first = summary.timings['first']
+        self.assertGreaterEqual(start_second, start_first + duration_first)
+        self.assertEqual(len(self.runner.commands), 9)
+        self.assertTrue(all(step.already_ran for step in pipeline.steps))
+        experiment = self.request.get_experiment(self.experiment.md_uri)
+        self.assertEqual(sorted(info.name for info in experiment.processed_datasets),
+                         ['first', 'other', 'second'])
+        self.assertEqual(len(self.request.get_dataset(experiment, 'second').uris), 3)
+
+    def _processed_names(self, experiment, dataset_name):
+        dataset = self.request.get_dataset(experiment, dataset_name)
+        return sorted(self.request.get_processed_data(info.md_uri).name
+                      for info in dataset.uris)
+
+    def _chain_pipeline(self):
+        pipeline = Pipeline()
+        pipeline.name = 'chain'
+        pipeline.steps = [create_step('first', ['data']), create_step('second', ['first']),
+                          create_step('third', ['second'])]
+        pipeline.steps[2].inputs[0].query = 'NOT name=002'
+        return pipeline
+
+    def test_streaming(self):
+        with mock.patch.object(self.request, 'get_tool', return_value=self.tool):
+            batch = self.request.run_pipeline(self.experiment, self._chain_pipeline())
+            other = self.request.create_experiment('other', 'me', destination=self.tmp_dir)
+            self.request.import_dir(other, os.path.join('tests', 'test_images', 'data'),
+                                    filter_=r'population1_00[1-3]\.tif$', author='me')
+            streaming = self.request.run_pipeline(other, self._chain_pipeline(),
+                                                  streaming=True)
+        self.assertTrue(streaming.is_success())
+        # the next step starts before the end of the previous one
+        start_first, duration_first = streaming.timings['first']
+        self.assertLess(streaming.timings['second'][0], start_first + duration_first)
+        self.assertGreaterEqual(batch.timings['second'][0],
+                                batch.timings['first'][0] + batch.timings['first'][1])
+
+        experiment = self.request.get_experiment(self.experiment.md_uri)
+        other = self.request.get_experiment(other.md_uri)
+        for name in ['first', 'second', 'third']:
+            self.assertEqual(self._processed_names(experiment, name),
+                             self._processed_names(other, name))
+        self.assertEqual(len(self._processed_names(other, 'third')), 2)
+        third = self.request.get_dataset(other, 'third')
+        processed_data = self.request.get_processed_data(third.uris[0].md_uri)
+        self.assertTrue(processed_data.root.name.startswith('population1_00'))
+
+    def _plan(self, pipeline):
+        plan = self.request.plan_pipeline(self.experiment, pipeline)
+        return [(step.status, step.data_count, step.stale_count) for step in plan.steps]
+
+    def test_incremental(self):
+        pipeline = Pipeline()
+        pipeline.steps = [create_step('first', ['data']), create_step('second', ['first'])]
+        with mock.patch.object(self.request, 'get_tool', return_value=self.tool):
+            self.assertEqual(self._plan(pipeline), [(PipelineStepPlan.NEW, 3, 0),
+                                                    (PipelineStepPlan.NEW, -1, 0)])
+            self.request.run_pipeline(self.experiment, pipeline, incremental=True)
+            self.assertEqual(len(self.runner.commands), 6)
+            self.assertEqual(self._plan(pipeline), [(PipelineStepPlan.UP_TO_DATE, 0, 0),
+                                                    (PipelineStepPlan.UP_TO_DATE, 0, 0)])
+
+            # new raw data
+            self.request.import_dir(self.experiment,
+                                    os.path.join('tests', 'test_images', 'data'),
+                                    filter_=r'population1_004\.tif$', author='me')
+            self.assertEqual(self._plan(pipeline), [(PipelineStepPlan.OUTDATED, 1, 0),
+                                                    (PipelineStepPlan.OUTDATED, -1, 0)])
+            self.runner.commands = []
+            self.request.run_pipeline(self.experiment, pipeline, incremental=True)
+            self.assertEqual(len(self.runner.commands), 2)
+
+            # new parameter value
+            pipeline.steps[1].add_parameter(PipelineParameter('sigma', '2'))
+            self.assertEqual(self._plan(pipeline), [(PipelineStepPlan.UP_TO_DATE, 0, 0),
+                                                    (PipelineStepPlan.CHANGED, 4, 4)])
+            self.runner.commands = []
+            summary = self.request.run_pipeline(self.experiment, pipeline, incremental=True)
+            self.assertEqual(len(self.runner.commands), 4)
+            self.assertEqual(summary.plan.step('second').status, PipelineStepPlan.CHANGED)
+
+            # removed raw data
+            experiment = self.request.get_experiment(self.experiment.md_uri)
+            raw_dataset = self.request.get_dataset(experiment, 'data')
+            raw_dataset.uris = raw_dataset.uris[1:]
+            self.request.update_dataset(raw_dataset)
+            self.assertEqual(self._plan(pipeline), [(PipelineStepPlan.OUTDATED, 0, 1),
+                                                    (PipelineStepPlan.OUTDATED, -1, 0)])
+            self.runner.commands = []
+            self.request.run_pipeline(self.experiment, pipeline, incremental=True)
+            self.assertEqual(len(self.runner.commands), 0)
+
+        experiment = self.request.get_experiment(self.experiment.md_uri)
+        self.assertEqual(len(experiment.processed_datasets), 2)
+        self.assertEqual(self._processed_names(experiment, 'first'),
+                         [f'o_population1_00{i}' for i in [2, 3, 4]])
+        self.assertEqual(self._processed_names(experiment, 'second'),
+                         [f'o_o_population1_00{i}' for i in [2, 3, 4]])
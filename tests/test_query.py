@@ -0,0 +1,67 @@
+import unittest
+
+from bioimageit_core.core.exceptions import DataQueryError
+from bioimageit_core.core.query import (SearchContainer, QueryTable, compile_query,
+                                        query_list_single)
+
+
+def create_search_list():
+    search_list = []
+    for i in range(6):
+        info = SearchContainer()
+        info.set_name(f'population{i % 2 + 1}_00{i}.tif')
+        info.set_uri(f'population{i % 2 + 1}_00{i}.md.json')
+        info.data['key_value_pairs'] = {'Population': f'population{i % 2 + 1}',
+                                        'number': str(i)}
+        if i == 5:
+            info.data['key_value_pairs'] = {'Population': 'population2'}
+        search_list.append(info)
+    return search_list
+
+
+def names(selected):
+    return [info.name() for info in selected]
+
+
+class TestQuery(unittest.TestCase):
+    def setUp(self):
+        self.search_list = create_search_list()
+
+    def test_legacy_syntax(self):
+        self.assertEqual(len(query_list_single(self.search_list,
+                                               'Population=population1')), 3)
+        self.assertEqual(names(query_list_single(self.search_list, 'number<=1')),
+                         ['population1_000.tif', 'population2_001.tif'])
+        self.assertEqual(len(query_list_single(self.search_list, 'number>=3')), 2)
+        self.assertEqual(len(query_list_single(self.search_list, 'number<3')), 3)
+        self.assertEqual(len(query_list_single(self.search_list, 'number>3')), 1)
+        self.assertEqual(names(query_list_single(self.search_list, 'name=_002')),
+                         ['population1_002.tif'])
+
+    def test_boolean(self):
+        query = compile_query('Population=population2 AND (number<2 OR number>3)')
+        self.assertEqual(names(query.select(self.search_list)), ['population2_001.tif'])
+        query = compile_query('NOT Population=population2')
+        self.assertEqual(len(query.select(self.search_list)), 3)
+        query = compile_query('number!=0 AND number in (0, 1, 2)')
+        self.assertEqual(len(query.select(self.search_list)), 2)
+
+    def test_regex_and_glob(self):
+        self.assertEqual(len(compile_query('Population~2$').select(self.search_list)), 3)
+        self.assertEqual(names(compile_query('name=population1_*.tif AND number>1')
+                               .select(self.search_list)),
+                         ['population1_002.tif', 'population1_004.tif'])
+
+    def test_table(self):
+        table = QueryTable(self.search_list)
+        selected = compile_query('number>=2').evaluate(table)
+        self.assertEqual(selected, {2, 3, 4})
+        self.assertEqual(table.numeric_column('number')[5], None)
+
+    def test_errors(self):
+        for query in ['(number<2', 'number<two', 'number', 'Population=1 AND']:
+            with self.assertRaises(DataQueryError):
+                compile_query(query)
+
+    def test_empty(self):
+        self.assertEqual(len(compile_query('').select(self.search_list)), 6)
@@ -3,6 +3,9 @@ import os
 import os.path
 import filecmp
 import shutil
+import builtins
+from collections import Counter
+from unittest import mock
 
 from bioimageit_core.api import Request
 from bioimageit_core.containers import Run, ProcessedData
@@ -306,6 +309,22 @@ class TestRequest(unittest.TestCase):
                                      origin_output_name='o')
         self.assertEqual(data[0].name, 'population1_001_o')
 
+    def test_get_data_reads_once(self):
+        experiment = self.request.get_experiment(self.ref_experiment_uri)
+        dataset = self.request.get_dataset(experiment, "process2")
+        opens = Counter()
+        original_open = builtins.open
+
+        def counting_open(file, *args, **kwargs):
+            if isinstance(file, str) and file.endswith('.md.json'):
+                opens[os.path.abspath(file)] += 1
+            return original_open(file, *args, **kwargs)
+
+        with mock.patch('builtins.open', counting_open):
+            data = self.request.get_data(dataset, query='Population=population1')
+        self.assertEqual(len(data), 3)
+        self.assertEqual(max(opens.values()), 1)
+
     def test_create_dataset(self):
         experiment = self.request.create_experiment("myexperiment", "sprigent",
                                                     date='now', keys=[],
@@ -0,0 +1,90 @@
+import unittest
+import os
+import os.path
+import sys
+import stat
+import shutil
+import tempfile
+
+from bioimageit_core.core.exceptions import ConfigError
+from bioimageit_core.core.result_cache import ResultCache, parse_size
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.tmp_dir, 'cache'), max_size=250)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, name, size):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as file:
+            file.write(b'x' * size)
+        return path
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size(100), 100)
+        self.assertEqual(parse_size('2KB'), 2048)
+        self.assertEqual(parse_size('1.5 GB'), int(1.5 * 1024 ** 3))
+        self.assertRaises(ConfigError, parse_size, 'big')
+
+    def test_key(self):
+        key = ResultCache.key('tool_v1', {'a': 1, 'b': '2'}, ['sha256:00'])
+        self.assertEqual(key, ResultCache.key('tool_v1', {'b': 2, 'a': '1'}, ['sha256:00']))
+        self.assertNotEqual(key, ResultCache.key('tool_v1', {'a': 1, 'b': 3}, ['sha256:00']))
+        self.assertNotEqual(key, ResultCache.key('tool_v2', {'a': 1, 'b': 2}, ['sha256:00']))
+
+    def test_put_get(self):
+        output = self._write('o.tif', 100)
+        self.assertFalse(self.cache.get('ab12', {'o': output + '.copy'}))
+        self.assertTrue(self.cache.put('ab12', {'o': output}))
+        destination = os.path.join(self.tmp_dir, 'o2.tif')
+        self.assertTrue(self.cache.get('ab12', {'o': destination}))
+        self.assertEqual(os.path.getsize(destination), 100)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_restored_output_modified(self):
+        self.cache.put('ab12', {'o': self._write('o.tif', 100)})
+        destination = os.path.join(self.tmp_dir, 'o2.tif')
+        self.assertTrue(self.cache.get('ab12', {'o': destination}))
+        with open(destination, 'wb') as file:
+            file.write(b'y' * 10)
+        restored = os.path.join(self.tmp_dir, 'o3.tif')
+        self.assertTrue(self.cache.get('ab12', {'o': restored}))
+        with open(restored, 'rb') as file:
+            self.assertEqual(file.read(), b'x' * 100)
+
+    def test_partial_restore(self):
+        self.cache.put('ab12', {'o1': self._write('o1.tif', 50), 'o2': self._write('o2.tif', 50)})
+        os.remove(os.path.join(self.cache.root, 'ab', 'ab12', 'o2.tif'))
+        destinations = {'o1': os.path.join(self.tmp_dir, 'r1.tif'),
+                        'o2': os.path.join(self.tmp_dir, 'r2.tif')}
+        self.assertFalse(self.cache.get('ab12', destinations))
+        self.assertFalse(os.path.exists(destinations['o1']))
+        self.assertEqual(self.cache.misses, 1)
+
+    @unittest.skipIf(sys.platform == 'win32', 'no write permission bits on Windows')
+    def test_hardlink_read_only(self):
+        cache = ResultCache(os.path.join(self.tmp_dir, 'cache_links'), mode='hardlink')
+        output = self._write('o.tif', 100)
+        cache.put('ab12', {'o': output})
+        destination = os.path.join(self.tmp_dir, 'o2.tif')
+        self.assertTrue(cache.get('ab12', {'o': destination}))
+        self.assertFalse(os.stat(destination).st_mode & stat.S_IWUSR)
+        # an output is replaced, not modified, when the data is processed again
+        self.assertTrue(cache.get('ab12', {'o': destination}))
+        self.assertEqual(os.path.getsize(destination), 100)
+
+    def test_eviction(self):
+        for key in ['aa01', 'aa02', 'aa03']:
+            self.cache.put(key, {'o': self._write(key, 100)})
+            if key == 'aa02':
+                # aa01 is used more recently than aa02
+                os.utime(os.path.join(self.cache.root, 'aa', 'aa02', 'entry.json'), (0, 0))
+                self.cache._entries = None
+        self.assertIn('aa01', self.cache)
+        self.assertNotIn('aa02', self.cache)
+        self.assertIn('aa03', self.cache)
+        self.assertEqual(self.cache.size(), 200)
@@ -0,0 +1,280 @@
+import unittest
+import os
+import os.path
+import time
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from bioimageit_core.api import Request
+from bioimageit_core.containers import Job, Tool, ToolParameterContainer, Run
+from bioimageit_core.containers.data_containers import ProcessedData
+from bioimageit_core.containers.tools_containers import IO_PARAM
+from bioimageit_core.core.exceptions import RunnerExecError
+from bioimageit_core.core.result_cache import ResultCache
+from bioimageit_core.plugins.data_local import LocalMetadataService
+from bioimageit_core.plugins.data_fsspec import FsspecMetadataService
+
+
+class FakeRunner:
+    """Runner that records the executions and fails on the data 002"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.commands = []
+        self.fail = True
+        self.error = RunnerExecError
+        self.tear_downs = 0
+
+    def set_up(self, tool, job_id):
+        pass
+
+    def tear_down(self, tool, job_id):
+        self.tear_downs += 1
+
+    def exec(self, tool, args, job_id):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.commands.append(args)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        if self.fail and '002' in args[1]:
+            raise self.error('tool failed')
+        shutil.copyfile(args[1], args[2])
+
+
+class FakeBatchRunner(FakeRunner):
+    """Runner executing the data by batches"""
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def exec_batch(self, tool, args_list, job_id):
+        self.batches.append(len(args_list))
+        errors = []
+        for args in args_list:
+            try:
+                self.exec(tool, args, job_id)
+                errors.append(None)
+            except RunnerExecError as err:
+                errors.append(err)
+        return errors
+
+
+class TestRunJob(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.request = Request(os.path.join('tests', 'config.json'), log=False)
+        self.request.connect(init_process=False, init_runner=False)
+        self.runner = FakeRunner()
+        self.request.runner_service = self.runner
+        self.experiment = self.request.create_experiment('myexperiment', 'me',
+                                                         destination=self.tmp_dir)
+        self.request.import_dir(self.experiment, os.path.join('tests', 'test_images', 'data'),
+                                filter_=r'population1_00[1-6]\.tif$', author='me')
+
+        tool = Tool()
+        tool.name = 'copy'
+        tool.version = '1.0'
+        tool.uri = os.path.join(self.tmp_dir, 'copy.xml')
+        tool.command = 'copy ${i} ${o}'
+        output = ToolParameterContainer()
+        output.name = 'o'
+        output.type = 'imagetiff'
+        output.description = 'copied image'
+        tool.outputs.append(output)
+
+        self.job = Job()
+        self.job.set_experiment(self.experiment)
+        self.job.set_tool(tool)
+        self.job.set_input(name='i', dataset='data', query='')
+        self.job.set_output_dataset_name('copy')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _processed_names(self):
+        dataset = self.request.get_dataset(self.request.get_experiment(self.experiment.md_uri),
+                                           'copy')
+        return sorted(self.request.get_processed_data(info.md_uri).name
+                      for info in dataset.uris)
+
+    def test_sequential(self):
+        self.request.run(self.job)
+        self.assertEqual(self.runner.max_running, 1)
+        self.assertEqual(len(self.job.summary.succeeded), 5)
+        self.assertEqual(list(self.job.summary.failed), ['population1_002.tif'])
+
+    def test_parallel(self):
+        self.job.set_max_workers(4)
+        self.request.run(self.job)
+        self.assertGreater(self.runner.max_running, 1)
+        self.assertEqual(len(self.runner.commands), 6)
+        self.assertEqual(self.job.summary.data_count, 6)
+        self.assertEqual(list(self.job.summary.failed), ['population1_002.tif'])
+        self.assertEqual(self._processed_names(),
+                         [f'o_population1_00{i}' for i in [1, 3, 4, 5, 6]])
+
+    def test_unexpected_error(self):
+        self.runner.error = RuntimeError
+        self.job.set_max_workers(2)
+        self.request.run(self.job)
+        self.assertEqual(len(self.job.summary.succeeded), 5)
+        self.assertEqual(self.job.summary.failed, {'population1_002.tif': 'tool failed'})
+        self.assertEqual(self.runner.tear_downs, 1)
+        self.assertEqual(self._processed_names(),
+                         [f'o_population1_00{i}' for i in [1, 3, 4, 5, 6]])
+
+    def test_resume(self):
+        self.request.run(self.job)
+        self.runner.fail = False
+        self.runner.commands = []
+        self.job.set_resume()
+        self.job.set_max_workers(2)
+        self.request.run(self.job)
+        self.assertEqual(len(self.runner.commands), 1)
+        self.assertEqual(self.job.summary.succeeded, ['population1_002.tif'])
+        self.assertEqual(len(self.job.summary.skipped), 5)
+        self.assertEqual(self._processed_names(),
+                         [f'o_population1_00{i}' for i in range(1, 7)])
+        experiment = self.request.get_experiment(self.experiment.md_uri)
+        self.assertEqual(len(experiment.processed_datasets), 1)
+        dataset = self.request.get_dataset(experiment, 'copy')
+        self.assertEqual(len(self.request.get_dataset_runs(dataset)), 1)
+
+    def test_batch(self):
+        self.runner = FakeBatchRunner()
+        self.request.runner_service = self.runner
+        with mock.patch.object(Request, '_job_batch_size', return_value=4):
+            self.request.run(self.job)
+        self.assertEqual(self.runner.batches, [4, 2])
+        self.assertEqual(list(self.job.summary.failed), ['population1_002.tif'])
+        self.assertEqual(self._processed_names(),
+                         [f'o_population1_00{i}' for i in [1, 3, 4, 5, 6]])
+
+    def test_command(self):
+        sigma = ToolParameterContainer()
+        sigma.name = 'sigma'
+        sigma.io = IO_PARAM
+        sigma.default_value = '2'
+        self.job.tool.inputs.append(sigma)
+        self.job.tool.command = 'copy ${i} ${o} ${sigma}'
+        self.runner.fail = False
+        self.request.run(self.job)
+        self.assertEqual(self.runner.commands[0][3], '2')
+        self.job.tool.command = 'copy ${i} ${o} ${unknown}'
+        self.job.set_output_dataset_name('copy2')
+        self.request.run(self.job)
+        self.assertEqual(len(self.job.summary.failed), 6)
+        self.assertIn('No value for unknown', self.job.summary.failed['population1_001.tif'])
+
+    def test_merge_command_error(self):
+        numbers_dir = os.path.join(self.tmp_dir, 'numbers')
+        os.mkdir(numbers_dir)
+        for i in range(2):
+            with open(os.path.join(numbers_dir, f'number{i}.csv'), 'w') as file:
+                file.write(str(i))
+        self.request.import_dir(self.experiment, numbers_dir, filter_=r'\.csv$',
+                                author='me', format_='numbercsv')
+        job = Job()
+        job.set_experiment(self.experiment)
+        job.set_tool(self.job.tool)
+        job.tool.type = 'merge'
+        job.tool.command = 'merge ${i} ${o} ${unknown}'
+        job.set_input(name='i', dataset='data', query='name=number*')
+        job.set_output_dataset_name('merged')
+        with self.assertRaises(RunnerExecError) as context:
+            self.request.run(job)
+        self.assertIn('No value for unknown', str(context.exception))
+        dataset = self.request.get_dataset(self.request.get_experiment(self.experiment.md_uri),
+                                           'merged')
+        self.assertEqual(dataset.uris, [])
+        self.assertEqual(self.runner.commands, [])
+
+    def test_result_cache(self):
+        self.request.result_cache = ResultCache(os.path.join(self.tmp_dir, 'cache'))
+        self.request.run(self.job)
+        self.assertEqual(self.job.summary.cache_misses, 5)
+        self.runner.commands = []
+        self.job.set_output_dataset_name('copy2')
+        self.job.set_param('unused', '1')
+        self.request.run(self.job)
+        # a new parameter value changes the key of all the results
+        self.assertEqual(len(self.runner.commands), 6)
+        self.assertEqual(self.job.summary.cache_hits, 0)
+        self.runner.commands = []
+        self.job.set_output_dataset_name('copy3')
+        self.request.run(self.job)
+        # only the failed data is executed again
+        self.assertEqual(len(self.runner.commands), 1)
+        self.assertEqual(self.job.summary.cache_hits, 5)
+        dataset = self.request.get_dataset(self.request.get_experiment(self.experiment.md_uri),
+                                           'copy3')
+        for info in dataset.uris:
+            processed_data = self.request.get_processed_data(info.md_uri)
+            if '002' not in processed_data.name:
+                self.assertTrue(os.path.isfile(processed_data.uri))
+
+
+class TestRunItems(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.run = Run()
+        self.run.md_uri = os.path.join(self.tmp_dir, 'run.md.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _check_items(self, service):
+        self.assertEqual(service.get_run_items(self.run), {})
+        output_uri = os.path.join(self.tmp_dir, 'o_data1.md.json')
+        service.add_run_item(self.run, ['uuid1', 'uuid2'], [output_uri])
+        # interrupted append
+        with open(self.run.md_uri + 'l', 'a') as file:
+            file.write('{"inputs": ["uu')
+        self.assertEqual(service.get_run_items(self.run), {('uuid1', 'uuid2'): [output_uri]})
+        service.add_run_item(self.run, ['uuid3', 'uuid4'], [])
+        self.assertEqual(service.get_run_items(self.run), {('uuid1', 'uuid2'): [output_uri],
+                                                           ('uuid3', 'uuid4'): []})
+
+    def test_local(self):
+        self._check_items(LocalMetadataService())
+
+    def test_fsspec(self):
+        self._check_items(FsspecMetadataService('local', '', 0, '', ''))
+
+    def test_fsspec_buffer(self):
+        service = FsspecMetadataService('local', '', 0, '', '')
+        service.run_items_buffer = 3
+        journal_uri = self.run.md_uri + 'l'
+        for i in range(4):
+            service.add_run_item(self.run, [f'uuid{i}'], [])
+            self.assertEqual(os.path.isfile(journal_uri), i >= 2)
+        with open(journal_uri) as file:
+            self.assertEqual(len(file.readlines()), 3)
+        service.compact_dataset(os.path.join(os.path.dirname(self.run.md_uri),
+                                             'processed_dataset.md.json'))
+        with open(journal_uri) as file:
+            self.assertEqual(len(file.readlines()), 4)
+        service.add_run_item(self.run, ['uuid4'], [])
+        self.assertEqual(len(service.get_run_items(self.run)), 5)
+
+    def test_fsspec_data_created_again(self):
+        Request(os.path.join('tests', 'config.json'), log=False)
+        service = FsspecMetadataService('local', '', 0, '', '')
+        experiment = service.create_experiment('myexperiment', 'me', destination=self.tmp_dir)
+        dataset = service.create_dataset(experiment, 'copy')
+        for _ in range(2):
+            # resumed job: the data was created but its run item was not written
+            processed_data = ProcessedData()
+            processed_data.name = 'o_data1'
+            processed_data.format = 'imagetiff'
+            processed_data.set_output('o', 'copied image')
+            service.create_data(dataset, self.run, processed_data)
+        dataset = service.get_dataset(dataset.md_uri)
+        self.assertEqual(len(dataset.uris), 1)
+        self.assertEqual(dataset.uris[0].uuid, processed_data.uuid)
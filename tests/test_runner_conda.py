@@ -0,0 +1,103 @@
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from unittest import mock
+
+from bioimageit_core.core.config import ConfigAccess
+from bioimageit_core.containers import Tool
+from bioimageit_core.core.exceptions import RunnerExecError
+from bioimageit_core.core.shell_worker import ShellWorker
+from bioimageit_core.plugins.runner_conda import CondaRunnerService
+
+
+def create_tool(name, env=''):
+    tool = Tool()
+    tool.id = name
+    tool.name = name
+    tool.version = '1.0'
+    tool.requirements.append({'origin': 'package', 'type': 'conda', 'package': name})
+    if env:
+        tool.requirements[0]['env'] = env
+    return tool
+
+
+class TestCondaEnvs(unittest.TestCase):
+    def setUp(self):
+        ConfigAccess.instance(os.path.join('tests', 'config.json'))
+        self.conda_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.conda_dir, 'envs', 'existing'))
+        open(os.path.join(self.conda_dir, 'envs', 'existing',
+                          CondaRunnerService.READY_MARKER), 'w').close()
+        self.service = CondaRunnerService()
+        self.service.conda_dir = self.conda_dir
+        self.created = []
+        self.fail = False
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self.conda_dir)
+
+    def fake_run(self, args, **kwargs):
+        env_name = args.split(' -n ')[1].split(' ')[0]
+        with self.lock:
+            self.created.append(env_name)
+        time.sleep(0.05)
+        # conda creates the env directory before the packages are installed
+        os.makedirs(os.path.join(self.conda_dir, 'envs', env_name))
+        if self.fail:
+            raise subprocess.CalledProcessError(1, args)
+        return subprocess.CompletedProcess(args, 0)
+
+    def test_registry(self):
+        with mock.patch('os.listdir', wraps=os.listdir) as listdir:
+            for _ in range(3):
+                self.service.set_up(create_tool('existing'), 1)
+            self.assertEqual(listdir.call_count, 1)
+
+    def test_concurrent_install(self):
+        with mock.patch('subprocess.run', self.fake_run):
+            threads = [threading.Thread(target=self.service.set_up,
+                                        args=(create_tool('newtool'), i))
+                       for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.created, ['newtool'])
+        self.assertIn('newtool', self.service._env_registry())
+
+    def test_incomplete_env(self):
+        self.fail = True
+        with mock.patch('subprocess.run', self.fake_run):
+            with self.assertRaises(RunnerExecError):
+                self.service.set_up(create_tool('newtool'), 1)
+            self.assertNotIn('newtool', self.service._env_registry())
+            self.fail = False
+            self.service.set_up(create_tool('newtool'), 1)
+        self.assertEqual(self.created, ['newtool', 'newtool'])
+        self.assertIn('newtool', self.service._env_registry())
+
+    def test_provision(self):
+        tools = [create_tool('tool1'), create_tool('tool2', env='shared'),
+                 create_tool('tool3', env='shared'), create_tool('existing')]
+        with mock.patch('subprocess.run', self.fake_run):
+            results = self.service.provision(tools, max_workers=3)
+        self.assertEqual(results, {'tool1': '', 'shared': '', 'existing': ''})
+        self.assertEqual(sorted(self.created), ['shared', 'tool1'])
+
+
+class TestCondaCommand(unittest.TestCase):
+    def test_quoted_args(self):
+        value = 'my image $HOME `id` "quoted" \'single\'.tif'
+        worker = ShellWorker()
+        try:
+            lines = []
+            worker.run(CondaRunnerService._command(['printf', '%s\\n', value, 'b']),
+                       lines.append)
+        finally:
+            worker.close()
+        self.assertEqual(lines, [value, 'b'])
@@ -0,0 +1,136 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+from unittest import mock
+
+from bioimageit_core.core.config import ConfigAccess
+from bioimageit_core.core.exceptions import RunnerExecError
+from bioimageit_core.containers import Tool
+from bioimageit_core.plugins.runner_docker import DockerRunnerService
+
+run = subprocess.run
+
+
+class FakeDocker:
+    """Record the docker commands and run the exec commands locally
+
+    The local images and the registry map each image to its digest
+
+    """
+    def __init__(self, working_dir):
+        self.working_dir = working_dir
+        self.registry = {'bioimageit/echo:1.0': 'sha256:01'}
+        self.local_images = dict()
+        self.running = set()
+        self.commands = []
+
+    def __call__(self, args, **kwargs):
+        self.commands.append(args[1:])
+        returncode, stdout = 0, ''
+        if args[1:3] == ['image', 'inspect']:
+            returncode = 0 if args[-1] in self.local_images else 1
+            stdout = json.dumps([f'bioimageit/echo@{self.local_images.get(args[-1])}'])
+        elif args[1] == 'buildx':
+            stdout = json.dumps({'digest': self.registry[args[-1]]})
+        elif args[1] == 'pull':
+            self.local_images[args[2]] = self.registry[args[2]]
+        elif args[1] == 'run':
+            self.running.add(args[3])
+        elif args[1] == 'inspect':
+            stdout = 'true\n' if args[-1] in self.running else 'false\n'
+        elif args[1] == 'stop':
+            self.running.discard(args[2])
+        elif args[1] == 'rm':
+            self.running.discard(args[-1])
+        elif args[1] == 'exec':
+            command = [arg.replace('/app/data/', self.working_dir + '/') for arg in args[3:]]
+            completed = run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            universal_newlines=True)
+            returncode, stdout = completed.returncode, completed.stdout
+        return subprocess.CompletedProcess(args, returncode, stdout)
+
+
+class TestDockerRunner(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.config = ConfigAccess.instance(os.path.join('tests', 'config.json')).config
+        self.runner_config = self.config['runner']
+        self.config['runner'] = {'service': 'DOCKER', 'working_dir': self.working_dir}
+        self.tool = Tool()
+        self.tool.name = 'echo'
+        self.tool.requirements.append({'origin': 'container', 'type': 'docker',
+                                       'uri': 'bioimageit/echo:1.0'})
+        self.docker = FakeDocker(self.working_dir)
+        self.patch = mock.patch('subprocess.run', self.docker)
+        self.patch.start()
+        self.service = DockerRunnerService()
+
+    def tearDown(self):
+        self.service.close()
+        self.patch.stop()
+        self.config['runner'] = self.runner_config
+        shutil.rmtree(self.working_dir)
+
+    def _count(self, command):
+        return len([args for args in self.docker.commands if args[0] == command])
+
+    def test_reuse_container(self):
+        for job_id in range(3):
+            self.service.set_up(self.tool, job_id)
+            self.service.exec(self.tool, ['echo', 'hello'], job_id)
+            self.service.tear_down(self.tool, job_id)
+        self.assertEqual(self._count('pull'), 1)
+        self.assertEqual(self._count('run'), 1)
+        self.assertEqual(self._count('stop'), 0)
+        self.service.close()
+        self.assertEqual(self._count('stop'), 1)
+
+    def test_local_image_not_pulled(self):
+        self.docker.local_images['bioimageit/echo:1.0'] = 'sha256:01'
+        self.service.set_up(self.tool, 1)
+        self.assertEqual(self._count('pull'), 0)
+        self.service.pull = 'always'
+        self.service.close()
+        self.service.set_up(self.tool, 1)
+        self.assertEqual(self._count('pull'), 1)
+
+    def test_moved_tag_pulled(self):
+        self.docker.local_images['bioimageit/echo:1.0'] = 'sha256:00'
+        self.service.set_up(self.tool, 1)
+        self.assertEqual(self._count('pull'), 1)
+        self.assertEqual(self.docker.local_images['bioimageit/echo:1.0'], 'sha256:01')
+
+    def test_stopped_container_removed(self):
+        self.service.set_up(self.tool, 1)
+        self.service.tear_down(self.tool, 1)
+        stopped = self.service._container_name(self.tool)
+        self.docker.running.discard(stopped)
+        self.service.set_up(self.tool, 2)
+        self.assertIn(['rm', '-f', stopped], self.docker.commands)
+        self.assertNotEqual(self.service._container_name(self.tool), stopped)
+
+    def test_exec_error(self):
+        self.service.set_up(self.tool, 1)
+        with self.assertRaises(RunnerExecError) as context:
+            self.service.exec(self.tool, ['sh', '-c', 'echo broken; exit 3'], 1)
+        self.assertIn('broken', str(context.exception))
+        self.assertIn('return code: 3', str(context.exception))
+
+    def test_exec_batch(self):
+        self.service.set_up(self.tool, 1)
+        errors = self.service.exec_batch(self.tool, [['echo', 'a b'],
+                                                     ['sh', '-c', 'echo failed; exit 2'],
+                                                     ['echo', 'c']], 1)
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], RunnerExecError)
+        self.assertIn('failed', str(errors[1]))
+        self.assertIsNone(errors[2])
+        self.assertEqual(self._count('exec'), 1)
+        self.assertEqual(os.listdir(self.working_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
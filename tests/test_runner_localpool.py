@@ -0,0 +1,112 @@
+import unittest
+import sys
+import time
+import threading
+import types
+from unittest import mock
+
+from bioimageit_core.core.exceptions import RunnerExecError
+from bioimageit_core.containers import Tool
+from bioimageit_core.plugins import runner_localpool
+from bioimageit_core.plugins.runner_localpool import (ResourceSlots,
+                                                      LocalPoolRunnerService)
+
+
+class TestResourceSlots(unittest.TestCase):
+    def test_bounded(self):
+        slots = ResourceSlots(4, 1000)
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def command():
+            slots.acquire(1, 400)
+            with lock:
+                running.append(1)
+                max_running.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+            slots.release(1, 400)
+
+        threads = [threading.Thread(target=command) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # the memory allows only 2 commands at a time
+        self.assertEqual(max(max_running), 2)
+        self.assertEqual(slots.free_cpus, 4)
+        self.assertEqual(slots.free_memory, 1000)
+
+    def test_larger_than_total(self):
+        slots = ResourceSlots(2)
+        slots.acquire(8, 100)
+        self.assertEqual(slots.free_cpus, 0)
+        slots.release(8, 100)
+        self.assertEqual(slots.free_cpus, 2)
+
+
+class TestLocalPoolRunner(unittest.TestCase):
+    def setUp(self):
+        self.tool = Tool()
+        self.messages = []
+        self.service = LocalPoolRunnerService(cpu_slots=2)
+        self.service.add_observer(self)
+
+    def notify(self, message, job_id=0):
+        self.messages.append(message)
+
+    def test_stats(self):
+        self.service.set_up(self.tool, 1)
+        self.service.exec(self.tool, [sys.executable, '-c', 'print("hello")'], 1)
+        self.service.exec(self.tool, [sys.executable, '-c', 'x = bytearray(50 * 1024 ** 2)'], 1)
+        self.service.tear_down(self.tool, 1)
+        self.assertIn('hello', self.messages)
+        stats = self.service.stats[1]
+        self.assertEqual(len(stats), 2)
+        self.assertGreater(stats[0].wall_time, 0)
+        if stats[1].max_rss is not None:
+            self.assertGreater(stats[1].max_rss, 50 * 1024 ** 2)
+        total = self.service.job_stats(1)
+        self.assertAlmostEqual(total.wall_time, stats[0].wall_time + stats[1].wall_time)
+        self.assertTrue(self.messages[-1].startswith('resources used by 2 commands'))
+
+    def test_error(self):
+        with self.assertRaises(RunnerExecError) as context:
+            self.service.exec(self.tool, [sys.executable, '-c', 'exit(3)'], 1)
+        self.assertIn('return code: 3', str(context.exception))
+        self.assertEqual(self.service.slots.free_cpus, 2)
+
+    def test_timeout(self):
+        self.service.timeout = 0.2
+        start = time.perf_counter()
+        with self.assertRaises(RunnerExecError) as context:
+            self.service.exec(self.tool, [sys.executable, '-c', 'import time; time.sleep(10)'], 1)
+        self.assertIn('timeout', str(context.exception))
+        self.assertLess(time.perf_counter() - start, 5)
+
+    @unittest.skipIf(sys.platform == 'win32', 'no resource limits on Windows')
+    def test_memory_limit(self):
+        self.service.command_memory = 200 * 1024 ** 2
+        with self.assertRaises(RunnerExecError):
+            self.service.exec(self.tool, [sys.executable, '-c',
+                                          'x = bytearray(400 * 1024 ** 2)'], 1)
+
+    @unittest.skipIf(sys.platform == 'win32', 'no resource limits on Windows')
+    def test_memory_limit_without_prlimit(self):
+        resource = runner_localpool.resource
+        no_prlimit = types.SimpleNamespace(RLIMIT_AS=resource.RLIMIT_AS,
+                                           RLIMIT_CPU=resource.RLIMIT_CPU)
+        self.service.command_memory = 200 * 1024 ** 2
+        with mock.patch.object(runner_localpool, 'resource', no_prlimit):
+            self.assertEqual(self.service._command(['cmd'])[:2], ['/bin/sh', '-c'])
+            with self.assertRaises(RunnerExecError):
+                self.service.exec(self.tool, [sys.executable, '-c',
+                                              'x = bytearray(400 * 1024 ** 2)'], 1)
+            self.service.exec(self.tool, [sys.executable, '-c', 'print("small")'], 1)
+        self.assertIn('small', self.messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import os
+import threading
+
+from bioimageit_core.core.exceptions import RunnerExecError
+from bioimageit_core.core.shell_worker import ShellWorker, ShellWorkerPool
+
+
+class TestShellWorker(unittest.TestCase):
+    def setUp(self):
+        self.worker = ShellWorker('MESSAGE=initialized')
+
+    def tearDown(self):
+        self.worker.close()
+
+    def test_run(self):
+        lines = []
+        self.assertEqual(self.worker.run('echo $MESSAGE; printf "no newline"', lines.append), 0)
+        self.assertEqual(lines, ['initialized', 'no newline'])
+        lines = []
+        self.assertEqual(self.worker.run('echo error >&2; false', lines.append), 1)
+        self.assertEqual(lines, ['error'])
+
+    def test_stdin_not_read(self):
+        self.assertEqual(self.worker.run('cat'), 0)
+        lines = []
+        self.assertEqual(self.worker.run('echo next', lines.append), 0)
+        self.assertEqual(lines, ['next'])
+
+    def test_state_not_kept(self):
+        self.assertEqual(self.worker.run('cd /; export MESSAGE=changed; set -e'), 0)
+        self.assertEqual(self.worker.run('exit 3'), 3)
+        self.assertTrue(self.worker.is_alive())
+        lines = []
+        self.assertEqual(self.worker.run('false; echo $MESSAGE $PWD', lines.append), 0)
+        self.assertEqual(lines, [f'initialized {os.getcwd()}'])
+
+    def test_init_error(self):
+        with self.assertRaises(RunnerExecError):
+            ShellWorker('false')
+
+
+class TestShellWorkerPool(unittest.TestCase):
+    def test_parallel(self):
+        pool = ShellWorkerPool()
+        results = []
+
+        def run(i):
+            lines = []
+            pool.run(f'sleep 0.1; echo {i}', lines.append)
+            results.append(lines)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [['0'], ['1'], ['2']])
+        self.assertEqual(len(pool), 3)
+        pool.run('true')
+        self.assertEqual(len(pool), 3)
+        pool.close()
+        self.assertEqual(len(pool), 0)
@@ -0,0 +1,67 @@
+import unittest
+
+from bioimageit_core.containers import ToolIndexContainer
+from bioimageit_core.core.tool_search import ToolSearchIndex, tokenize
+
+
+def create_index(id_, name, categories, description='', version='1.0'):
+    info = ToolIndexContainer()
+    info.id = id_
+    info.name = name
+    info.version = version
+    info.categories = categories
+    info.description = description
+    info.uri = f'/tools/{id_}.xml'
+    return info
+
+
+class TestToolSearch(unittest.TestCase):
+    def setUp(self):
+        tools = [create_index('spitfiredeconv2d', 'SPITFIR(e) deconvolution 2D', ['Deconvolution'],
+                              'Deconvolution of 2D images with the SPITFIR(e) method'),
+                 create_index('spitfiredenoise2d', 'SPITFIR(e) denoising 2D', ['Denoising'],
+                              'Denoise a 2D image'),
+                 create_index('wiener2d', 'Wiener 2D', ['Deconvolution'],
+                              'Wiener deconvolution filter'),
+                 create_index('threshold', 'Otsu threshold', ['Segmentation'],
+                              'Automatic threshold of an image')]
+        self.index = ToolSearchIndex({tool.id + '_v' + tool.version: tool for tool in tools})
+
+    def _ids(self, query, limit=0):
+        return [tool.id for tool in self.index.search(query, limit)]
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('SPITFIR(e) deconv-2D'), ['spitfir', 'e', 'deconv', '2d'])
+
+    def test_ranking(self):
+        # a name match ranks before a description match
+        self.assertEqual(self._ids('wiener'), ['wiener2d'])
+        self.assertEqual(self._ids('deconvolution'),
+                         ['spitfiredeconv2d', 'wiener2d'])
+        self.assertEqual(self._ids('deconvolution', limit=1), ['spitfiredeconv2d'])
+
+    def test_all_words(self):
+        self.assertEqual(self._ids('spitfir denoising'), ['spitfiredenoise2d'])
+        self.assertEqual(self._ids('otsu wiener'), [])
+
+    def test_prefix_and_fuzzy(self):
+        self.assertEqual(self._ids('thresh'), ['threshold'])
+        self.assertEqual(self._ids('treshold'), ['threshold'])
+        self.assertEqual(self._ids('wiemer'), ['wiener2d'])
+
+    def test_substring(self):
+        # the previous search matched a substring of the full name
+        self.assertEqual(self._ids('fireden'), ['spitfiredenoise2d'])
+
+    def test_empty_query(self):
+        self.assertEqual(len(self._ids('')), 4)
+
+    def test_categories(self):
+        self.assertEqual([tool.id for tool in self.index.category_tools('Deconvolution')],
+                         ['spitfiredeconv2d', 'wiener2d'])
+        self.assertEqual(self.index.category_tools('Tracking'), [])
+        self.assertEqual(self._ids('segmentation'), ['threshold'])
+
+
+if __name__ == '__main__':
+    unittest.main()
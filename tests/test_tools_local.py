@@ -0,0 +1,168 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+from bioimageit_core.plugins.tools_local import LocalToolsService, ToolParser
+
+TOOL_XML = """<tool id="{name}" name="{name}" version="{version}" type="sequential">
+    <description>Test tool</description>
+    <requirements>
+        <package type="conda">{name}</package>
+    </requirements>
+    <command>{name} -i ${{i}} -o ${{o}}</command>
+    <inputs>
+        <param name="i" type="data" format="imagetiff" label="Input image"/>
+    </inputs>
+    <outputs>
+        <data name="o" format="imagetiff" label="Output image"/>
+    </outputs>
+    <help>Help of {name}</help>
+</tool>
+"""
+
+
+def write_tool(tools_dir, name, version='1.0', categories=None):
+    tool_dir = os.path.join(tools_dir, name)
+    os.makedirs(tool_dir, exist_ok=True)
+    with open(os.path.join(tool_dir, f'{name}.xml'), 'w') as file:
+        file.write(TOOL_XML.format(name=name, version=version))
+    if categories is not None:
+        with open(os.path.join(tool_dir, '.shed.yml'), 'w') as file:
+            file.write('categories:\n' + ''.join(f'  - {c}\n' for c in categories))
+
+
+class TestToolsIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tools_dir = os.path.join(self.tmp_dir, 'tools')
+        self.categories = os.path.join(self.tmp_dir, 'toolboxes.json')
+        shutil.copyfile(os.path.join('tests', 'toolboxes.json'), self.categories)
+        for name in ['denoise', 'threshold', 'measure']:
+            write_tool(self.tools_dir, name, categories=['Denoising'])
+        self.index_file = os.path.join(self.tmp_dir, LocalToolsService.INDEX_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _load(self, rebuild_index=False):
+        service = LocalToolsService()
+        service.xml_dirs = [self.tools_dir]
+        service.categories_json = self.categories
+        with mock.patch.object(ToolParser, 'parse_main_info', autospec=True,
+                               side_effect=ToolParser.parse_main_info) as parse:
+            service.load(rebuild_index)
+        return service, parse.call_count
+
+    def test_index(self):
+        service, count = self._load()
+        self.assertEqual(count, 3)
+        self.assertTrue(os.path.isfile(self.index_file))
+        self.assertEqual(sorted(service.database), ['denoise_v1.0', 'measure_v1.0',
+                                                    'threshold_v1.0'])
+
+        cached, count = self._load()
+        self.assertEqual(count, 0)
+        self.assertEqual({name: info.to_dict() for name, info in cached.database.items()},
+                         {name: info.to_dict() for name, info in service.database.items()})
+        self.assertEqual(cached.get_category_tools('Denoising')[0].help, 'Helpofdenoise')
+
+        _, count = self._load(rebuild_index=True)
+        self.assertEqual(count, 3)
+
+    def test_changed_files(self):
+        self._load()
+        write_tool(self.tools_dir, 'threshold', version='1.1')
+        write_tool(self.tools_dir, 'segment')
+        write_tool(self.tools_dir, 'measure', categories=['Detection'])
+        shutil.rmtree(os.path.join(self.tools_dir, 'denoise'))
+        service, count = self._load()
+        self.assertEqual(count, 3)
+        self.assertEqual(sorted(service.database), ['measure_v1.0', 'segment_v1.0',
+                                                    'threshold_v1.1'])
+        self.assertEqual(service.database['measure_v1.0'].categories, ['Detection'])
+        with open(self.index_file) as file:
+            self.assertEqual(len(json.load(file)['tools']), 3)
+
+    def test_corrupted_index(self):
+        with open(self.index_file, 'w') as file:
+            file.write('{')
+        service, count = self._load()
+        self.assertEqual(count, 3)
+        self.assertEqual(len(service.database), 3)
+
+
+    def test_parallel_parse(self):
+        for i in range(20):
+            write_tool(self.tools_dir, f'tool{i:02d}')
+        # same id and version as denoise, in a directory parsed after it
+        write_tool(os.path.join(self.tools_dir, 'zcopy'), 'denoise')
+        sequential, _ = self._load(rebuild_index=True)
+        service = LocalToolsService(parse_workers=4)
+        service.xml_dirs = [self.tools_dir]
+        service.categories_json = self.categories
+        service.load(rebuild_index=True)
+        self.assertEqual(list(service.database), list(sequential.database))
+        self.assertEqual(len(service.database), 23)
+        self.assertEqual(service.database['denoise_v1.0'].uri,
+                         os.path.join(self.tools_dir, 'denoise', 'denoise.xml'))
+        self.assertEqual(service.conflicts['denoise_v1.0'][1],
+                         os.path.join(self.tools_dir, 'zcopy', 'denoise', 'denoise.xml'))
+        self.assertEqual(len(service.parse_timings), 24)
+
+        cached, _ = self._load()
+        self.assertEqual(cached.parse_timings, {})
+        self.assertEqual(len(cached.conflicts), 1)
+
+
+class TestGetTool(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        write_tool(self.tmp_dir, 'denoise')
+        self.service = LocalToolsService()
+        self.service.xml_dirs = [self.tmp_dir]
+        self.service._load_database()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache(self):
+        with mock.patch.object(ToolParser, 'parse', autospec=True,
+                               side_effect=ToolParser.parse) as parse:
+            tool1 = self.service.get_tool('denoise_v1.0')
+            tool2 = self.service.get_tool('denoise_v1.0')
+        self.assertEqual(parse.call_count, 1)
+        self.assertIsNot(tool1, tool2)
+        tool1.inputs[0].value = 'image.tif'
+        tool1.requirements.append({'origin': 'container'})
+        tool3 = self.service.get_tool('denoise_v1.0')
+        self.assertEqual(tool3.inputs[0].value, '')
+        self.assertEqual(len(tool3.requirements), 1)
+
+    def test_modified_file(self):
+        tool1 = self.service.get_tool('denoise_v1.0')
+        xml_file = tool1.uri
+        with open(xml_file) as file:
+            content = file.read()
+        with open(xml_file, 'w') as file:
+            file.write(content.replace('Test tool', 'Modified tool'))
+        stat = os.stat(xml_file)
+        os.utime(xml_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.service.get_tool('denoise_v1.0').description, 'Modified tool')
+
+    def test_modified_shed_file(self):
+        write_tool(self.tmp_dir, 'denoise', categories=['Denoising'])
+        self.assertEqual(self.service.get_tool('denoise_v1.0').categories, ['Denoising'])
+        shed_file = os.path.join(self.tmp_dir, 'denoise', '.shed.yml')
+        with open(shed_file, 'a') as file:
+            file.write('  - Restoration\n')
+        stat = os.stat(shed_file)
+        os.utime(shed_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.service.get_tool('denoise_v1.0').categories,
+                         ['Denoising', 'Restoration'])
+
+
+if __name__ == '__main__':
+    unittest.main()